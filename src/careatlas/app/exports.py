@@ -0,0 +1,496 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import base64
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from importlib.metadata import version
+from starlette.staticfiles import StaticFiles
+
+from careatlas.app.search import notebook_slug
+
+logger = logging.getLogger(__name__)
+
+# Read from package metadata so the host does not import marimo for it
+MARIMO_VERSION = version("marimo")
+
+EXPORT_DIR = Path(os.getenv("CAREATLAS_EXPORT_DIR", Path(tempfile.gettempdir()) / "careatlas-exports"))
+# Hard limit for a single headless run of a notebook
+EXPORT_TIMEOUT = int(os.getenv("CAREATLAS_EXPORT_TIMEOUT", "300"))
+EXPORT_WORKERS = int(os.getenv("CAREATLAS_EXPORT_WORKERS", "1"))
+# Background jobs wait while the 1-minute load per core is above this
+EXPORT_MAX_LOAD = float(os.getenv("CAREATLAS_EXPORT_MAX_LOAD", "0.75"))
+# Exports run at lower CPU priority than the interactive kernels
+EXPORT_NICENESS = 10
+
+# Lower runs first: someone is waiting on a snapshot, previews can wait
+PRIORITIES = {"html": 0, "wasm": 1, "preview": 2}
+
+# Top-level imports that cannot run under Pyodide: server-side packages,
+# native extensions without Pyodide wheels, and stdlib modules that need
+# processes or raw sockets.
+WASM_INCOMPATIBLE = {
+    "careatlas", "git", "psutil", "httpx", "uvicorn", "fastapi", "starlette", "nicegui",
+    "lonboard", "rasterio", "fiona", "osgeo", "psycopg2", "torch", "tensorflow",
+    "subprocess", "multiprocessing", "concurrent",
+}
+
+# (path, mtime, size) -> digest, so serving a snapshot does not re-hash the file
+_digests: Dict[Tuple[str, float, int], str] = {}
+_digests_lock = threading.Lock()
+
+
+def notebook_digest(path) -> str:
+    """
+    Content hash of a notebook. The marimo version is part of the hash because
+    the exported HTML embeds its frontend.
+    """
+    path = str(path)
+    st = os.stat(path)
+    key = (path, st.st_mtime, st.st_size)
+    if key in _digests:
+        return _digests[key]
+
+    h = hashlib.sha256(MARIMO_VERSION.encode())
+    with open(path, "rb") as f:
+        h.update(f.read())
+    digest = h.hexdigest()[:32]
+
+    with _digests_lock:
+        # Drop digests of previous versions of the same file
+        for k in [k for k in _digests if k[0] == path]:
+            del _digests[k]
+        _digests[key] = digest
+    return digest
+
+
+def wasm_blockers(meta) -> List[str]:
+    """
+    Reasons a notebook cannot be exported to WASM; empty when eligible.
+    Notebooks must opt in with `wasm = true` under `[tool.careatlas]` in
+    their PEP 723 header.
+    """
+    blockers = []
+    if meta is None or meta.error:
+        return ["metadata unavailable"]
+    if not meta.wasm:
+        blockers.append("not opted in ([tool.careatlas] wasm = true)")
+    blockers.extend(f"imports {name}" for name in meta.imports if name in WASM_INCOMPATIBLE)
+    return blockers
+
+
+def snapshot_banner(slug: str) -> str:
+    """Floating link injected into snapshots so viewers can opt into a live kernel."""
+    return f"""
+    <a href="/apps/{slug}" title="Start a live session of this notebook"
+       style="position:fixed; right:24px; bottom:24px; z-index:9999; background:#006db0; color:white;
+              padding:10px 18px; font-family:system-ui,-apple-system,'Segoe UI',Roboto,sans-serif;
+              font-size:13px; font-weight:700; letter-spacing:0.08em; text-transform:uppercase;
+              text-decoration:none; box-shadow:0 10px 20px rgba(0,0,0,0.15);">
+        Static snapshot &middot; Make interactive
+    </a>
+    """
+
+
+def pending_page(slug: str, retry_after: int = 5) -> str:
+    """Shown while the first snapshot of a notebook is still rendering."""
+    return f"""<!doctype html>
+<html>
+  <head>
+    <meta http-equiv="refresh" content="{retry_after}">
+    <title>Rendering {slug}</title>
+  </head>
+  <body style="font-family:system-ui,-apple-system,'Segoe UI',Roboto,sans-serif; background:#f7f7f7;
+               display:flex; align-items:center; justify-content:center; height:100vh; margin:0;">
+    <div style="background:white; padding:48px; border-top:4px solid #006db0; max-width:480px;">
+      <h2 style="margin-top:0;">Preparing {slug}</h2>
+      <p>A static view of this notebook is being rendered. This page refreshes automatically.</p>
+      <p><a href="/apps/{slug}" style="color:#006db0; font-weight:700;">Open the interactive app now</a></p>
+    </div>
+  </body>
+</html>"""
+
+
+class SnapshotStore:
+    """Exported artefacts on disk, addressed by notebook content hash."""
+
+    def __init__(self, root: Path = EXPORT_DIR):
+        self.root = Path(root)
+
+    def html_path(self, digest: str) -> Path:
+        return self.root / "html" / f"{digest}.html"
+
+    def get_html(self, digest: str) -> Optional[Path]:
+        p = self.html_path(digest)
+        return p if p.exists() else None
+
+    def wasm_dir(self, digest: str) -> Path:
+        return self.root / "wasm" / digest
+
+    def get_wasm(self, digest: str) -> Optional[Path]:
+        p = self.wasm_dir(digest)
+        return p if (p / "index.html").exists() else None
+
+    def preview_path(self, digest: str) -> Path:
+        return self.root / "previews" / f"{digest}.json"
+
+    def get_preview(self, digest: str) -> Optional[dict]:
+        p = self.preview_path(digest)
+        if not p.exists():
+            return None
+        try:
+            return json.loads(p.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def discard(self, kind: str, digest: str) -> None:
+        if kind == "html":
+            self.html_path(digest).unlink(missing_ok=True)
+        elif kind == "wasm":
+            shutil.rmtree(self.wasm_dir(digest), ignore_errors=True)
+        elif kind == "preview":
+            self.preview_path(digest).unlink(missing_ok=True)
+            (self.root / "previews" / f"{digest}.png").unlink(missing_ok=True)
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """Static files under content-hashed paths never change, so let browsers keep them."""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
+@dataclass
+class ExportJob:
+    kind: str
+    notebook_path: str
+    slug: str
+    digest: str
+    queued_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+
+    @property
+    def priority(self) -> int:
+        return PRIORITIES.get(self.kind, 9)
+
+    def describe(self) -> dict:
+        now = time.time()
+        return {
+            "kind": self.kind,
+            "slug": self.slug,
+            "digest": self.digest,
+            "waiting_s": round((self.started_at or now) - self.queued_at, 1),
+            "running_s": round(now - self.started_at, 1) if self.started_at else None,
+        }
+
+
+def _system_busy() -> bool:
+    """True while interactive work keeps the cores busy."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1) > EXPORT_MAX_LOAD
+    except OSError:
+        return False
+
+
+def _niced(*command: str) -> List[str]:
+    """
+    `command` under nice(1). The host is multi-threaded, so a preexec_fn
+    calling os.nice in the forked child could deadlock.
+    """
+    nice = shutil.which("nice")
+    return [nice, "-n", str(EXPORT_NICENESS), *command] if nice else list(command)
+
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def first_output(notebook: dict) -> Optional[dict]:
+    """
+    Picks the first displayable output of an executed ipynb: an image when
+    there is one, otherwise a short text excerpt.
+    """
+    text = None
+    for cell in notebook.get("cells", []):
+        for output in cell.get("outputs", []):
+            data = output.get("data", {})
+            if "image/png" in data:
+                return {"type": "image", "png": data["image/png"]}
+            if text is None:
+                for mime in ("text/markdown", "text/html", "text/plain"):
+                    if mime in data:
+                        raw = data[mime]
+                        raw = "".join(raw) if isinstance(raw, list) else str(raw)
+                        snippet = " ".join(_TAG_RE.sub(" ", raw).split())
+                        if snippet:
+                            text = snippet[:280]
+                            break
+    if text:
+        return {"type": "text", "text": text}
+    return None
+
+
+class ExportPipeline:
+    """
+    Bounded pool of workers that runs notebooks headlessly (`marimo export`)
+    and stores the result by content hash. Jobs for a (kind, notebook, digest)
+    that is already queued, running or exported are dropped. Background jobs
+    run niced and wait while the host is loaded, so they never compete with
+    interactive sessions. `status()` exposes the queue.
+    """
+
+    def __init__(self, notebooks_dir: str, store: Optional[SnapshotStore] = None, workers: int = EXPORT_WORKERS):
+        self.notebooks_dir = str(notebooks_dir)
+        self.store = store or SnapshotStore()
+        self.workers = max(1, workers)
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        # Set when a job is queued, so workers backing off a busy host look again
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks = []
+        self._seq = 0
+        self._pending: Dict[Tuple[str, str], ExportJob] = {}
+        self._running: Dict[int, ExportJob] = {}
+        self._stats = {"done": 0, "failed": 0}
+        # (kind, notebook path) -> digest of its current artefact, for pruning
+        self._latest: Dict[Tuple[str, str], str] = {}
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.PriorityQueue()
+        self._wakeup = asyncio.Event()
+        self.store.root.mkdir(parents=True, exist_ok=True)
+        (self.store.root / "wasm").mkdir(exist_ok=True)
+        (self.store.root / "previews").mkdir(exist_ok=True)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def submit(self, notebook_path, kind: str = "html") -> Optional[ExportJob]:
+        """Thread-safe; may be called from the watcher thread or the event loop."""
+        if self._loop is None:
+            return None
+        notebook_path = str(notebook_path)
+        try:
+            digest = notebook_digest(notebook_path)
+        except OSError:
+            return None
+        if self._is_done(kind, digest):
+            self._latest[(kind, notebook_path)] = digest
+            return None
+
+        job = ExportJob(
+            kind=kind,
+            notebook_path=notebook_path,
+            slug=notebook_slug(notebook_path, self.notebooks_dir),
+            digest=digest,
+        )
+        self._loop.call_soon_threadsafe(self._enqueue, job)
+        return job
+
+    def on_metadata(self, path: str, meta) -> None:
+        """`NotebookMetadataIndex` listener: re-export notebooks whose content changed."""
+        if meta is not None and not meta.error:
+            self.submit(path)
+            if not wasm_blockers(meta):
+                self.submit(path, kind="wasm")
+            self.submit(path, kind="preview")
+
+    def _is_done(self, kind: str, digest: str) -> bool:
+        if kind == "html":
+            return self.store.get_html(digest) is not None
+        if kind == "wasm":
+            return self.store.get_wasm(digest) is not None
+        if kind == "preview":
+            return self.store.preview_path(digest).exists()
+        return False
+
+    def latest_digest(self, notebook_path, kind: str) -> Optional[str]:
+        """Digest of the last finished artefact, which may trail the file on disk."""
+        return self._latest.get((kind, str(notebook_path)))
+
+    def preview_for(self, notebook_path) -> Optional[dict]:
+        digest = self.latest_digest(notebook_path, "preview")
+        return self.store.get_preview(digest) if digest else None
+
+    def status(self) -> dict:
+        """Snapshot of the pool for inspection (/api/exports)."""
+        running = list(self._running.values())
+        queued = sorted(
+            (job for job in self._pending.values() if job not in running),
+            key=lambda job: (job.priority, job.queued_at),
+        )
+        return {
+            "workers": self.workers,
+            "system_busy": _system_busy(),
+            "running": [job.describe() for job in running],
+            "queued": [job.describe() for job in queued],
+            **self._stats,
+        }
+
+    def _enqueue(self, job: ExportJob) -> None:
+        key = (job.kind, job.notebook_path)
+        current = self._pending.get(key)
+        if current and current.digest == job.digest:
+            return
+        self._pending[key] = job
+        self._seq += 1
+        self._queue.put_nowait((job.priority, self._seq, job))
+        self._wakeup.set()
+
+    async def _wait_for_work(self, timeout: float = 5) -> None:
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            item = await self._queue.get()
+            job = item[2]
+            key = (job.kind, job.notebook_path)
+            # Only snapshots somebody is waiting for may run on a loaded host.
+            # A background job goes back in the queue rather than holding the
+            # worker, so an html job queued meanwhile is picked up next.
+            if job.priority > 0 and self._pending.get(key) is job and _system_busy():
+                self._queue.put_nowait(item)
+                self._queue.task_done()
+                await self._wait_for_work()
+                continue
+            try:
+                # A newer version of the notebook was queued after this one
+                if self._pending.get(key) is not job:
+                    continue
+                job.started_at = time.time()
+                self._running[n] = job
+                await self._run(job)
+                self._stats["done"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats["failed"] += 1
+                logger.error(f"Export {job.kind} failed for {job.slug}: {e}")
+            finally:
+                self._running.pop(n, None)
+                if self._pending.get(key) is job:
+                    del self._pending[key]
+                self._queue.task_done()
+
+    async def _run(self, job: ExportJob) -> None:
+        if job.kind == "html":
+            await self._export_html(job)
+        elif job.kind == "wasm":
+            await self._export_wasm(job)
+        elif job.kind == "preview":
+            await self._export_preview(job)
+        else:
+            raise ValueError(f"Unknown export kind: {job.kind}")
+        self._mark_latest(job)
+
+    def _mark_latest(self, job: ExportJob) -> None:
+        key = (job.kind, job.notebook_path)
+        previous = self._latest.get(key)
+        if previous and previous != job.digest:
+            self.store.discard(job.kind, previous)
+        self._latest[key] = job.digest
+        logger.info(f"Export {job.kind} ready for {job.slug} ({job.digest})")
+
+    async def _marimo_export(self, job: ExportJob, *args: str) -> Tuple[int, str]:
+        """Runs `marimo export <args>` for the job's notebook; returns (returncode, stderr)."""
+        proc = await asyncio.create_subprocess_exec(
+            *_niced(sys.executable, "-m", "marimo", "export", *args),
+            cwd=os.path.dirname(job.notebook_path),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            _, err = await asyncio.wait_for(proc.communicate(), timeout=EXPORT_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            proc.kill()
+            await proc.wait()
+            raise
+        return proc.returncode, (err or b"").decode(errors="replace")
+
+    async def _export_html(self, job: ExportJob) -> None:
+        target = self.store.html_path(job.digest)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        workdir = Path(tempfile.mkdtemp(prefix="export-", dir=self.store.root))
+        try:
+            out = workdir / "index.html"
+            code, err = await self._marimo_export(
+                job, "html", job.notebook_path, "-o", str(out), "--no-include-code", "--no-sandbox", "-f"
+            )
+            if not out.exists():
+                raise RuntimeError(f"marimo exited with {code}: {err[-500:]}")
+            if code != 0:
+                # Cells that raise still produce a usable page
+                logger.warning(f"Export of {job.slug} finished with errors: {err[-500:]}")
+
+            html = out.read_text(encoding="utf-8")
+            html = html.replace("</body>", snapshot_banner(job.slug) + "</body>", 1)
+            out.write_text(html, encoding="utf-8")
+            os.replace(out, target)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    async def _export_wasm(self, job: ExportJob) -> None:
+        """
+        Builds a self-contained Pyodide bundle (index.html + frontend assets).
+        Nothing is executed here; the notebook runs in the viewer's browser.
+        """
+        target = self.store.wasm_dir(job.digest)
+        workdir = Path(tempfile.mkdtemp(prefix="export-", dir=self.store.root))
+        try:
+            out = workdir / "bundle"
+            code, err = await self._marimo_export(
+                job, "html-wasm", job.notebook_path, "-o", str(out), "--mode", "run", "--no-sandbox", "-f"
+            )
+            if code != 0 or not (out / "index.html").exists():
+                raise RuntimeError(f"marimo exited with {code}: {err[-500:]}")
+            shutil.rmtree(target, ignore_errors=True)
+            os.replace(out, target)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    async def _export_preview(self, job: ExportJob) -> None:
+        """
+        Executes the notebook into an ipynb and keeps its first output: a PNG
+        when the notebook draws one, otherwise a text excerpt for the card.
+        """
+        workdir = Path(tempfile.mkdtemp(prefix="export-", dir=self.store.root))
+        try:
+            out = workdir / "preview.ipynb"
+            code, err = await self._marimo_export(
+                job, "ipynb", job.notebook_path, "-o", str(out), "--include-outputs", "--no-sandbox", "-f"
+            )
+            if not out.exists():
+                raise RuntimeError(f"marimo exited with {code}: {err[-500:]}")
+            preview = first_output(json.loads(out.read_text(encoding="utf-8"))) or {"type": "none"}
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        if preview["type"] == "image":
+            png = self.store.root / "previews" / f"{job.digest}.png"
+            png.write_bytes(base64.b64decode(preview.pop("png")))
+            preview["url"] = f"/previews/{png.name}"
+        self.store.preview_path(job.digest).write_text(json.dumps(preview), encoding="utf-8")
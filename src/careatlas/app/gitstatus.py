@@ -0,0 +1,169 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import subprocess
+from typing import Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Commits and pushes don't touch the watched tree, so results also expire
+STATUS_MAX_AGE = float(os.getenv("CAREATLAS_GIT_STATUS_MAX_AGE", "30"))
+
+# Porcelain v2 index (X) letter -> what the badge says
+_INDEX_STATES = {"A": "added", "D": "deleted", "R": "renamed", "C": "renamed"}
+# marimo's session and cache files next to each notebook aren't changes anyone commits
+_EXCLUDE = ":(exclude,glob)**/__marimo__/**"
+
+
+class GitStatusCache:
+    """
+    One `git status --porcelain=v2` (plus one `git diff --name-only` for
+    unpushed commits) per refresh for a whole subtree, kept in dicts so
+    per-path "modified / untracked / ahead" questions are O(1).
+
+    Results are refreshed lazily on the next query after `invalidate()`
+    (wired to the notebook watcher) or after `max_age` seconds.
+    """
+
+    def __init__(self, path: str, upstream: Optional[str] = None, max_age: float = STATUS_MAX_AGE):
+        self.path = str(path)
+        self.upstream = upstream
+        self.max_age = max_age
+        self.toplevel: Optional[str] = None
+        # repo-relative path -> state ("modified", "untracked", "added", ...)
+        self._states: Dict[str, str] = {}
+        # repo-relative paths changed by commits not on the upstream yet
+        self._ahead: Set[str] = set()
+        # every directory containing one of the above
+        self._dirty_dirs: Set[str] = set()
+        self.ahead_count = 0
+        self.behind_count = 0
+        self._refreshed_at = 0.0
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def _git(self, *args: str) -> str:
+        return subprocess.run(
+            ["git", "-C", self.toplevel or self.path, *args],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+
+    def invalidate(self) -> None:
+        self._stale = True
+
+    def on_changes(self, changes) -> None:
+        """`NotebookWatcher` subscriber: any edit may change the status."""
+        self._stale = True
+
+    @property
+    def fresh(self) -> bool:
+        return not self._stale and time.time() - self._refreshed_at < self.max_age
+
+    def refresh(self) -> None:
+        if self.toplevel is None:
+            self.toplevel = self._git("rev-parse", "--show-toplevel").strip()
+        # Cleared first so edits during the subprocess mark it stale again
+        self._stale = False
+        scope = os.path.relpath(self.path, self.toplevel)
+        out = self._git("status", "--porcelain=v2", "--branch", "-z", "--untracked-files=all", "--", scope, _EXCLUDE)
+
+        states: Dict[str, str] = {}
+        ahead = behind = 0
+        records = iter(out.split("\0"))
+        for record in records:
+            if not record:
+                continue
+            kind = record[0]
+            if kind == "#":
+                if record.startswith("# branch.ab "):
+                    a, b = record.split()[2:4]
+                    ahead, behind = int(a), -int(b)
+            elif kind == "?":
+                states[record[2:]] = "untracked"
+            elif kind == "u":
+                states[record.split(" ", 10)[10]] = "conflict"
+            elif kind in "12":
+                fields = record.split(" ", 9 if kind == "2" else 8)
+                xy, path = fields[1], fields[-1]
+                states[path] = _INDEX_STATES.get(xy[0], "modified") if xy[1] == "." else "modified"
+                if kind == "2":
+                    next(records, None)  # the original path of the rename
+
+        ahead_paths: Set[str] = set()
+        upstream = self.upstream or "@{upstream}"
+        try:
+            diff = self._git("diff", "--name-only", "-z", f"{upstream}...HEAD", "--", scope, _EXCLUDE)
+            ahead_paths = {p for p in diff.split("\0") if p}
+        except subprocess.CalledProcessError:
+            # No upstream configured / fetched yet
+            pass
+
+        dirty_dirs: Set[str] = set()
+        for path in list(states) + list(ahead_paths):
+            parent = os.path.dirname(path)
+            while parent and parent not in dirty_dirs:
+                dirty_dirs.add(parent)
+                parent = os.path.dirname(parent)
+
+        with self._lock:
+            self._states, self._ahead, self._dirty_dirs = states, ahead_paths, dirty_dirs
+            self.ahead_count, self.behind_count = ahead, behind
+            self._refreshed_at = time.time()
+
+    def ensure_fresh(self) -> None:
+        if self.fresh:
+            return
+        try:
+            self.refresh()
+        except (subprocess.CalledProcessError, OSError) as e:
+            logger.warning(f"git status failed for {self.path}: {e}")
+
+    async def aensure_fresh(self) -> None:
+        """Refreshes off the event loop when needed."""
+        if not self.fresh:
+            await asyncio.to_thread(self.ensure_fresh)
+
+    def _rel(self, path: str) -> str:
+        if not os.path.isabs(path) or self.toplevel is None:
+            return str(path)
+        return os.path.relpath(os.path.realpath(path), self.toplevel)
+
+    # --- O(1) queries; `path` is absolute or relative to the repo root ---
+
+    def state(self, path: str) -> Optional[str]:
+        return self._states.get(self._rel(path))
+
+    def is_modified(self, path: str) -> bool:
+        return self._rel(path) in self._states
+
+    def is_untracked(self, path: str) -> bool:
+        return self._states.get(self._rel(path)) == "untracked"
+
+    def is_ahead(self, path: str) -> bool:
+        """Committed locally but not pushed."""
+        return self._rel(path) in self._ahead
+
+    def is_dirty_dir(self, path: str) -> bool:
+        return self._rel(path) in self._dirty_dirs
+
+    def badge(self, path: str) -> Optional[str]:
+        """The one label to show for a file: its working tree state, else 'unpushed'."""
+        rel = self._rel(path)
+        return self._states.get(rel) or ("unpushed" if rel in self._ahead else None)
+
+    def changed(self) -> Iterable[str]:
+        return sorted(set(self._states) | self._ahead)
+
+    def summary(self) -> dict:
+        return {
+            "modified": sum(1 for s in self._states.values() if s != "untracked"),
+            "untracked": sum(1 for s in self._states.values() if s == "untracked"),
+            "unpushed_files": len(self._ahead),
+            "ahead": self.ahead_count,
+            "behind": self.behind_count,
+            "age_s": round(time.time() - self._refreshed_at, 1) if self._refreshed_at else None,
+        }
@@ -0,0 +1,183 @@
+import os
+import re
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Set
+
+import git
+import marimo as mo
+
+from careatlas.app.worktrees import SYNC_BRANCH, GitLock
+
+logger = logging.getLogger(__name__)
+
+# Saves arriving within this window end up in the same commit and push
+SYNC_DEBOUNCE = float(os.getenv("CAREATLAS_SYNC_DEBOUNCE", "2"))
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 60.0
+
+# Failures worth retrying (network, and ref locks held by a parallel fetch
+# from another worktree); anything else (conflicts, auth) is reported at once
+NETWORK_ERROR_RE = re.compile(
+    r"could not resolve host|unable to access|connection (timed out|refused|reset)|"
+    r"operation timed out|early eof|remote end hung up|couldn't connect|failed to connect|"
+    r"http 5\d\d|rpc failed|cannot lock ref|unable to create .*\.lock",
+    re.IGNORECASE,
+)
+
+
+def is_network_error(e: Exception) -> bool:
+    text = f"{getattr(e, 'stderr', '')} {e}"
+    return bool(NETWORK_ERROR_RE.search(text))
+
+
+def rebase_in_progress(repo: git.Repo) -> bool:
+    git_dir = repo.git_dir
+    return os.path.isdir(os.path.join(git_dir, "rebase-merge")) or os.path.isdir(os.path.join(git_dir, "rebase-apply"))
+
+
+def _toast(title: str, description: str = "", kind: Optional[str] = None) -> None:
+    try:
+        mo.status.toast(title, description, kind=kind)
+    except Exception:
+        logger.info(f"{title} {description}")
+
+
+class SyncQueue:
+    """
+    Background git sync for a kernel. `request()` returns immediately; a
+    worker thread waits SYNC_DEBOUNCE seconds for more saves, then stages
+    everything that was requested in one commit and does a single
+    pull --rebase + push, retrying network failures with exponential backoff.
+    Progress is reported with toasts.
+
+    The worker is a `mo.Thread` started per burst, so it reports to the
+    frontend from the cell that triggered it and exits when the queue is empty.
+    """
+
+    def __init__(
+        self,
+        get_repo: Callable[[], Optional[git.Repo]],
+        identity: Callable[[], git.Actor],
+        auth_options: Callable[[], dict],
+        debounce: float = SYNC_DEBOUNCE,
+        dry_run: bool = False,
+        on_done: Optional[Callable[[], None]] = None,
+    ):
+        self._get_repo = get_repo
+        self._identity = identity
+        self._auth_options = auth_options
+        self.debounce = debounce
+        self.dry_run = dry_run
+        self._on_done = on_done
+        self._paths: Set[str] = set()
+        self._push = False
+        self._lock = threading.Lock()
+        # Held while git runs, so other operations (reset, the host's upstream
+        # fast-forward) don't interleave on the same index
+        self.git_lock = GitLock(self._git_dir)
+        self._worker: Optional[threading.Thread] = None
+        self.last_result: Dict[str, object] = {}
+
+    def request(self, path: str, push: bool = True) -> int:
+        """Queues `path` for the next sync; returns how many paths are waiting."""
+        with self._lock:
+            self._paths.add(os.path.abspath(path))
+            self._push = self._push or push
+            waiting = len(self._paths)
+            if self._worker is None or not self._worker.is_alive():
+                thread_cls = mo.Thread if mo.running_in_notebook() else threading.Thread
+                self._worker = thread_cls(target=self._drain, name="careatlas-git-sync", daemon=True)
+                self._worker.start()
+        return waiting
+
+    def _git_dir(self) -> Optional[str]:
+        repo = self._get_repo()
+        return repo.git_dir if repo is not None else None
+
+    @property
+    def pending(self) -> List[str]:
+        with self._lock:
+            return sorted(self._paths)
+
+    def _take(self):
+        with self._lock:
+            paths, push = sorted(self._paths), self._push
+            self._paths, self._push = set(), False
+            if not paths:
+                # Cleared under the lock so request() starts a new worker
+                self._worker = None
+            return paths, push
+
+    def _drain(self) -> None:
+        while True:
+            # Let the burst collect before touching the index
+            time.sleep(self.debounce)
+            paths, push = self._take()
+            if not paths:
+                return
+            try:
+                with self.git_lock:
+                    self._sync(paths, push)
+                if self._on_done:
+                    self._on_done()
+            except Exception as e:
+                logger.exception("Git sync failed")
+                self.last_result = {"ok": False, "error": str(e), "time": time.time()}
+                _toast("Sync failed", str(e), kind="danger")
+
+    def _commit(self, repo: git.Repo, paths: List[str]) -> bool:
+        """Stages `paths` and makes one commit; False when nothing changed."""
+        repo.index.add(paths, force=True)
+        if repo.head.is_valid() and not repo.index.diff("HEAD"):
+            return False
+        names = [os.path.basename(p) for p in paths]
+        subject = f"Auto-notebook: {', '.join(names[:3])}" + (f" (+{len(names) - 3} more)" if len(names) > 3 else "")
+        actor = self._identity()
+        repo.index.commit(subject, author=actor, committer=actor)
+        return True
+
+    def _pull_push(self, repo: git.Repo) -> None:
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                # Others' changes come down first and ours go on top
+                repo.git(**self._auth_options()).pull("--rebase", "origin", SYNC_BRANCH)
+                repo.git(**self._auth_options()).push("origin", f"HEAD:{SYNC_BRANCH}")
+                return
+            except git.exc.GitCommandError as e:
+                # A conflicting rebase must not stay half-applied in the worktree
+                if rebase_in_progress(repo):
+                    repo.git.rebase("--abort")
+                if attempt == MAX_ATTEMPTS or not is_network_error(e):
+                    raise
+                delay = min(BACKOFF_BASE ** attempt, BACKOFF_MAX)
+                logger.warning(f"Git sync attempt {attempt} failed, retrying in {delay:.0f}s: {e.stderr}")
+                _toast("Sync delayed", f"Network error, retrying in {delay:.0f}s")
+                time.sleep(delay)
+
+    def _sync(self, paths: List[str], push: bool) -> None:
+        repo = self._get_repo()
+        if not repo:
+            _toast("Repo not found", kind="danger")
+            return
+        label = os.path.basename(paths[0]) if len(paths) == 1 else f"{len(paths)} notebooks"
+        _toast(f"Syncing {label}…")
+
+        try:
+            committed = self.dry_run or self._commit(repo, paths)
+            if push and not self.dry_run:
+                self._pull_push(repo)
+        except git.exc.GitCommandError as gce:
+            self.last_result = {"ok": False, "error": gce.stderr, "time": time.time()}
+            _toast("Git Error", gce.stderr, kind="danger")
+            return
+
+        self.last_result = {"ok": True, "paths": paths, "pushed": push, "time": time.time()}
+        if push:
+            _toast(f"Synced: {label}", kind="success")
+        elif committed:
+            _toast(f"Staged & commited: {label}", kind="success")
+        else:
+            _toast(f"No changes in {label}")
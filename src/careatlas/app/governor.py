@@ -0,0 +1,288 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional, Set
+from urllib.parse import parse_qs
+
+import psutil
+from starlette.requests import Request
+from starlette.responses import HTMLResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+MAX_APP_SESSIONS = int(os.getenv("CAREATLAS_MAX_APP_SESSIONS", "20"))
+# Resident memory of the host process (run-mode kernels live in it) above
+# which no new sessions are admitted and idle ones are evicted
+APP_MEMORY_BUDGET = int(os.getenv("CAREATLAS_APP_MEMORY_BUDGET", str(6 * 1024**3)))
+# Never evict a session that saw user input more recently than this
+MIN_IDLE_SECONDS = int(os.getenv("CAREATLAS_APP_MIN_IDLE", "120"))
+# Admitted page loads hold a slot this long while their websocket connects
+RESERVATION_SECONDS = 30
+# Waiting visitors must refresh within this window to keep their place
+TICKET_SECONDS = 30
+TICKET_COOKIE = "apps_ticket"
+
+
+@dataclass
+class AppSession:
+    session_id: str
+    app_path: str
+    connected_at: float = field(default_factory=time.time)
+    last_activity: float = field(default_factory=time.time)
+    evicted: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def idle_for(self) -> float:
+        return time.time() - self.last_activity
+
+
+def waiting_page(position: int, retry_after: int = 5) -> str:
+    return f"""<!doctype html>
+<html>
+  <head>
+    <meta http-equiv="refresh" content="{retry_after}">
+    <title>CareAtlas is busy</title>
+  </head>
+  <body style="font-family:system-ui,-apple-system,'Segoe UI',Roboto,sans-serif; background:#f7f7f7;
+               display:flex; align-items:center; justify-content:center; height:100vh; margin:0;">
+    <div style="background:white; padding:48px; border-top:4px solid #E5243B; max-width:480px;">
+      <h2 style="margin-top:0;">All interactive sessions are in use</h2>
+      <p>You are number <b>{position}</b> in the queue. This page refreshes automatically
+         and opens the app as soon as a session frees up.</p>
+      <p><a href="/" style="color:#006db0; font-weight:700;">Back to the explorer</a></p>
+    </div>
+  </body>
+</html>"""
+
+
+class SessionGovernor:
+    """
+    ASGI wrapper around the /apps marimo runner. Every websocket is one
+    run-mode session; the governor caps how many exist at once and how much
+    memory they may use, evicts the least recently active one when a slot is
+    needed, and parks further visitors on an auto-refreshing waiting page.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        mount_point: str = "/apps",
+        max_sessions: int = MAX_APP_SESSIONS,
+        memory_budget: int = APP_MEMORY_BUDGET,
+        min_idle_seconds: int = MIN_IDLE_SECONDS,
+    ):
+        self.app = app
+        self.mount_point = mount_point
+        self.max_sessions = max_sessions
+        self.memory_budget = memory_budget
+        self.min_idle_seconds = min_idle_seconds
+        self._sessions: Dict[str, AppSession] = {}
+        self._evicted: Dict[str, float] = {}
+        self._reservations: Deque[float] = deque()
+        # ticket -> (issued_at, last_seen)
+        self._tickets: Dict[str, list] = {}
+        self._rss = 0
+        self._rss_at = 0.0
+        self._process = psutil.Process()
+
+    # --- accounting ---
+
+    def rss(self) -> int:
+        """Host RSS, sampled at most once a second."""
+        now = time.time()
+        if now - self._rss_at > 1:
+            try:
+                self._rss = self._process.memory_info().rss
+            except psutil.Error:
+                pass
+            self._rss_at = now
+        return self._rss
+
+    def over_budget(self) -> bool:
+        return self.rss() > self.memory_budget
+
+    def _expire(self) -> None:
+        now = time.time()
+        while self._reservations and now - self._reservations[0] > RESERVATION_SECONDS:
+            self._reservations.popleft()
+        for ticket in [t for t, (_, seen) in self._tickets.items() if now - seen > TICKET_SECONDS]:
+            del self._tickets[ticket]
+        for sid in [s for s, at in self._evicted.items() if now - at > 3600]:
+            del self._evicted[sid]
+
+    def free_slots(self) -> int:
+        if self.over_budget():
+            return 0
+        return self.max_sessions - len(self._sessions) - len(self._reservations)
+
+    def evict_lru(self) -> Optional[AppSession]:
+        """Disconnects the least recently active session that has been idle long enough."""
+        candidates = [s for s in self._sessions.values() if s.idle_for() >= self.min_idle_seconds]
+        if not candidates:
+            return None
+        victim = min(candidates, key=lambda s: s.last_activity)
+        self._sessions.pop(victim.session_id, None)
+        self._evicted[victim.session_id] = time.time()
+        victim.evicted.set()
+        logger.info(f"Evicted /apps session {victim.session_id} ({victim.app_path}), idle {victim.idle_for():.0f}s")
+        return victim
+
+    def _make_room(self) -> bool:
+        if self.free_slots() > 0:
+            return True
+        # Evicting frees a slot, but memory only returns after marimo's session TTL
+        return self.evict_lru() is not None and not self.over_budget()
+
+    def status(self) -> dict:
+        self._expire()
+        return {
+            "sessions": [
+                {"session_id": s.session_id, "app": s.app_path, "idle_s": round(s.idle_for())}
+                for s in sorted(self._sessions.values(), key=lambda s: s.last_activity)
+            ],
+            "max_sessions": self.max_sessions,
+            "reserved": len(self._reservations),
+            "waiting": len(self._tickets),
+            "rss": self.rss(),
+            "memory_budget": self.memory_budget,
+        }
+
+    async def maintain(self, interval: int = 15) -> None:
+        """Background task: while over the memory budget, evict one idle session per interval."""
+        while True:
+            await asyncio.sleep(interval)
+            self._expire()
+            if self.over_budget():
+                self.evict_lru()
+
+    # --- ASGI ---
+
+    def _app_path(self, scope: Scope) -> str:
+        path = scope.get("path", "")
+        if path.startswith(self.mount_point):
+            path = path[len(self.mount_point):]
+        return path.strip("/")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "websocket":
+            await self._websocket(scope, receive, send)
+        elif scope["type"] == "http" and self._is_page_load(scope):
+            await self._page(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    @staticmethod
+    def _is_page_load(scope: Scope) -> bool:
+        if scope.get("method") != "GET":
+            return False
+        for key, value in scope.get("headers", []):
+            if key == b"accept":
+                return b"text/html" in value
+        return False
+
+    async def _page(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Admits a page load or answers with the waiting page and a queue ticket."""
+        self._expire()
+        request = Request(scope)
+        ticket = request.cookies.get(TICKET_COOKIE)
+        if ticket not in self._tickets:
+            ticket = None
+
+        # Visitors already waiting go first
+        queue = sorted(self._tickets, key=lambda t: self._tickets[t][0])
+        ahead = queue.index(ticket) if ticket else len(queue)
+
+        if ahead < max(self.free_slots(), 0) or (ahead == 0 and self._make_room()):
+            if ticket:
+                del self._tickets[ticket]
+            self._reservations.append(time.time())
+
+            async def send_clearing_ticket(message):
+                if message["type"] == "http.response.start" and ticket:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"set-cookie", f"{TICKET_COOKIE}=; Path=/; Max-Age=0".encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_clearing_ticket)
+            return
+
+        now = time.time()
+        if ticket is None:
+            ticket = uuid.uuid4().hex
+            self._tickets[ticket] = [now, now]
+            ahead = len(queue)
+        else:
+            self._tickets[ticket][1] = now
+
+        response = HTMLResponse(
+            waiting_page(position=ahead + 1),
+            status_code=503,
+            headers={"Retry-After": "5", "Cache-Control": "no-store"},
+        )
+        response.set_cookie(TICKET_COOKIE, ticket, max_age=TICKET_SECONDS * 2, path="/", samesite="lax")
+        await response(scope, receive, send)
+
+    async def _websocket(self, scope: Scope, receive: Receive, send: Send) -> None:
+        query = parse_qs(scope.get("query_string", b"").decode())
+        session_id = (query.get("session_id") or [uuid.uuid4().hex])[0]
+        self._expire()
+
+        if session_id in self._evicted:
+            # The tab has to reload through the page gate to get a new slot
+            await send({"type": "websocket.close", "code": 4001, "reason": "Session evicted"})
+            return
+
+        # A reconnect of a live session keeps its slot
+        existing = self._sessions.get(session_id)
+        if existing is None:
+            if self._reservations:
+                self._reservations.popleft()
+            elif not self._make_room():
+                await send({"type": "websocket.close", "code": 1013, "reason": "Server busy"})
+                return
+        session = AppSession(session_id=session_id, app_path=self._app_path(scope))
+        if existing:
+            session.last_activity = existing.last_activity
+        self._sessions[session_id] = session
+
+        pending: Set[asyncio.Future] = set()
+
+        async def guarded_receive():
+            # Keep one outstanding receive so eviction can interrupt it
+            if not pending:
+                pending.add(asyncio.ensure_future(receive()))
+            evict_wait = asyncio.ensure_future(session.evicted.wait())
+            done, _ = await asyncio.wait(pending | {evict_wait}, return_when=asyncio.FIRST_COMPLETED)
+            if evict_wait not in done:
+                evict_wait.cancel()
+                message = pending.pop().result()
+                if message["type"] == "websocket.receive":
+                    session.last_activity = time.time()
+                return message
+
+            for fut in pending:
+                fut.cancel()
+            pending.clear()
+            try:
+                await send({"type": "websocket.close", "code": 4001, "reason": "Session evicted"})
+            except Exception:
+                pass
+            return {"type": "websocket.disconnect", "code": 1001}
+
+        async def guarded_send(message):
+            if session.evicted.is_set():
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, guarded_receive, guarded_send)
+        finally:
+            for fut in pending:
+                fut.cancel()
+            if self._sessions.get(session_id) is session:
+                del self._sessions[session_id]
@@ -0,0 +1,145 @@
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Union
+
+import httpx
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# How often the readiness checks run in the background
+CHECK_INTERVAL = int(os.getenv("CAREATLAS_HEALTH_INTERVAL", "10"))
+# A single check that takes longer than this counts as failed
+CHECK_TIMEOUT = 3.0
+# oauth2-proxy answers /ping without touching the identity provider. Only an
+# explicitly configured ping URL makes the auth proxy critical for readiness.
+AUTH_PING_EXPLICIT = bool(os.getenv("CAREATLAS_AUTH_PING_URL"))
+
+
+def _derive_auth_ping_url() -> Optional[str]:
+    """/ping on the same origin as AUTH_URL (the proxy serves it at its root)."""
+    auth_url = os.getenv("AUTH_URL")
+    if not auth_url:
+        return None
+    parsed = urlparse(auth_url)
+    if not parsed.scheme or not parsed.netloc:
+        return None
+    # Same rewrite as the auth checks in server.py: localhost is the browser's view
+    return f"{parsed.scheme}://{parsed.netloc.replace('localhost', 'auth-proxy')}/ping"
+
+
+AUTH_PING_URL = os.getenv("CAREATLAS_AUTH_PING_URL") or _derive_auth_ping_url()
+
+CheckResult = Tuple[bool, str]
+Check = Callable[[], Union[CheckResult, Awaitable[CheckResult]]]
+
+
+@dataclass
+class ComponentStatus:
+    name: str
+    critical: bool
+    ok: bool = False
+    detail: str = "not checked yet"
+    checked_at: float = 0.0
+    took_ms: float = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "ok": self.ok,
+            "critical": self.critical,
+            "detail": self.detail,
+            "age_s": round(time.time() - self.checked_at, 1) if self.checked_at else None,
+            "took_ms": self.took_ms,
+        }
+
+
+@dataclass
+class _Registered:
+    check: Check
+    status: ComponentStatus = field(init=False)
+
+
+class HealthMonitor:
+    """
+    Runs component checks on a background loop and keeps the last result of
+    each. Probes only read the cached results, so a probe never causes work
+    on the host however often it fires. Non-critical components are reported
+    but do not affect readiness.
+    """
+
+    def __init__(self, interval: int = CHECK_INTERVAL, timeout: float = CHECK_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        self._checks: Dict[str, _Registered] = {}
+        self.started_at = time.time()
+        self._last_round = 0.0
+
+    def register(self, name: str, check: Check, critical: bool = True) -> None:
+        reg = _Registered(check=check)
+        reg.status = ComponentStatus(name=name, critical=critical)
+        self._checks[name] = reg
+
+    async def _run_one(self, reg: _Registered) -> None:
+        start = time.perf_counter()
+        try:
+            result = reg.check()
+            if asyncio.iscoroutine(result):
+                result = await asyncio.wait_for(result, timeout=self.timeout)
+            ok, detail = result
+        except asyncio.TimeoutError:
+            ok, detail = False, f"timed out after {self.timeout:.0f}s"
+        except Exception as e:
+            ok, detail = False, f"{type(e).__name__}: {e}"
+        status = reg.status
+        if status.ok and not ok:
+            logger.warning(f"Readiness check {status.name} failed: {detail}")
+        status.ok, status.detail = bool(ok), detail
+        status.checked_at = time.time()
+        status.took_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    async def check_all(self) -> None:
+        await asyncio.gather(*(self._run_one(reg) for reg in self._checks.values()))
+        self._last_round = time.time()
+
+    async def run(self) -> None:
+        """Background task: refreshes every check once per interval."""
+        while True:
+            await self.check_all()
+            await asyncio.sleep(self.interval)
+
+    @property
+    def stale(self) -> bool:
+        # If the loop itself stopped, the cached results can't be trusted
+        return time.time() - self._last_round > max(3 * self.interval, 30)
+
+    @property
+    def is_ready(self) -> bool:
+        if self.stale:
+            return False
+        return all(reg.status.ok for reg in self._checks.values() if reg.status.critical)
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.is_ready,
+            "stale": self.stale,
+            "uptime_s": round(time.time() - self.started_at),
+            "components": {name: reg.status.as_dict() for name, reg in self._checks.items()},
+        }
+
+
+async def check_auth_proxy(url: Optional[str] = AUTH_PING_URL) -> CheckResult:
+    """The auth proxy is reachable and answers its ping endpoint."""
+    if not url:
+        return True, "no auth proxy configured"
+    async with httpx.AsyncClient(timeout=CHECK_TIMEOUT) as client:
+        response = await client.get(url)
+    return response.status_code < 500, f"{url} -> {response.status_code}"
+
+
+def check_directory(path: str) -> Callable[[], CheckResult]:
+    def check() -> CheckResult:
+        return os.path.isdir(path), path
+    return check
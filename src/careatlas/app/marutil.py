@@ -1,8 +1,15 @@
 from starlette.types import ASGIApp
-import marimo
 import ast
 import os
 import importlib.util
+import re
+import tomllib
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 from starlette.routing import Mount
 from starlette.staticfiles import StaticFiles
 from fastapi import Request
@@ -11,9 +18,13 @@ from starlette.middleware.base import BaseHTTPMiddleware
 
 
 
-def get_global_metadata(target):
+logger = logging.getLogger(__name__)
+
+
+def get_global_metadata(target) -> Optional[str]:
     """
-    Returns only the global (module-level) docstring and the source code.
+    Returns only the global (module-level) docstring, or None if the target
+    has none or cannot be read.
     """
     path = target
     
@@ -23,22 +34,416 @@ def get_global_metadata(target):
         if spec and spec.origin:
             path = spec.origin
         else:
-            return None, "Error: Target not found."
+            return None
+
+    meta = extract_metadata(path)
+    if meta.error:
+        logger.debug(f"Metadata extraction failed for {path}: {meta.error}")
+    return meta.docstring
+
+
+# --- Notebook metadata index ---
+
+# (path, mtime, size): cheap to obtain from a single os.stat and changes
+# whenever the file content is rewritten.
+NotebookKey = Tuple[str, float, int]
+
+
+@dataclass(frozen=True)
+class NotebookMetadata:
+    path: str
+    mtime: float
+    size: int
+    title: str
+    docstring: Optional[str] = None
+    generated_with: Optional[str] = None
+    width: Optional[str] = None
+    cells: int = 0
+    imports: Tuple[str, ...] = ()
+    markdown: Tuple[str, ...] = ()
+    # Opt-in for client-side (WASM) export, see `notebook_config`
+    wasm: bool = False
+    error: Optional[str] = None
+
+    @property
+    def key(self) -> NotebookKey:
+        return (self.path, self.mtime, self.size)
+
+
+def _title_from_path(path: str) -> str:
+    return Path(path).stem.replace('_', ' ')
+
+
+def _parse_app_call(node: ast.AST) -> Dict[str, str]:
+    """Collects string keyword arguments of `marimo.App(...)`."""
+    kwargs = {}
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "App":
+        for kw in node.keywords:
+            if kw.arg and isinstance(kw.value, ast.Constant) and isinstance(kw.value.value, str):
+                kwargs[kw.arg] = kw.value.value
+    return kwargs
+
+
+def _is_cell(node: ast.AST) -> bool:
+    """True for functions decorated with `@app.cell` / `@app.cell(...)`."""
+    if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        return False
+    for deco in node.decorator_list:
+        target = deco.func if isinstance(deco, ast.Call) else deco
+        if isinstance(target, ast.Attribute) and target.attr == "cell":
+            return True
+    return False
+
+
+def _markdown_text(node: ast.Call) -> Optional[str]:
+    """Literal text of a `mo.md(...)` call; f-string placeholders are dropped."""
+    if not (isinstance(node.func, ast.Attribute) and node.func.attr == "md" and node.args):
+        return None
+    arg = node.args[0]
+    if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+        return arg.value
+    if isinstance(arg, ast.JoinedStr):
+        return "".join(v.value for v in arg.values if isinstance(v, ast.Constant) and isinstance(v.value, str))
+    return None
+
+
+# PEP 723 inline script metadata; marimo keeps this header block when it
+# rewrites a notebook, unlike extra module-level statements.
+SCRIPT_METADATA_RE = re.compile(
+    r"(?m)^# /// (?P<type>[a-zA-Z0-9-]+)$\s(?P<content>(^#(| .*)$\s)+)^# ///$"
+)
+
+
+def notebook_config(source: str) -> dict:
+    """
+    The `[tool.careatlas]` table of a notebook's PEP 723 block, e.g.
+
+        # /// script
+        # [tool.careatlas]
+        # wasm = true
+        # ///
+    """
+    for match in SCRIPT_METADATA_RE.finditer(source):
+        if match.group("type") != "script":
+            continue
+        content = "".join(
+            line[2:] if line.startswith("# ") else line[1:]
+            for line in match.group("content").splitlines(keepends=True)
+        )
+        try:
+            return tomllib.loads(content).get("tool", {}).get("careatlas", {})
+        except tomllib.TOMLDecodeError:
+            return {}
+    return {}
+
+
+def extract_metadata(path: str, st: Optional[os.stat_result] = None) -> NotebookMetadata:
+    """
+    Reads and parses a notebook once and returns everything the explorer
+    needs. Never raises: failures are reported through `error`.
+    """
+    path = str(path)
+    try:
+        st = st or os.stat(path)
+    except OSError as e:
+        return NotebookMetadata(path=path, mtime=0.0, size=0, title=_title_from_path(path), error=str(e))
 
     try:
         with open(path, "r", encoding="utf-8") as f:
-            source_code = f.read()
-            
-        tree = ast.parse(source_code)
-        
-        # ast.get_docstring specifically retrieves the 
-        # docstring of the node passed (the Module root)
-        global_doc = ast.get_docstring(tree)
-        
-        return global_doc
-        
+            source = f.read()
+        tree = ast.parse(source)
     except Exception as e:
-        return None, f"Error: {e}"
+        return NotebookMetadata(
+            path=path, mtime=st.st_mtime, size=st.st_size,
+            title=_title_from_path(path), error=str(e)
+        )
+
+    app_kwargs = {}
+    generated_with = None
+    cells = 0
+    imports = set()
+    markdown = []
+
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            name = node.targets[0].id
+            if name == "__generated_with" and isinstance(node.value, ast.Constant):
+                generated_with = str(node.value.value)
+            elif name == "app":
+                app_kwargs = _parse_app_call(node.value)
+        elif _is_cell(node):
+            cells += 1
+
+    # Imports and markdown can live at module level or inside any cell
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            imports.add(node.module.split('.')[0])
+        elif isinstance(node, ast.Call):
+            text = _markdown_text(node)
+            if text:
+                markdown.append(text)
+
+    return NotebookMetadata(
+        path=path,
+        mtime=st.st_mtime,
+        size=st.st_size,
+        title=app_kwargs.get("app_title") or _title_from_path(path),
+        docstring=ast.get_docstring(tree),
+        generated_with=generated_with,
+        width=app_kwargs.get("width"),
+        cells=cells,
+        imports=tuple(sorted(imports)),
+        markdown=tuple(markdown),
+        wasm=notebook_config(source).get("wasm") is True,
+    )
+
+
+def _is_notebook_file(path: str) -> bool:
+    name = os.path.basename(path)
+    return name.endswith('.py') and not name.startswith(('.', '_'))
+
+
+def _is_ignored_dir(name: str) -> bool:
+    return name.startswith('.') or name.startswith('__')
+
+
+class NotebookWatcher:
+    """
+    Single filesystem watcher for the notebooks tree. Runs `watchfiles` in a
+    daemon thread and fans each batch of changed paths out to subscribers.
+    """
+
+    def __init__(self, root: str):
+        self.root = str(root)
+        self._subscribers: List[Callable[[Set[Tuple[int, str]]], None]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, callback: Callable[[Set[Tuple[int, str]]], None]) -> None:
+        """`callback` receives a set of (watchfiles.Change, abs_path) tuples."""
+        self._subscribers.append(callback)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="notebook-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        from watchfiles import watch, DefaultFilter
+
+        # marimo writes its session/cache files next to the notebooks
+        watch_filter = DefaultFilter(ignore_dirs=(*DefaultFilter.ignore_dirs, '__marimo__'))
+        try:
+            for changes in watch(self.root, watch_filter=watch_filter, stop_event=self._stop):
+                for callback in self._subscribers:
+                    try:
+                        callback(changes)
+                    except Exception as e:
+                        logger.error(f"Notebook watcher subscriber failed: {e}")
+        except Exception as e:
+            logger.error(f"Notebook watcher stopped: {e}")
+
+
+@dataclass(frozen=True)
+class DirEntry:
+    name: str
+    path: str
+    is_dir: bool
+
+
+class DirectoryListingCache:
+    """
+    Per-directory listings for the explorer, produced with `os.scandir`
+    (one syscall batch, no extra stat per entry) and kept until the watcher
+    reports a change in that directory.
+    """
+
+    def __init__(self, root: str):
+        self.root = str(root)
+        self._listings: Dict[str, Tuple[DirEntry, ...]] = {}
+        self._lock = threading.Lock()
+
+    def _scan(self, directory: str) -> Tuple[DirEntry, ...]:
+        entries = []
+        with os.scandir(directory) as it:
+            for e in it:
+                # Filter: no hidden files, no __init__.py / __pycache__ / __marimo__
+                if e.name.startswith('.'):
+                    continue
+                is_dir = e.is_dir()
+                if is_dir:
+                    if '__' in e.name:
+                        continue
+                elif not _is_notebook_file(e.path):
+                    continue
+                entries.append(DirEntry(name=e.name, path=e.path, is_dir=is_dir))
+        # Sort: Folders first, then files
+        entries.sort(key=lambda x: (not x.is_dir, x.name))
+        return tuple(entries)
+
+    def list(self, directory) -> Tuple[DirEntry, ...]:
+        """Blocking variant; scans only on a cache miss."""
+        directory = str(directory)
+        cached = self._listings.get(directory)
+        if cached is not None:
+            return cached
+        listing = self._scan(directory)
+        with self._lock:
+            self._listings[directory] = listing
+        return listing
+
+    async def alist(self, directory) -> Tuple[DirEntry, ...]:
+        """Event-loop friendly: cache hits return immediately, misses scan in a worker thread."""
+        cached = self._listings.get(str(directory))
+        if cached is not None:
+            return cached
+        return await asyncio.to_thread(self.list, directory)
+
+    def invalidate(self, directory) -> None:
+        """Forgets `directory` and every listing below it."""
+        directory = str(directory).rstrip(os.sep)
+        prefix = directory + os.sep
+        with self._lock:
+            for d in [d for d in self._listings if d == directory or d.startswith(prefix)]:
+                del self._listings[d]
+
+    def on_changes(self, changes: Set[Tuple[int, str]]) -> None:
+        """`NotebookWatcher` subscriber: an added/removed/renamed entry changes its parent's listing."""
+        from watchfiles import Change
+
+        for change, path in changes:
+            # Editing a notebook in place leaves the listing untouched
+            if change == Change.modified:
+                continue
+            self.invalidate(os.path.dirname(path))
+            if path in self._listings:
+                self.invalidate(path)
+
+
+class NotebookMetadataIndex:
+    """
+    In-memory metadata for every notebook under `root`, keyed by
+    (path, mtime, size). Lookups never touch the disk: entries are filled by
+    a background scan and kept fresh by `NotebookWatcher` events.
+    """
+
+    def __init__(self, root: str):
+        self.root = str(root)
+        self._entries: Dict[str, NotebookMetadata] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[str, Optional[NotebookMetadata]], None]] = []
+        self._thread: Optional[threading.Thread] = None
+        self.ready = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, path) -> Optional[NotebookMetadata]:
+        """Memory-only lookup; None until the background scan has seen the file."""
+        return self._entries.get(str(path))
+
+    def entries(self) -> List[NotebookMetadata]:
+        with self._lock:
+            return list(self._entries.values())
+
+    def subscribe(self, listener: Callable[[str, Optional[NotebookMetadata]], None]) -> None:
+        """`listener(path, meta)` is called after an entry changes; meta is None on removal."""
+        self._listeners.append(listener)
+
+    def _notify(self, path: str, meta: Optional[NotebookMetadata]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(path, meta)
+            except Exception as e:
+                logger.error(f"Metadata listener failed for {path}: {e}")
+
+    def refresh(self, path) -> Optional[NotebookMetadata]:
+        """Re-extracts `path` only if its (mtime, size) moved since the last scan."""
+        path = str(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.remove(path)
+            return None
+
+        current = self._entries.get(path)
+        if current and current.key == (path, st.st_mtime, st.st_size):
+            return current
+
+        meta = extract_metadata(path, st)
+        with self._lock:
+            self._entries[path] = meta
+        self._notify(path, meta)
+        return meta
+
+    def remove(self, path) -> None:
+        """Drops `path`, or every entry below it when `path` was a directory."""
+        path = str(path)
+        prefix = path.rstrip(os.sep) + os.sep
+        with self._lock:
+            gone = [p for p in self._entries if p == path or p.startswith(prefix)]
+            for p in gone:
+                del self._entries[p]
+        for p in gone:
+            self._notify(p, None)
+
+    def iter_notebooks(self, root: Optional[str] = None) -> Iterable[str]:
+        for dirpath, dirnames, filenames in os.walk(root or self.root):
+            dirnames[:] = [d for d in dirnames if not _is_ignored_dir(d)]
+            for name in filenames:
+                full = os.path.join(dirpath, name)
+                if _is_notebook_file(full):
+                    yield full
+
+    def scan(self, root: Optional[str] = None) -> None:
+        """Walks the tree and refreshes changed entries. Safe to call repeatedly."""
+        for path in self.iter_notebooks(root):
+            self.refresh(path)
+
+    def start(self) -> None:
+        """Fills the index in a background thread."""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def _initial_scan():
+            try:
+                self.scan()
+                logger.info(f"Notebook metadata index ready ({len(self)} notebooks)")
+            except Exception as e:
+                logger.error(f"Notebook metadata scan failed: {e}")
+            finally:
+                self.ready.set()
+
+        self._thread = threading.Thread(target=_initial_scan, name="notebook-index", daemon=True)
+        self._thread.start()
+
+    def _in_scope(self, path: str) -> bool:
+        rel = os.path.relpath(path, self.root)
+        if rel.startswith('..'):
+            return False
+        return not any(_is_ignored_dir(part) for part in Path(rel).parts[:-1])
+
+    def on_changes(self, changes: Set[Tuple[int, str]]) -> None:
+        """`NotebookWatcher` subscriber: keeps entries in step with the disk."""
+        from watchfiles import Change
+
+        for change, path in changes:
+            if not self._in_scope(path):
+                continue
+            if change == Change.deleted:
+                self.remove(path)
+            elif os.path.isdir(path):
+                # A folder was created or moved in: pick up its notebooks
+                self.scan(path)
+            elif _is_notebook_file(path):
+                self.refresh(path)
 
 
 # def feth_resource(url:str = None)->str:
@@ -47,6 +452,7 @@ def get_global_metadata(target):
 
 def get_marimo_runner_old(src: str, internal_path: str = "") -> ASGIApp:
     # internal_path is *within* the mounted Marimo app, so usually ""
+    import marimo
     
     version = marimo.__version__
     return (
@@ -71,6 +477,7 @@ class MarimoStaticMiddleware(BaseHTTPMiddleware):
             filename = os.path.basename(path)
             
             # Locate Marimo's base _static directory
+            import marimo
             static_dir = os.path.join(os.path.dirname(marimo.__file__), "_static")
             file_path = os.path.join(static_dir, filename)
             
@@ -84,6 +491,10 @@ class MarimoStaticMiddleware(BaseHTTPMiddleware):
 
 
 def get_marimo_runner(src: str, mount_point: str = None) -> ASGIApp:
+    # marimo is imported here, not at module level: it is the heaviest import
+    # of the host and only needed once /apps is built
+    import marimo
+    
     version = marimo.__version__
     # 1. Use the official, native Marimo builder
     marimo_server = (
@@ -116,5 +527,35 @@ def get_marimo_runner(src: str, mount_point: str = None) -> ASGIApp:
             
         await marimo_server(scope, receive, send)
 
+    # Kept reachable so cached per-notebook apps can be evicted
+    prefix_restoring_app.marimo_server = marimo_server
     return prefix_restoring_app
 
+
+def find_app_cache(app) -> Optional[dict]:
+    """
+    The per-notebook app cache of marimo's dynamic-directory middleware
+    (keyed by absolute file path), found by unwrapping `app`. None until the
+    runner has been built.
+    """
+    seen = set()
+    while app is not None and id(app) not in seen:
+        seen.add(id(app))
+        cache = getattr(app, "_app_cache", None)
+        if isinstance(cache, dict) and hasattr(app, "directory"):
+            return cache
+        app = getattr(app, "marimo_server", None) or getattr(app, "app", None)
+    return None
+
+
+def evict_apps(app, paths: List[str]) -> int:
+    """Drops the cached /apps apps of `paths` so the next visit loads the new file."""
+    cache = find_app_cache(app)
+    if cache is None:
+        return 0
+    evicted = 0
+    for path in paths:
+        if cache.pop(str(path), None) is not None:
+            evicted += 1
+    return evicted
+
@@ -3,6 +3,11 @@ import marimo as mo
 import os
 import sys
 import shutil
+import threading
+
+from careatlas.app.gitsync import SyncQueue
+from careatlas.app.gitstatus import GitStatusCache
+from careatlas.app.worktrees import SYNC_BRANCH, auth_config
 
 
 # 1. Configuration
@@ -12,81 +17,104 @@ DRY_RUN=False # for dev
 # Extract version once at the module level or inside the function
 MARIMO_VERSION = getattr(mo, "__version__", "")
 
+# One Repo per kernel process; discovery and identity setup happen once
+_repo = None
+_repo_lock = threading.Lock()
+
+
+def identity() -> git.Actor:
+    """Author/committer of this kernel, from the env MarimoManager passes in."""
+    return git.Actor(
+        os.environ.get("GIT_AUTHOR_NAME", "Marimo bot"),
+        os.environ.get("GIT_AUTHOR_EMAIL", "bot@marimo"),
+    )
+
+
+def auth_options() -> dict:
+    """
+    Per-command `-c` options that authenticate https remotes with the PAT,
+    so the token never has to be written into .git/config.
+    """
+    config = auth_config()
+    return {"c": config} if config else {}
+
+
 def get_repo():
-    try:
-        # 1. Initialize the repo
-        repo = git.Repo("/server", search_parent_directories=True)
-        assert not repo.bare
-        
-        # 2. Automatically configure identity for this instance
-        # Using a context manager ensures the file lock is released immediately
-        with repo.config_writer() as cw:
-            # Fallback to your UNDP email if env vars are missing
-            cw.set_value("user", "name", os.environ.get("GIT_AUTHOR_NAME", "Marimo bot"))
-            cw.set_value("user", "email", os.environ.get("GIT_AUTHOR_EMAIL", "bot@marimo"))
-        
-        return repo
-    except Exception as e:
-        # Helpful for debugging if /server isn't found
-        return None
+    global _repo
+    if _repo is not None:
+        return _repo
+    with _repo_lock:
+        if _repo is not None:
+            return _repo
+        try:
+            # 1. Initialize the repo
+            # MarimoManager points editing kernels at the user's own worktree
+            repo = git.Repo(os.environ.get("CAREATLAS_REPO", "/server"), search_parent_directories=True)
+            assert not repo.bare
+            
+            # 2. Identity goes through the environment of every git command
+            # instead of `git config` writes, which all kernels used to
+            # serialize on .git/config.lock
+            actor = identity()
+            repo.git.update_environment(
+                GIT_AUTHOR_NAME=actor.name,
+                GIT_AUTHOR_EMAIL=actor.email,
+                GIT_COMMITTER_NAME=actor.name,
+                GIT_COMMITTER_EMAIL=actor.email,
+            )
+            _repo = repo
+        except Exception as e:
+            # Helpful for debugging if /server isn't found; try again next call
+            return None
+    return _repo
     
+# The notebooks tree inside the checkout (or the user's worktree)
+NOTEBOOKS_SUBDIR = os.path.join("src", "careatlas", "notebooks")
+_status = None
+
+
+def get_status():
+    """One bulk `git status` for the notebooks tree, shared by every badge in this kernel."""
+    global _status
+    if _status is None:
+        repo = get_repo()
+        if not repo:
+            return None
+        # No watcher in the kernel; saves and resets invalidate it explicitly
+        _status = GitStatusCache(
+            os.path.join(repo.working_tree_dir, NOTEBOOKS_SUBDIR),
+            upstream=f"origin/{SYNC_BRANCH}",
+            max_age=10,
+        )
+    return _status
+
+
+def _invalidate_status():
+    if _status is not None:
+        _status.invalidate()
+
+
 # Accept the notebook path as an argument
 def is_modified(nb_path):
-    repo = get_repo()
-    if not repo or not nb_path:
-        return False
-    try:
-        return repo.is_dirty(path=nb_path)
-    except Exception as e:
-        print(f"Git status error: {e}")
+    status = get_status()
+    if not status or not nb_path:
         return False
+    status.ensure_fresh()
+    return status.is_modified(os.path.abspath(nb_path))
+
+
+# Saves are committed and pushed by a background worker; a burst of saves
+# becomes one commit and one push
+sync_queue = SyncQueue(get_repo, identity, auth_options, dry_run=DRY_RUN, on_done=_invalidate_status)
 
 
 def save(src: str = None, push: bool = True):
     try:
         abs_path = os.path.abspath(src)
         name = os.path.basename(abs_path)
-        token = os.environ.get('GITHUB_PAT_TOKEN')
-        repo = get_repo()
-    
-        if not repo:
-            return mo.status.toast("Repo not found", kind="danger")
-        if not DRY_RUN:
-            # 1. STAGE & COMMIT (Local first)
-            repo.index.add([abs_path], force=True)
-            repo.index.commit(f"Auto-notebook: {name}")
-
-        if push:
-            origin = repo.remote(name='origin')
-            
-            # Authenticate URL
-            if token and "https://" in origin.url and "@" not in origin.url:
-                auth_url = origin.url.replace("https://", f"https://{token}@")
-                origin.set_url(auth_url)
-            
-            try:
-                if not DRY_RUN:
-                    # 2. THE PULL REBASE (Crucial for multi-user safety)
-                    # This brings down others' changes and puts yours on top
-                    origin.pull(rebase=True)
-                    
-                    # 3. PUSH
-                    origin.push()
-                mo.status.toast(f"Synced: {name}", kind="success")
-                
-            except Exception as e:
-                # If rebase fails (conflict in the SAME notebook), we must abort
-                if repo.is_dirty() or "rebase" in str(e).lower():
-                    repo.git.rebase("--abort")
-                raise e # Pass to the outer exception handler
-            finally:
-                # Cleanup URL even if it fails
-                origin.set_url(origin.url.replace(f"{token}@", ""))
-        else:
-            mo.status.toast(f"Staged & commited: {name}", kind="success")
-
-    except git.exc.GitCommandError as gce:
-        mo.status.toast(f"Git Error: {gce.stderr}", kind="danger")
+        waiting = sync_queue.request(abs_path, push=push)
+        detail = "" if waiting == 1 else f"together with {waiting - 1} other change(s)"
+        mo.status.toast(f"Queued for sync: {name}", detail)
     except Exception as e:
         mo.status.toast(f"Error: {str(e)}", kind="danger")
 
@@ -94,15 +122,18 @@ def reset_to_remote():
     try:
         if not DRY_RUN:
             repo = get_repo()
-            # 1. Fetch the latest from GitHub without merging
-            repo.remotes.origin.fetch()
-            
-            # 2. Hard reset local main to match origin/main
-            # WARNING: This deletes uncommitted local work!
-            repo.git.reset('--hard', 'origin/main')
-            
-            # 3. Clean up untracked files/folders
-            repo.git.clean('-fd')
+            # Wait for an in-flight sync; queued saves are dropped by the reset
+            with sync_queue.git_lock:
+                # 1. Fetch the latest from GitHub without merging
+                repo.git(**auth_options()).fetch("origin")
+                
+                # 2. Hard reset local main to match origin/main
+                # WARNING: This deletes uncommitted local work!
+                repo.git.reset('--hard', f'origin/{SYNC_BRANCH}')
+                
+                # 3. Clean up untracked files/folders
+                repo.git.clean('-fd')
+            _invalidate_status()
         
         mo.status.toast("Environment reset to match GitHub exactly.", kind="info")
     except Exception as e:
@@ -129,7 +160,7 @@ def handle_create(name_ui):
         
         # Auto-save/Sync the new file
         save(src=target_path, push=True)
-    return mo.status.toast(f"Created {filename} and synced to Cloud", kind="success")
+    return mo.status.toast(f"Created {filename}, syncing to Cloud", kind="success")
 
 
 def handle_duplicate(name_ui):
@@ -565,6 +596,20 @@ btn_reset = mo.ui.button(
 )
 gh = f"{mo.icon('mdi:github', size=30)}"
 
+def changes_summary():
+    """Changed / unpushed notebooks from the cached bulk status (no git call per file)."""
+    status = get_status()
+    if not status:
+        return mo.md("")
+    status.ensure_fresh()
+    changed = [os.path.relpath(p, NOTEBOOKS_SUBDIR) for p in status.changed()]
+    if not changed:
+        return mo.md("<span style='color: var(--slate-11); font-size: 0.85em;'>No local changes.</span>")
+    rows = "\n".join(f"- `{p}` ({status.badge(os.path.join(NOTEBOOKS_SUBDIR, p))})" for p in changed[:10])
+    more = f"\n- … and {len(changed) - 10} more" if len(changed) > 10 else ""
+    return mo.md(f"**Local changes**\n\n{rows}{more}")
+
+
 # 2. Arrange elements in the function
 def create_ui():
     # --- TAB 1: FILE OPERATIONS ---
@@ -594,6 +639,7 @@ def create_ui():
         # """),
         # Clean section header
         mo.stat(label="", value='⭮ GitHub Sync',  caption='This will pull changes and save your work to GitHub.'),
+        changes_summary(),
         commit_msg,
         btn_sync,
         hr(),
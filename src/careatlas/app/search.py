@@ -0,0 +1,146 @@
+import os
+import re
+import bisect
+import threading
+import logging
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from careatlas.app.marutil import NotebookMetadata
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# How much a match in each field counts towards the ranking
+FIELD_WEIGHTS = {
+    "name": 4.0,
+    "title": 3.0,
+    "imports": 2.0,
+    "docstring": 2.0,
+    "markdown": 1.0,
+}
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercase alphanumeric tokens; underscores and punctuation split words."""
+    if not text:
+        return []
+    return TOKEN_RE.findall(text.lower())
+
+
+def notebook_slug(path: str, root: str) -> str:
+    """'folder/name' as used by the /apps and /edit routes."""
+    rel = os.path.relpath(path, root)
+    return str(Path(rel).with_suffix('')).replace(os.sep, '/').strip('/')
+
+
+class NotebookSearchIndex:
+    """
+    Inverted index over notebook names, docstrings, markdown cells and
+    imported packages. It subscribes to `NotebookMetadataIndex`, so only
+    notebooks whose (mtime, size) changed are re-tokenised, and queries are
+    answered from memory.
+    """
+
+    def __init__(self, root: str):
+        self.root = str(root)
+        # term -> {path: score}
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        # path -> terms, so a document can be removed without a full scan
+        self._doc_terms: Dict[str, Set[str]] = {}
+        self._docs: Dict[str, NotebookMetadata] = {}
+        self._vocab: List[str] = []
+        self._vocab_dirty = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _fields(self, meta: NotebookMetadata) -> Dict[str, str]:
+        return {
+            "name": notebook_slug(meta.path, self.root).replace('/', ' '),
+            "title": meta.title,
+            "imports": " ".join(meta.imports),
+            "docstring": meta.docstring or "",
+            "markdown": "\n".join(meta.markdown),
+        }
+
+    def _drop(self, path: str) -> None:
+        for term in self._doc_terms.pop(path, ()):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(path, None)
+            if not postings:
+                del self._postings[term]
+                self._vocab_dirty = True
+        self._docs.pop(path, None)
+
+    def update(self, path: str, meta: Optional[NotebookMetadata]) -> None:
+        """`NotebookMetadataIndex` listener: re-indexes one notebook, or drops it when meta is None."""
+        with self._lock:
+            self._drop(path)
+            if meta is None:
+                return
+
+            scores: Dict[str, float] = defaultdict(float)
+            for field, text in self._fields(meta).items():
+                weight = FIELD_WEIGHTS[field]
+                for term in tokenize(text):
+                    scores[term] += weight
+
+            for term, score in scores.items():
+                if term not in self._postings:
+                    self._vocab_dirty = True
+                self._postings[term][path] = score
+            self._doc_terms[path] = set(scores)
+            self._docs[path] = meta
+
+    def _expand(self, prefix: str) -> List[str]:
+        """All indexed terms starting with `prefix` (sorted vocab + bisect)."""
+        if self._vocab_dirty:
+            self._vocab = sorted(self._postings)
+            self._vocab_dirty = False
+        lo = bisect.bisect_left(self._vocab, prefix)
+        hi = bisect.bisect_left(self._vocab, prefix + "\uffff")
+        return self._vocab[lo:hi]
+
+    def search(self, query: str, limit: int = 20) -> List[dict]:
+        """
+        Every query term must match (AND). The last term is treated as a
+        prefix so results update while the user is still typing.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            totals: Optional[Dict[str, float]] = None
+            for i, term in enumerate(terms):
+                candidates = self._expand(term) if i == len(terms) - 1 else [term]
+                matched: Dict[str, float] = defaultdict(float)
+                for cand in candidates:
+                    for path, score in self._postings.get(cand, {}).items():
+                        matched[path] += score
+
+                if totals is None:
+                    totals = dict(matched)
+                else:
+                    totals = {p: totals[p] + s for p, s in matched.items() if p in totals}
+                if not totals:
+                    return []
+
+            ranked = sorted(totals.items(), key=lambda kv: (-kv[1], kv[0]))[:limit]
+            results = []
+            for path, score in ranked:
+                meta = self._docs[path]
+                results.append({
+                    "slug": notebook_slug(path, self.root),
+                    "title": meta.title,
+                    "docstring": meta.docstring,
+                    "imports": list(meta.imports),
+                    "score": round(score, 2),
+                })
+            return results
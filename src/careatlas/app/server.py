@@ -1,3 +1,5 @@
+# Imported first so the startup profile covers every import below
+from careatlas.app.startup import profile, ReadinessGate, LazyASGIApp
 import os
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException
@@ -8,11 +10,23 @@ import logging
 from careatlas.app import marutil as mu
 from fastapi.responses import JSONResponse
 from fastapi.responses import RedirectResponse
+from fastapi.responses import FileResponse, HTMLResponse, Response
 from pathlib import Path
+from typing import Optional
 from starlette.routing import Mount
 import uuid
 from careatlas.app.util import MarimoManager
+from careatlas.app.search import NotebookSearchIndex
+from careatlas.app import exports
+from careatlas.app.governor import SessionGovernor
+from careatlas.app.health import AUTH_PING_EXPLICIT, HealthMonitor, check_auth_proxy, check_directory
+from careatlas.app.gitstatus import GitStatusCache
+from careatlas.app.worktrees import SYNC_BRANCH
+from careatlas.app.upstream import UpstreamSync
+from careatlas.data.shared import SharedDatasetCache
 import asyncio
+import functools
+import math
 import httpx
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 
@@ -45,26 +59,124 @@ NOTEBOOKS_DIR = (BASE_DIR / "notebooks").resolve()
 
 # --- Lifespan Logic ---
 
+async def _run_lazily(factory, loop: str = "maintain"):
+    """Background loop of a service whose module is imported off the event loop, after startup."""
+    service = await asyncio.to_thread(factory)
+    await getattr(service, loop)()
+
+
 async def lifespan(app: FastAPI):
+    profile.mark("lifespan start")
+    # Everything slow runs in the background behind the readiness gate,
+    # so uvicorn can bind the port right away
+    startup_tasks = [
+        # OS scan for orphaned kernels before the reaper loop starts
+        asyncio.create_task(readiness.run("session manager", manager.startup())),
+        # Build the marimo /apps runner (imports marimo)
+        asyncio.create_task(readiness.run("apps runner", apps_runner.warm_up())),
+    ]
+    
     # STARTUP: Start the background 'maintenance' task
     # This loop handles the 1800s timeout and the zombie cleanup
-    await manager.startup()
-    
     reaper_task = asyncio.create_task(manager.cleanup_loop())
+    governor_task = asyncio.create_task(marimo_server.maintain())
+    # Readiness checks run here; /ready only reads their cached results
+    health_task = asyncio.create_task(health.run())
+    # Colleagues' pushes reach the explorer and /apps without a restart
+    upstream_task = asyncio.create_task(upstream.run())
+    # Leases and LRU budget of the datasets kernels share through /dev/shm
+    shared_datasets_task = asyncio.create_task(shared_datasets.maintain())
+    tile_cache_task = asyncio.create_task(_run_lazily(tile_cache))
+    raster_tiles_task = asyncio.create_task(_run_lazily(raster_tiles))
+    # Catalog datasets marked `prefetch` are copied to local disk before anyone asks
+    prefetch_task = asyncio.create_task(_run_lazily(datasets, "run"))
     
+    # Snapshot exports must be accepting jobs before the index reports notebooks
+    await export_pipeline.start()
+    
+    # Notebook metadata is scanned off-loop and then kept fresh by the watcher
+    notebook_index.start()
+    notebook_watcher.start()
+    
+    profile.mark("lifespan startup complete")
     yield  # The NiceGUI app runs here
     
     # SHUTDOWN: Fast break for Docker
+    notebook_watcher.stop()
+    await export_pipeline.stop()
     reaper_task.cancel()
+    governor_task.cancel()
+    health_task.cancel()
+    upstream_task.cancel()
+    shared_datasets_task.cancel()
+    tile_cache_task.cancel()
+    raster_tiles_task.cancel()
+    prefetch_task.cancel()
     
-    try:
-        await reaper_task
-    except asyncio.CancelledError:
-        pass
+    for task in startup_tasks:
+        task.cancel()
+    for task in (reaper_task, governor_task, health_task, upstream_task, shared_datasets_task, tile_cache_task, raster_tiles_task, prefetch_task, *startup_tasks):
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
     
     manager.shutdown_all()
 
 manager = MarimoManager()
+readiness = ReadinessGate("session manager", "apps runner")
+health = HealthMonitor()
+
+# In-memory notebook metadata so explorer pages never parse files
+notebook_watcher = mu.NotebookWatcher(NOTEBOOKS_DIR)
+notebook_index = mu.NotebookMetadataIndex(NOTEBOOKS_DIR)
+notebook_watcher.subscribe(notebook_index.on_changes)
+# Directory listings for the explorer, scanned off-loop and cached per folder
+listing_cache = mu.DirectoryListingCache(NOTEBOOKS_DIR)
+notebook_watcher.subscribe(listing_cache.on_changes)
+# Modified/untracked/unpushed badges: one bulk `git status` per refresh
+git_status = GitStatusCache(NOTEBOOKS_DIR, upstream=f"origin/{SYNC_BRANCH}")
+notebook_watcher.subscribe(git_status.on_changes)
+# Editors see the state of their own worktree (see MarimoManager)
+worktree_status: dict = {}
+# Fast-forwards the checkout from origin and invalidates just what changed
+upstream = UpstreamSync(NOTEBOOKS_DIR)
+# Arrow tables mapped by all kernels; the host only does the bookkeeping
+shared_datasets = SharedDatasetCache()
+
+
+# The data services pull in numpy/pyarrow/shapely (and GDAL for rasters), so
+# like marimo they are imported on first use instead of before the port binds
+
+@functools.cache
+def tile_cache():
+    """z/x/y GeoArrow tiles of the data layers, rendered once and kept on disk."""
+    from careatlas.data.tiles import TileCache
+
+    return TileCache()
+
+
+@functools.cache
+def raster_tiles():
+    """XYZ PNG tiles of COG rasters, read from the overview that matches the zoom."""
+    from careatlas.data.raster import RasterTileCache
+
+    return RasterTileCache()
+
+
+def datasets():
+    """Manifest of the datasets notebooks resolve by name, with the local disk cache."""
+    from careatlas.data.catalog import catalog
+
+    return catalog()
+
+
+# Full-text search is fed incrementally by the metadata index
+search_index = NotebookSearchIndex(NOTEBOOKS_DIR)
+notebook_index.subscribe(search_index.update)
+# Static HTML snapshots for anonymous viewers, re-rendered when content changes
+export_pipeline = exports.ExportPipeline(NOTEBOOKS_DIR)
+notebook_index.subscribe(export_pipeline.on_metadata)
 
 app = FastAPI(title="UNDP CareAtlas", lifespan=lifespan)
 
@@ -303,6 +415,192 @@ def page_get_involved(request: Request):
 
 
     
+@app.get("/api/exports")
+async def export_status():
+    """Inspect the background export/preview pool: running and queued jobs."""
+    return JSONResponse(content=export_pipeline.status())
+
+
+@app.get("/api/startup")
+async def startup_profile():
+    """Startup phase timings; see `python -m careatlas.app.startup` for imports by module."""
+    return JSONResponse(content={
+        **profile.report(),
+        "ready": readiness.is_ready,
+        "pending": readiness.pending,
+        "failed": readiness.failed,
+    })
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness: 200 when every critical component passed its last background
+    check, 503 otherwise. Only reads cached results.
+    """
+    snapshot = health.snapshot()
+    return JSONResponse(
+        status_code=200 if snapshot["ready"] else 503,
+        content=snapshot,
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+@app.get("/api/datasets")
+async def dataset_catalog_status():
+    """Catalog entries with their size and whether a verified local copy exists."""
+    return JSONResponse(content=await asyncio.to_thread(lambda: datasets().status()))
+
+
+@app.get("/api/datasets/shared")
+async def shared_dataset_status():
+    """Entries of the shared-memory dataset cache with their kernel reference counts."""
+    return JSONResponse(content=await asyncio.to_thread(shared_datasets.status))
+
+
+@app.get("/tiles/{layer:path}/{z}/{x}/{y}.arrow")
+async def vector_tile(layer: str, z: int, x: int, y: int, request: Request, columns: Optional[str] = None):
+    """
+    One z/x/y tile of a data layer as a GeoArrow IPC stream, clipped and
+    simplified for its zoom. `columns` (comma separated) projects attributes.
+    """
+    cols = [c for c in columns.split(",") if c] if columns else None
+    tiles = await asyncio.to_thread(tile_cache)
+    try:
+        etag = await asyncio.to_thread(tiles.etag, layer, z, x, y, cols)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Layer not found")
+    # Tiles are immutable per layer version; the ETag changes with the file
+    cache_headers = {"ETag": etag, "Cache-Control": "public, max-age=300, must-revalidate"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cache_headers)
+
+    try:
+        tile = await asyncio.to_thread(tiles.tile_path, layer, z, x, y, cols)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Layer not found")
+    except ValueError as e:
+        # Out-of-range tile or unknown column
+        raise HTTPException(status_code=400, detail=str(e))
+    from careatlas.data.tiles import TILE_MEDIA_TYPE
+
+    return FileResponse(tile, media_type=TILE_MEDIA_TYPE, headers=cache_headers)
+
+
+@app.get("/raster/{layer:path}/{z}/{x}/{y}.png")
+async def raster_tile(
+    layer: str,
+    z: int,
+    x: int,
+    y: int,
+    request: Request,
+    band: int = 1,
+    colormap: str = "viridis",
+    vmin: Optional[float] = None,
+    vmax: Optional[float] = None,
+):
+    """One XYZ tile of a COG under the data directory, colour-mapped to PNG."""
+    style = dict(band=band, colormap=colormap, vmin=vmin, vmax=vmax)
+    rasters = await asyncio.to_thread(raster_tiles)
+    try:
+        etag = await asyncio.to_thread(rasters.etag, layer, z, x, y, **style)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Raster not found")
+    cache_headers = {"ETag": etag, "Cache-Control": "public, max-age=300, must-revalidate"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cache_headers)
+
+    try:
+        tile = await asyncio.to_thread(rasters.tile_path, layer, z, x, y, **style)
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Raster not found")
+    except (ValueError, IndexError) as e:
+        # Out-of-range tile, unknown band or colormap
+        raise HTTPException(status_code=400, detail=str(e))
+    return FileResponse(tile, media_type="image/png", headers=cache_headers)
+
+
+@app.get("/api/tiles")
+async def tile_cache_status():
+    """Hit/miss counters of the on-disk vector and raster tile caches."""
+    vector = await asyncio.to_thread(lambda: tile_cache().status())
+    raster = await asyncio.to_thread(lambda: raster_tiles().status())
+    return JSONResponse(content={"vector": vector, "raster": raster})
+
+
+@app.get("/api/apps")
+async def app_sessions():
+    """Run-mode sessions currently admitted by the /apps governor."""
+    return JSONResponse(content=marimo_server.status())
+
+
+def resolve_notebook(notebook_name: str) -> Path:
+    """Maps a slug to a notebook file inside NOTEBOOKS_DIR or raises 404."""
+    base_dir = Path(NOTEBOOKS_DIR).resolve()
+    # Ensure .py extension is present
+    full_name = notebook_name if notebook_name.endswith('.py') else f"{notebook_name}.py"
+    notebook_path = (base_dir / full_name).resolve()
+    
+    if not notebook_path.exists() or base_dir not in notebook_path.parents:
+        raise HTTPException(status_code=404, detail="Notebook not found or access denied")
+    return notebook_path
+
+
+@app.get("/view/{notebook_name:path}")
+async def view(notebook_name: str, request: Request):
+    """
+    Serves the pre-rendered static snapshot of a notebook. No kernel is
+    started; the snapshot links to /apps for a live session.
+    """
+    notebook_path = resolve_notebook(notebook_name.rstrip('/'))
+    slug = str(notebook_path.relative_to(NOTEBOOKS_DIR).with_suffix('')).replace(os.sep, '/')
+    
+    digest = await asyncio.to_thread(exports.notebook_digest, notebook_path)
+    etag = f'"{digest}"'
+    cache_headers = {"ETag": etag, "Cache-Control": "public, max-age=60, must-revalidate"}
+    
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cache_headers)
+    
+    snapshot = export_pipeline.store.get_html(digest)
+    if snapshot:
+        return FileResponse(snapshot, media_type="text/html", headers=cache_headers)
+    
+    # Not rendered yet (new or just edited): queue it and let the browser retry
+    export_pipeline.submit(notebook_path)
+    return HTMLResponse(
+        exports.pending_page(slug),
+        status_code=503,
+        headers={"Retry-After": "5", "Cache-Control": "no-store"},
+    )
+
+
+@app.get("/wasm/{notebook_name:path}")
+async def wasm(notebook_name: str):
+    """
+    Sends the viewer to the client-side (Pyodide) bundle of an opted-in,
+    eligible notebook. Falls back to the static snapshot while the bundle is
+    building or when the notebook cannot run in the browser.
+    """
+    notebook_path = resolve_notebook(notebook_name.rstrip('/'))
+    slug = str(notebook_path.relative_to(NOTEBOOKS_DIR).with_suffix('')).replace(os.sep, '/')
+    no_store = {"Cache-Control": "no-store"}
+    
+    blockers = exports.wasm_blockers(notebook_index.get(notebook_path))
+    if blockers:
+        logger.debug(f"{slug} is not WASM-eligible: {', '.join(blockers)}")
+        return RedirectResponse(url=f"/view/{slug}", headers=no_store)
+    
+    digest = await asyncio.to_thread(exports.notebook_digest, notebook_path)
+    if export_pipeline.store.get_wasm(digest):
+        return RedirectResponse(url=f"/wasm-bundles/{digest}/", headers=no_store)
+    
+    export_pipeline.submit(notebook_path, kind="wasm")
+    return RedirectResponse(url=f"/view/{slug}", headers=no_store)
+
+
 @app.get("/edit/open/{notebook_name:path}") # Added :path for subfolders
 def edit(notebook_name: str, request: Request):
    
@@ -321,17 +619,10 @@ def edit(notebook_name: str, request: Request):
         raise HTTPException(status_code=403, detail="Authentication required to edit.")
     #raise HTTPException(status_code=403, detail="Authentication required to edit.")
     # 2. Path Safety
-    base_dir = Path(NOTEBOOKS_DIR).resolve()
-    # Ensure .py extension is present
-    full_name = notebook_name if notebook_name.endswith('.py') else f"{notebook_name}.py"
-    notebook_path = (base_dir / full_name).resolve()
-    
-    if not notebook_path.exists() or base_dir not in notebook_path.parents:
-        raise HTTPException(status_code=404, detail="Notebook not found or access denied")
-    # 3. Idempotency: Join existing session if available
-    existing = next((s for s in manager._sessions.values() if s.notebook_path == str(notebook_path)), None)
-    # 1. Join existing or Start new session
-    existing = next((s for s in manager._sessions.values() if s.notebook_path == str(notebook_path)), None)
+    notebook_path = resolve_notebook(notebook_name)
+    # 3. Idempotency: Join this user's existing session if available
+    # (every editor has an own worktree, so sessions are per user)
+    existing = manager.find_session(notebook_path, identity=auth)
     if existing:
         # Include PORT in the URL so mitmproxy can route it
         response = RedirectResponse(url=f"/edit/{existing.session_id}/", headers=request.headers)
@@ -376,10 +667,13 @@ def edit(notebook_name: str, request: Request):
 
 @app.get("/heartbeat")
 async def heartbeat():
-    notebooks_exist = os.path.exists(str(NOTEBOOKS_DIR))
-    files = os.listdir(str(NOTEBOOKS_DIR)) if notebooks_exist else []
-    
-    # Extract the routing table
+    """Liveness: the event loop answers. Does no work, so it is safe for aggressive probes."""
+    return JSONResponse(content={"status": "alive"}, headers={"Cache-Control": "no-store"})
+
+
+@app.get("/api/routes")
+async def routes_table():
+    """The routing table (what /heartbeat used to return), for debugging mounts."""
     routes_snapshot = []
     for route in app.routes:
         route_info = {
@@ -396,13 +690,180 @@ async def heartbeat():
         routes_snapshot.append(route_info)
 
     return JSONResponse(content={
-        "status": "alive",
         "notebooks_dir": str(NOTEBOOKS_DIR),
-        "files_found": files,
         "fastapi_routes": routes_snapshot
     })
     
     
+@app.get("/api/search")
+async def search_notebooks(q: str = "", limit: int = 20):
+    """Full-text notebook search, answered from the in-memory index."""
+    limit = max(1, min(limit, 100))
+    return JSONResponse(content={
+        "query": q,
+        "ready": notebook_index.ready.is_set(),
+        "results": search_index.search(q, limit=limit),
+    })
+
+
+def notebook_url(slug: str, meta, can_edit: bool = False) -> str:
+    """
+    Where a notebook link leads. Editors get a live kernel; anonymous viewers
+    get the browser-side bundle or the static snapshot, which both link to
+    /apps for a live kernel.
+    """
+    if can_edit:
+        return f'/apps/{slug}'
+    if not exports.wasm_blockers(meta):
+        return f'/wasm/{slug}'
+    return f'/view/{slug}'
+
+
+def notebook_search_box(can_edit: bool = False):
+    """Search input + result list rendered above the explorer grid."""
+    search_box = ui.input(placeholder='Search notebooks, descriptions or packages...') \
+        .props('outlined dense clearable debounce=250').classes('w-full mb-4')
+    with search_box.add_slot('prepend'):
+        ui.icon('search', color='[#006db0]')
+    results_container = ui.column().classes('w-full gap-2 mb-8')
+
+    def render_results():
+        results_container.clear()
+        query = (search_box.value or '').strip()
+        if not query:
+            return
+        hits = search_index.search(query)
+        with results_container:
+            if not hits:
+                ui.label(f'No notebooks match "{query}".').classes('text-gray-400 italic')
+                return
+            for hit in hits:
+                meta = notebook_index.get(NOTEBOOKS_DIR / f"{hit['slug']}.py")
+                url = notebook_url(hit['slug'], meta, can_edit)
+                with ui.card().classes('undp-card w-full p-4 bg-white cursor-pointer') \
+                    .on('click', lambda u=url: ui.navigate.to(u)):
+                    with ui.row().classes('items-center gap-3'):
+                        ui.icon('dashboard', color='[#006db0]').classes('text-xl')
+                        ui.label(hit['title']).classes('font-bold text-gray-700 capitalize')
+                        ui.label(hit['slug']).classes('text-xs text-gray-400 font-mono')
+                    if hit['docstring']:
+                        ui.label(hit['docstring']).classes('text-sm text-gray-500 line-clamp-1')
+
+    search_box.on_value_change(render_results)
+
+
+EXPLORER_PAGE_SIZE = 24
+
+
+async def status_for(auth: dict) -> GitStatusCache:
+    """The git status cache matching what this visitor edits: their worktree, else the main checkout."""
+    email = auth.get('email') if auth.get('is_authenticated') else None
+    # Card paths are made relative to the main checkout's top level
+    await git_status.aensure_fresh()
+    status = git_status
+    if email:
+        worktree = manager.worktrees.path_for(email)
+        if (worktree / ".git").exists():
+            key = str(worktree)
+            if key not in worktree_status:
+                worktree_status[key] = GitStatusCache(
+                    manager.worktrees.to_worktree(str(NOTEBOOKS_DIR), email),
+                    upstream=f"origin/{SYNC_BRANCH}",
+                    max_age=10,
+                )
+            status = worktree_status[key]
+    await status.aensure_fresh()
+    return status
+
+
+GIT_BADGE_COLORS = {
+    "modified": "orange",
+    "added": "green",
+    "renamed": "green",
+    "untracked": "grey",
+    "deleted": "red",
+    "conflict": "red",
+    "unpushed": "blue",
+}
+
+
+def folder_card(entry: mu.DirEntry, status: Optional[GitStatusCache] = None):
+    rel_path = Path(entry.path).relative_to(NOTEBOOKS_DIR)
+    item_label = entry.name.replace('_', ' ')
+    with ui.card().classes('undp-card p-0 overflow-hidden bg-white cursor-pointer hover:shadow-lg transition-shadow') \
+        .on('click', lambda p=rel_path: ui.navigate.to(f'/notebooks/{p}')):
+        ui.element('div').classes('w-full h-1 bg-[#006db0]')
+        with ui.column().classes('p-8 w-full'):
+            ui.icon('folder_shared', color='[#006db0]').classes('text-4xl mb-2')
+            ui.label(item_label).classes('text-xl font-bold text-gray-700 capitalize')
+            with ui.row().classes('items-center gap-2'):
+                ui.label('Folder').classes('text-gray-400 text-[10px] tracking-widest uppercase font-bold')
+                if status and status.is_dirty_dir(rel_path_in_repo(entry.path)):
+                    ui.badge('changes', color='orange').props('outline')
+
+
+def rel_path_in_repo(path: str) -> str:
+    """Path relative to the git top level, valid in the main checkout and in every worktree."""
+    return os.path.relpath(path, git_status.toplevel or manager.worktrees.repo_root)
+
+
+def notebook_card(entry: mu.DirEntry, can_edit: bool = False, status: Optional[GitStatusCache] = None):
+    rel_path = Path(entry.path).relative_to(NOTEBOOKS_DIR)
+    name, _ = os.path.splitext(entry.name)
+    item_label = name.replace('_', ' ')
+    with ui.card().classes('undp-card p-0 overflow-hidden bg-white'):
+        # Green accent for notebooks
+        ui.element('div').classes('w-full h-1 bg-green-500')
+        # Preview rendered in the background by the export pipeline
+        preview = export_pipeline.preview_for(entry.path)
+        if preview and preview.get('type') == 'image':
+            ui.image(preview['url']).classes('w-full h-40').props('fit=cover')
+        elif preview and preview.get('type') == 'text':
+            ui.label(preview['text']).classes('w-full h-20 px-8 pt-4 text-xs font-mono text-gray-400 bg-gray-50 line-clamp-3')
+        with ui.column().classes('p-8 w-full'):
+            with ui.row().classes('items-center gap-2 mb-2'):
+                ui.icon('dashboard', color='[#006db0]').classes('text-2xl')
+                ui.label('Notebook').classes('text-[#006db0] text-sm font-bold tracking-widest uppercase')
+                badge = status.badge(rel_path_in_repo(entry.path)) if status else None
+                if badge:
+                    ui.badge(badge, color=GIT_BADGE_COLORS.get(badge, 'grey')).props('outline')
+            # Metadata (title, description) comes from the in-memory index
+            meta = notebook_index.get(entry.path)
+            ui.label(meta.title if meta else item_label).classes('text-xl font-bold text-gray-700 capitalize')
+            
+            descr = meta.docstring if meta else None
+            ui.label(descr or "No description available.").classes('text-sm mb-6 text-gray-500 line-clamp-2 h-10')
+            # Standard slug: 'folder/name'
+            marimo_slug = str(rel_path).replace('.py', '').replace(os.sep, '/').strip('/')
+            next_uri = notebook_url(marimo_slug, meta, can_edit)
+            
+            with ui.row().classes('w-full justify-center mt-auto'):
+                # This wrapper defines the “middle” area and width budget for buttons
+                with ui.row().classes('w-full max-w-[360px] gap-2 flex-nowrap'):
+                    if can_edit:
+                        # 2 buttons, equal widths
+                        ui.button(
+                            'Launch',
+                            on_click=lambda u=next_uri: ui.navigate.to(u)
+                        ).classes('undp-btn primary text-white flex-1 w-1/2 capitalize') \
+                        .tooltip(f'View as interactive app at {next_uri}')
+
+                        ui.button(
+                            'Edit',
+                            on_click=lambda s=marimo_slug: ui.navigate.to(f'/edit/open/{s}')
+                        ).classes('undp-btn bg-[#006db0] text-white flex-1 w-1/2 capitalize') \
+                        .tooltip(f'Open in Editor mode (Spawns kernel) to /edit/open/{marimo_slug}')
+
+                    else:
+                        
+                        # 1 button, centered in the same max width wrapper
+                        ui.button(
+                            'Launch',
+                            on_click=lambda u=next_uri: ui.navigate.to(u)
+                        ).classes('undp-btn primary text-white justify w-[180px] capitalize') \
+                        .tooltip(f'View notebook at {next_uri}')
+
+
 @ui.page('/')
 @ui.page('/notebooks/{subpath:path}')
 async def notebook_explorer(request: Request, subpath: str = ""):
@@ -424,6 +885,8 @@ async def notebook_explorer(request: Request, subpath: str = ""):
 
     with ui.column().classes('w-full max-w-7xl mx-auto px-6 lg:px-8'):
         
+        notebook_search_box(can_edit=can_edit)
+        
         # 3. Breadcrumbs / "Back" Navigation
         if subpath:
             parent_path = Path(subpath).parent
@@ -434,85 +897,28 @@ async def notebook_explorer(request: Request, subpath: str = ""):
                 ui.icon('arrow_back', color='[#006db0]').classes('group-hover:-translate-x-1 transition-transform')
                 ui.label(f"Back to {parent_path if str(parent_path) != '.' else 'Root'}").classes('text-[#006db0] font-bold text-xs tracking-widest uppercase')
 
-        # 4. The Grid
-        with ui.grid(columns='1fr 1fr 1fr').classes('w-full gap-8'):
-            # Filter: No hidden files, no __init__.py
-            items = [
-                item for item in current_dir.iterdir() 
-                if not item.name.startswith('.') and item.name != "__init__.py"
-            ]
-            # Sort: Folders first, then files
-            items.sort(key=lambda x: (not x.is_dir(), x.name))
-            
-            for item in items:
-                
-                rel_path = item.relative_to(NOTEBOOKS_DIR)
-                name, _ = os.path.splitext(item.name)
-                item_label = name.replace('_', ' ')
-                
-                if item.is_dir():
-                    if '__' in item.name: continue
-                    # --- FOLDER CARD ---
-                    with ui.card().classes('undp-card p-0 overflow-hidden bg-white cursor-pointer hover:shadow-lg transition-shadow') \
-                        .on('click', lambda p=rel_path: ui.navigate.to(f'/notebooks/{p}')):
-                        ui.element('div').classes('w-full h-1 bg-[#006db0]')
-                        with ui.column().classes('p-8 w-full'):
-                            ui.icon('folder_shared', color='[#006db0]').classes('text-4xl mb-2')
-                            ui.label(item_label).classes('text-xl font-bold text-gray-700 capitalize')
-                            ui.label('Folder').classes('text-gray-400 text-[10px] tracking-widest uppercase font-bold')
-
-                elif item.suffix == '.py':
-                    # --- NOTEBOOK CARD ---
-                    with ui.card().classes('undp-card p-0 overflow-hidden bg-white'):
-                        # Green accent for notebooks
-                        ui.element('div').classes('w-full h-1 bg-green-500')
-                        with ui.column().classes('p-8 w-full'):
-                            with ui.row().classes('items-center gap-2 mb-2'):
-                                ui.icon('dashboard', color='[#006db0]').classes('text-2xl')
-                                ui.label('Notebook').classes('text-[#006db0] text-sm font-bold tracking-widest uppercase')
-                            ui.label(item_label).classes('text-xl font-bold text-gray-700 capitalize')
-                            
-                            # Fetch metadata (description) from the file
-                            descr = mu.get_global_metadata(str(item.absolute()))
-                            ui.label(descr or "No description available.").classes('text-sm mb-6 text-gray-500 line-clamp-2 h-10')
-                            # Standard slug: 'folder/name'
-                            marimo_slug = str(rel_path).replace('.py', '').replace(os.sep, '/').strip('/')
-                            
-                            # Calculate relative path jump to root (../../ etc)
-                            # This ensures links work regardless of folder depth
-                            depth = str(rel_path).count('/')
-                            r = "../" * (depth + 1)
-                            next_uri = f'/apps/{marimo_slug}'
-                            
-                            with ui.row().classes('w-full justify-center mt-auto'):
-                                # This wrapper defines the “middle” area and width budget for buttons
-                                with ui.row().classes('w-full max-w-[360px] gap-2 flex-nowrap'):
-                                    if can_edit:
-                                        # 2 buttons, equal widths
-                                        ui.button(
-                                            'Launch',
-                                            on_click=lambda s=marimo_slug, r=r: ui.navigate.to(next_uri)
-                                        ).classes('undp-btn primary text-white flex-1 w-1/2 capitalize') \
-                                        .tooltip(f'View as interactive app at {next_uri}')
-
-                                        ui.button(
-                                            'Edit',
-                                            on_click=lambda s=marimo_slug, r=r: ui.navigate.to(f'/edit/open/{s}')
-                                        ).classes('undp-btn bg-[#006db0] text-white flex-1 w-1/2 capitalize') \
-                                        .tooltip(f'Open in Editor mode (Spawns kernel) to /edit/open/{marimo_slug}')
-
-                                    else:
-                                        
-                                        # 1 button, centered in the same max width wrapper
-                                        ui.button(
-                                            'Launch',
-                                            on_click=lambda: ui.navigate.to(next_uri)
-                                        ).classes('undp-btn primary text-white justify w-[180px] capitalize') \
-                                        .tooltip(f'View as interactive app at {next_uri}')
-                                                        
-                            
-                            
-                           
+        # 4. The Grid: only the current page of cards is ever built
+        entries = await listing_cache.alist(current_dir)
+        # Git badges only matter to editors; one cached status serves every card
+        status = await status_for(auth_data) if can_edit else None
+        pages = max(1, math.ceil(len(entries) / EXPLORER_PAGE_SIZE))
+        grid = ui.grid(columns='1fr 1fr 1fr').classes('w-full gap-8')
+
+        def render_page(page: int):
+            grid.clear()
+            start = (page - 1) * EXPLORER_PAGE_SIZE
+            with grid:
+                for entry in entries[start:start + EXPLORER_PAGE_SIZE]:
+                    if entry.is_dir:
+                        folder_card(entry, status=status)
+                    else:
+                        notebook_card(entry, can_edit=can_edit, status=status)
+
+        render_page(1)
+        if pages > 1:
+            with ui.row().classes('w-full justify-center mt-8'):
+                ui.pagination(1, pages, direction_links=True, on_change=lambda e: render_page(e.value))
+
 
 @ui.page('/settings')
 async def settings(request: Request):
@@ -633,14 +1039,96 @@ async def sessions(request: Request):
 
 
 
-marimo_server = mu.get_marimo_runner(src=str(NOTEBOOKS_DIR), mount_point="/apps")
+# Built in the background on startup (or by the first /apps request);
+# run-mode sessions are capped (count + memory) by the governor
+apps_runner = LazyASGIApp(
+    lambda: mu.get_marimo_runner(src=str(NOTEBOOKS_DIR), mount_point="/apps"),
+    name="/apps runner",
+)
+marimo_server = SessionGovernor(apps_runner, mount_point="/apps")
 
 app.mount("/apps", marimo_server)
 
+
+def on_upstream_changes(changes):
+    """
+    Invalidates only the notebooks a fast-forward touched (the watcher may see
+    them too; both are idempotent). Runs in a worker thread, like the watcher's
+    subscribers, since it lists folders and reparses notebooks.
+    """
+    added = {p for s, p in changes if s == "A"}
+    dirs = set()
+    for status, path in changes:
+        if status != "M":
+            # The parent's listing changes; so do the ancestors' while the
+            # folder itself came or went with this change
+            parent = os.path.dirname(path)
+            while parent.startswith(str(NOTEBOOKS_DIR)):
+                dirs.add(parent)
+                if status == "D" and os.path.isdir(parent):
+                    break
+                if status == "A" and not all(
+                    os.path.join(parent, name) in added or os.path.isdir(os.path.join(parent, name))
+                    for name in os.listdir(parent)
+                ):
+                    break
+                parent = os.path.dirname(parent)
+        if not path.endswith(".py"):
+            continue
+        if status == "D":
+            notebook_index.remove(path)
+        else:
+            notebook_index.refresh(path)
+    for d in dirs:
+        listing_cache.invalidate(d)
+    git_status.invalidate()
+    evicted = mu.evict_apps(marimo_server, [p for _, p in changes])
+    logger.info(f"Upstream sync: {len(changes)} changed file(s), {evicted} /apps app(s) reloaded")
+
+
+upstream.subscribe(on_upstream_changes)
+# Content-addressed WASM bundles, built by the export pipeline
+app.mount(
+    "/wasm-bundles",
+    exports.ImmutableStaticFiles(directory=str(export_pipeline.store.root / "wasm"), html=True, check_dir=False),
+)
+# Preview images are named by content hash as well
+app.mount(
+    "/previews",
+    exports.ImmutableStaticFiles(directory=str(export_pipeline.store.root / "previews"), check_dir=False),
+)
+
+
+def check_startup():
+    """Background startup steps (session manager scan, /apps runner build) finished."""
+    if readiness.failed:
+        return False, f"failed: {readiness.failed}"
+    if readiness.pending:
+        return False, f"pending: {', '.join(readiness.pending)}"
+    return True, "complete"
+
+
+def check_apps_mount():
+    mounted = any(isinstance(r, Mount) and r.path == "/apps" and r.app is marimo_server for r in app.routes)
+    if not mounted:
+        return False, "/apps is not mounted"
+    if apps_runner.error:
+        return False, apps_runner.error
+    return apps_runner.ready.is_set(), "runner built" if apps_runner.ready.is_set() else "runner building"
+
+
+health.register("startup", check_startup)
+health.register("apps", check_apps_mount)
+health.register("notebooks_dir", check_directory(str(NOTEBOOKS_DIR)))
+# The auth proxy only gates readiness when CAREATLAS_AUTH_PING_URL is set;
+# a ping URL derived from AUTH_URL is a guess and stays informational
+health.register("auth", check_auth_proxy, critical=AUTH_PING_EXPLICIT)
+health.register("upstream", lambda: (upstream.last_error is None, upstream.last_error or upstream.skipped or "in sync"), critical=False)
+health.register("notebook_index", lambda: (notebook_index.ready.is_set(), f"{len(notebook_index.entries())} notebooks"), critical=False)
+
 ui.run_with(
     app, 
     storage_secret=os.getenv("NICEGUI_STORAGE_SECRET"),
     title="UNDP CareAtlas",
 )
-
-
+profile.mark("server module loaded")
@@ -0,0 +1,168 @@
+import re
+import sys
+import time
+import asyncio
+import logging
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from starlette.responses import HTMLResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfile:
+    """
+    Wall-clock timings of the host's startup phases, measured from the moment
+    this module was imported (the first thing careatlas.app.server does).
+    """
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.marks: Dict[str, float] = {}
+
+    def mark(self, name: str) -> None:
+        """Seconds since t0 at which `name` happened."""
+        self.marks[name] = round(time.perf_counter() - self.t0, 3)
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.perf_counter() - start, 3)
+            logger.info(f"Startup phase '{name}' took {self.phases[name]:.3f}s")
+
+    def report(self) -> dict:
+        return {"phases": dict(self.phases), "marks": dict(self.marks)}
+
+
+profile = StartupProfile()
+
+
+class ReadinessGate:
+    """
+    Names of the startup steps that still run in the background. The host
+    serves requests as soon as the port is bound; the gate tells probes when
+    the heavy initialisation has caught up.
+    """
+
+    def __init__(self, *components: str):
+        self._pending = set(components)
+        self.failed: Dict[str, str] = {}
+
+    def done(self, component: str) -> None:
+        self._pending.discard(component)
+        profile.mark(f"{component} ready")
+
+    def fail(self, component: str, error: str) -> None:
+        self._pending.discard(component)
+        self.failed[component] = error
+
+    @property
+    def pending(self) -> List[str]:
+        return sorted(self._pending)
+
+    @property
+    def is_ready(self) -> bool:
+        return not self._pending and not self.failed
+
+    async def run(self, component: str, coro) -> None:
+        """Awaits a startup coroutine and records its outcome."""
+        try:
+            await coro
+            self.done(component)
+        except Exception as e:
+            logger.error(f"Startup step {component} failed: {e}")
+            self.fail(component, str(e))
+
+
+class LazyASGIApp:
+    """
+    Defers building an expensive ASGI app (the marimo /apps runner) until
+    `warm_up()` runs in the background or the first request needs it, so the
+    host can bind its port without paying for it.
+    """
+
+    def __init__(self, factory: Callable[[], ASGIApp], name: str):
+        self._factory = factory
+        self.name = name
+        self._app: Optional[ASGIApp] = None
+        self._lock = threading.Lock()
+        self.ready = threading.Event()
+        self.error: Optional[str] = None
+
+    @property
+    def app(self) -> Optional[ASGIApp]:
+        """The built app, or None before warm-up."""
+        return self._app
+
+    def build(self) -> ASGIApp:
+        with self._lock:
+            if self._app is None:
+                try:
+                    with profile.phase(f"build {self.name}"):
+                        self._app = self._factory()
+                    self.error = None
+                except Exception as e:
+                    self.error = str(e)
+                    raise
+                self.ready.set()
+        return self._app
+
+    async def warm_up(self) -> None:
+        await asyncio.to_thread(self.build)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        app = self._app
+        if app is None:
+            try:
+                # Requests that arrive during warm-up wait for the same build
+                app = await asyncio.to_thread(self.build)
+            except Exception:
+                if scope["type"] == "websocket":
+                    await send({"type": "websocket.close", "code": 1011})
+                    return
+                response = HTMLResponse(f"{self.name} is unavailable", status_code=503, headers={"Retry-After": "10"})
+                await response(scope, receive, send)
+                return
+        await app(scope, receive, send)
+
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_profile(module: str = "careatlas.app.server") -> List[Tuple[str, float]]:
+    """
+    Runs `python -X importtime -c 'import <module>'` in a fresh interpreter
+    and returns self time per top-level package in seconds, largest first.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    totals: Dict[str, float] = {}
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        self_us, _, _, name = match.groups()
+        top = name.split(".")[0]
+        totals[top] = totals.get(top, 0.0) + int(self_us) / 1e6
+    return sorted(totals.items(), key=lambda kv: -kv[1])
+
+
+if __name__ == "__main__":
+    # python -m careatlas.app.startup [module]
+    target = sys.argv[1] if len(sys.argv) > 1 else "careatlas.app.server"
+    rows = import_profile(target)
+    total = sum(t for _, t in rows)
+    print(f"Import of {target}: {total:.2f}s")
+    for name, seconds in rows[:30]:
+        print(f"  {name:<30} {seconds:7.3f}s  {100 * seconds / total:5.1f}%")
@@ -0,0 +1,152 @@
+import os
+import time
+import asyncio
+import logging
+import subprocess
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from careatlas.app.worktrees import SYNC_BRANCH, GitLock, auth_config
+
+logger = logging.getLogger(__name__)
+
+FETCH_INTERVAL = int(os.getenv("CAREATLAS_FETCH_INTERVAL", "60"))
+
+# (status, absolute path); status is "A", "M" or "D" (renames come as D + A)
+Change = Tuple[str, str]
+
+
+class UpstreamSync:
+    """
+    Background fetcher for the host's checkout. Every interval it fetches the
+    sync branch (blob-less when the checkout is a partial clone), and when the
+    checkout can fast-forward it does so and tells subscribers exactly which
+    notebook files were added, modified or deleted, so they can invalidate
+    just those entries.
+
+    Nothing is forced: local commits, local edits to incoming files, or
+    incoming changes outside the notebooks tree (code the running host could
+    not reload) make it skip the merge and try again later.
+    """
+
+    def __init__(self, notebooks_dir: str, branch: str = SYNC_BRANCH, interval: int = FETCH_INTERVAL):
+        self.notebooks_dir = str(notebooks_dir)
+        self.branch = branch
+        self.interval = interval
+        self.toplevel: Optional[str] = None
+        self._partial: Optional[bool] = None
+        self._git_dir: Optional[str] = None
+        # Shared with the kernels' sync queues (see GitLock)
+        self.git_lock = GitLock(lambda: self._git_dir)
+        self._listeners: List[Callable[[List[Change]], None]] = []
+        self.last_fetch: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_changes: List[Change] = []
+        self.skipped: Optional[str] = None
+
+    def subscribe(self, listener: Callable[[List[Change]], None]) -> None:
+        """`listener(changes)` is called from a worker thread, never on the event loop."""
+        self._listeners.append(listener)
+
+    def _git(self, *args: str, check: bool = True) -> subprocess.CompletedProcess:
+        config = auth_config()
+        auth = ["-c", config] if config else []
+        return subprocess.run(
+            ["git", "-C", self.toplevel or self.notebooks_dir, *auth, *args],
+            check=check,
+            capture_output=True,
+            text=True,
+        )
+
+    def _rev(self, ref: str) -> str:
+        return self._git("rev-parse", "--verify", "--quiet", ref).stdout.strip()
+
+    def fetch(self) -> None:
+        if self.toplevel is None:
+            self.toplevel = self._git("rev-parse", "--show-toplevel").stdout.strip()
+            self._git_dir = self._git("rev-parse", "--absolute-git-dir").stdout.strip()
+            self._partial = bool(self._git("config", "--get", "remote.origin.partialclonefilter", check=False).stdout.strip())
+        args = ["fetch", "--quiet", "--no-tags", "origin", self.branch]
+        if self._partial:
+            # Only commits and trees come down; blobs on checkout
+            args.insert(1, "--filter=blob:none")
+        self._git(*args)
+        self.last_fetch = time.time()
+
+    def changed_paths(self, old: str, new: str) -> List[Change]:
+        scope = os.path.relpath(self.notebooks_dir, self.toplevel)
+        out = self._git("diff", "--name-status", "--no-renames", "-z", old, new, "--", scope).stdout
+        parts = [p for p in out.split("\0") if p]
+        return [
+            (status[0], str(Path(self.toplevel) / path))
+            for status, path in zip(parts[0::2], parts[1::2])
+        ]
+
+    def sync_once(self) -> List[Change]:
+        """Fetch and, when safe, fast-forward; returns the notebook changes applied."""
+        self.fetch()
+        head, upstream = self._rev("HEAD"), self._rev(f"origin/{self.branch}")
+        if not upstream or head == upstream:
+            self.skipped = None
+            return []
+
+        if self._git("merge-base", "--is-ancestor", "HEAD", upstream, check=False).returncode != 0:
+            # The checkout has commits of its own; a fast-forward is impossible
+            self.skipped = "local commits"
+            logger.warning(f"Upstream sync skipped: HEAD has diverged from origin/{self.branch}")
+            return []
+
+        scope = os.path.relpath(self.notebooks_dir, self.toplevel)
+        incoming = self._git("diff", "--name-only", "-z", head, upstream).stdout.split("\0")
+        if any(p and not (scope == "." or p.startswith(f"{scope}/")) for p in incoming):
+            # A fast-forward would swap code under the running host; that takes a redeploy
+            self.skipped = "non-notebook changes"
+            logger.warning(f"Upstream sync skipped: origin/{self.branch} changes files outside {scope}")
+            return []
+
+        changes = self.changed_paths(head, upstream)
+        with self.git_lock:
+            merge = self._git("merge", "--ff-only", "--quiet", upstream, check=False)
+        if merge.returncode != 0:
+            # e.g. an incoming file has local modifications
+            self.skipped = merge.stderr.strip() or "merge refused"
+            logger.warning(f"Upstream sync skipped: {self.skipped}")
+            return []
+
+        self.skipped = None
+        self.last_changes = changes
+        logger.info(f"Fast-forwarded to {upstream[:8]}: {len(changes)} notebook file(s) changed")
+        return changes
+
+    def _notify(self, changes: List[Change]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                logger.error(f"Upstream change listener failed: {e}")
+
+    async def run(self) -> None:
+        """Background task: fetch every interval, off the event loop."""
+        while True:
+            try:
+                changes = await asyncio.to_thread(self.sync_once)
+                self.last_error = None
+                if changes:
+                    # Listeners list folders and reparse notebooks; keep that off the loop
+                    await asyncio.to_thread(self._notify, changes)
+            except subprocess.CalledProcessError as e:
+                self.last_error = (e.stderr or str(e)).strip()
+                logger.warning(f"Upstream fetch failed: {self.last_error}")
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Upstream sync failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def status(self) -> dict:
+        return {
+            "branch": self.branch,
+            "last_fetch": self.last_fetch,
+            "last_error": self.last_error,
+            "skipped": self.skipped,
+            "last_changes": [{"status": s, "path": p} for s, p in self.last_changes],
+        }
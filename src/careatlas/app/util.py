@@ -10,8 +10,10 @@ import httpx
 import asyncio
 from dataclasses import replace
 import psutil, os, signal
+import shutil
 import os
 from typing import Optional
+from careatlas.app.worktrees import WorktreeManager, identity_slug
 
 logger = logging.getLogger("marimo-manager")
 
@@ -22,6 +24,9 @@ class MarimoSession:
     proc: subprocess.Popen
     base_url: str
     notebook_path: str
+    # Per-user git worktree the kernel runs in (None: main checkout)
+    workdir: Optional[str] = None
+    owner: Optional[str] = None
     # State - mutable for performance
     last_activity: float = field(default_factory=time.time)
     started_at: float = field(default_factory=time.time)
@@ -101,8 +106,9 @@ class MarimoProcessWrapper:
 
         
 class MarimoManager:
-    def __init__(self):
+    def __init__(self, worktrees: Optional[WorktreeManager] = None):
         self._sessions: Dict[str, MarimoSession] = {}
+        self.worktrees = worktrees or WorktreeManager()
     
     async def startup(self):
         """
@@ -146,20 +152,35 @@ class MarimoManager:
         nb_path = Path(notebook).resolve()
         if not nb_path.exists():
             raise FileNotFoundError(f"Notebook not found at {nb_path}")
+        env = os.environ.copy()
+        run_path, workdir, owner = nb_path, None, None
         if identity:
-            env = os.environ.copy()
             # These variables will be picked up by Git inside the Marimo terminal/notebook
             env["GIT_AUTHOR_NAME"] = identity["user"]
             env["GIT_AUTHOR_EMAIL"] = identity["email"]
             env["GIT_COMMITTER_NAME"] = identity["user"]
             env["GIT_COMMITTER_EMAIL"] = identity["email"]
+            # Each editor works in an own worktree, so their commits, rebases
+            # and resets run in parallel with everyone else's
+            try:
+                worktree = self.worktrees.ensure(identity["email"])
+                run_path = self.worktrees.to_worktree(str(nb_path), identity["email"])
+                workdir, owner = str(worktree), identity_slug(identity["email"])
+                env["CAREATLAS_REPO"] = workdir
+                if not run_path.exists():
+                    # Not committed yet in the user's branch (new or untracked notebook)
+                    run_path.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.copy2(nb_path, run_path)
+            except (subprocess.CalledProcessError, OSError, ValueError) as e:
+                logger.error(f"No worktree for {identity['email']}, using the main checkout: {e}")
+                run_path = nb_path
 
         port = self._get_free_port()
         base_url = f"{base_prefix}/{session_id}"
         logger.info(f'Creating marimo svc at {base_url}')
         # Command construction
         cmd = [
-            "marimo", "edit", str(nb_path),
+            "marimo", "edit", str(run_path),
             "--host", "0.0.0.0",
             "--port", str(port),
             "--base-url", base_url,
@@ -178,7 +199,8 @@ class MarimoManager:
             stdout=subprocess.DEVNULL, # Keep logs clean, or redirect to file
             stderr=subprocess.PIPE,
             text=True,
-            env=env
+            env=env,
+            cwd=str(run_path.parent),
         )
 
         # Polling for readiness
@@ -196,7 +218,9 @@ class MarimoManager:
                     port=port,
                     proc=proc,
                     base_url=base_url,
-                    notebook_path=str(nb_path)
+                    notebook_path=str(nb_path),
+                    workdir=workdir,
+                    owner=owner,
                 )
                 self._sessions[session_id] = session
                 return session
@@ -206,6 +230,14 @@ class MarimoManager:
         self.stop_session(session_id, proc_override=proc)
         raise TimeoutError(f"Marimo failed to start within {timeout}s")
 
+    def find_session(self, notebook: str, identity: Optional[dict] = None) -> Optional[MarimoSession]:
+        """An existing session of `identity` on `notebook` (main-checkout path)."""
+        owner = identity_slug(identity["email"]) if identity else None
+        return next(
+            (s for s in self._sessions.values() if s.notebook_path == str(notebook) and s.owner == owner),
+            None,
+        )
+
     # def stop_session(self, session_id: str, proc_override: Optional[subprocess.Popen] = None) -> None:
     #     """Gracefully stops a session and cleans up resources."""
     #     session = self._sessions.pop(session_id, None)
@@ -358,6 +390,13 @@ class MarimoManager:
                 
                 # Grab the notebook path (Index 3 based on your ps aux)
                 notebook_path = cmdline[3]
+                # Kernels in a per-user worktree map back to the main checkout
+                workdir = owner = None
+                source = self.worktrees.to_source(notebook_path)
+                if source is not None:
+                    owner = self.worktrees.owner_slug(notebook_path)
+                    workdir = str(self.worktrees.root / owner)
+                    notebook_path = str(source)
                 try:
                     port = int(cmdline[cmdline.index('--port') + 1])
                     base_url = cmdline[cmdline.index('--base-url') + 1]
@@ -374,7 +413,9 @@ class MarimoManager:
                         # Adopt the existing OS process using its PID
                         proc=MarimoProcessWrapper(p.info['pid']),
                         base_url=base_url,
-                        notebook_path=notebook_path
+                        notebook_path=notebook_path,
+                        workdir=workdir,
+                        owner=owner,
                     )
                     self._sessions[session_id] = session
                     logger.info(f"Recovered session {session_id} on port {port} (PID {p.info['pid']})")
@@ -0,0 +1,144 @@
+import os
+import re
+import fcntl
+import base64
+import hashlib
+import logging
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = Path(os.getenv("CAREATLAS_REPO", "/server"))
+# Outside the main worktree so watchers and `git status` there never see it
+WORKTREE_DIR = Path(os.getenv("CAREATLAS_WORKTREE_DIR", Path(tempfile.gettempdir()) / "careatlas-worktrees"))
+BRANCH_PREFIX = "careatlas-edit"
+# Every worktree syncs its own branch against this remote branch
+SYNC_BRANCH = os.getenv("CAREATLAS_SYNC_BRANCH", "main")
+
+
+def auth_config() -> Optional[str]:
+    """
+    `git -c` value that authenticates https remotes with the PAT, so the
+    token never has to be written into .git/config.
+    """
+    token = os.environ.get("GITHUB_PAT_TOKEN")
+    if not token:
+        return None
+    basic = base64.b64encode(f"x-access-token:{token}".encode()).decode()
+    return f"http.extraHeader=Authorization: Basic {basic}"
+
+
+def identity_slug(email: str) -> str:
+    """Filesystem- and ref-safe name for an editing identity."""
+    local = re.sub(r"[^a-z0-9]+", "-", email.lower().split("@")[0]).strip("-") or "user"
+    return f"{local[:32]}-{hashlib.sha1(email.lower().encode()).hexdigest()[:8]}"
+
+
+class GitLock:
+    """
+    Serialises git operations on one checkout across threads and across
+    processes: the host's upstream sync and every kernel's sync queue take
+    an flock next to that checkout's index.
+    """
+
+    def __init__(self, git_dir: Callable[[], Optional[str]]):
+        self._git_dir = git_dir
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self) -> "GitLock":
+        self._thread_lock.acquire()
+        try:
+            git_dir = self._git_dir()
+            if git_dir:
+                self._file = open(os.path.join(git_dir, "careatlas-sync.lock"), "w")
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+        except BaseException:
+            self._release()
+            raise
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._release()
+
+    def _release(self) -> None:
+        if self._file is not None:
+            # Closing drops the flock
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+
+class WorktreeManager:
+    """
+    One `git worktree` per editing identity, all sharing the object store of
+    the main checkout. Each worktree has its own index, HEAD and branch, so
+    commits, rebases and resets of different users never touch each other's
+    files or contend on the same index.lock.
+    """
+
+    def __init__(self, repo_root: Path = REPO_ROOT, root: Path = WORKTREE_DIR):
+        self.repo_root = Path(repo_root).resolve()
+        self.root = Path(root)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock(self, slug: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(slug, threading.Lock())
+
+    def _git(self, *args: str) -> str:
+        return subprocess.run(
+            ["git", "-C", str(self.repo_root), *args],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+
+    def path_for(self, email: str) -> Path:
+        return self.root / identity_slug(email)
+
+    def ensure(self, email: str) -> Path:
+        """Returns the worktree of `email`, creating it from the main checkout's HEAD the first time."""
+        slug = identity_slug(email)
+        path = self.root / slug
+        with self._lock(slug):
+            if (path / ".git").exists():
+                return path
+            self.root.mkdir(parents=True, exist_ok=True)
+            # Forget worktrees whose directories are gone (e.g. tmp was cleared)
+            self._git("worktree", "prune")
+            branch = f"{BRANCH_PREFIX}/{slug}"
+            exists = subprocess.run(
+                ["git", "-C", str(self.repo_root), "show-ref", "--verify", "--quiet", f"refs/heads/{branch}"]
+            ).returncode == 0
+            if exists:
+                # Keep commits that were made but not pushed before the directory went away
+                self._git("worktree", "add", str(path), branch)
+            else:
+                self._git("worktree", "add", "-b", branch, str(path), "HEAD")
+            logger.info(f"Created worktree {path} on {branch}")
+        return path
+
+    def to_worktree(self, path: str, email: str) -> Path:
+        """Maps a path in the main checkout to the same file in the user's worktree."""
+        rel = Path(path).resolve().relative_to(self.repo_root)
+        return self.path_for(email) / rel
+
+    def to_source(self, path: str) -> Optional[Path]:
+        """Maps a worktree path back to the main checkout; None if it isn't in a worktree."""
+        try:
+            rel = Path(path).resolve().relative_to(self.root.resolve())
+        except ValueError:
+            return None
+        return self.repo_root.joinpath(*rel.parts[1:])
+
+    def owner_slug(self, path: str) -> Optional[str]:
+        try:
+            return Path(path).resolve().relative_to(self.root.resolve()).parts[0]
+        except (ValueError, IndexError):
+            return None
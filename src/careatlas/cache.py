@@ -0,0 +1,195 @@
+"""
+Platform-wide persistent result cache for notebooks.
+
+Wraps marimo's `persistent_cache` with a store that lives in one directory
+shared by every kernel on the pod (edit sessions and /apps run sessions), so
+the first viewer pays for an expensive cell and everybody after restores the
+result from disk. marimo keys entries by the cell code and its inputs.
+
+    from careatlas.cache import shared_cache
+
+    cache = shared_cache()
+
+    with cache("poverty-layers"):
+        layers = load_layers()
+
+    @cache
+    def admin_boundaries(level: int): ...
+"""
+import os
+import time
+import functools
+import fcntl
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+import marimo as mo
+# marimo does not re-export its store classes; FileStore is the disk backend
+# behind `mo.persistent_cache(save_path=...)`.
+from marimo._save.stores.file import FileStore
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv("CAREATLAS_CACHE_DIR", Path(tempfile.gettempdir()) / "careatlas-cache"))
+CACHE_MAX_BYTES = int(os.getenv("CAREATLAS_CACHE_MAX_BYTES", str(4 * 1024**3)))
+# Evict down to this fraction of the budget so we don't evict on every put
+EVICT_TARGET = 0.9
+# Other kernels write to the same directory; re-measure it at least this often
+RESCAN_INTERVAL = 60.0
+
+
+class SharedFileStore(FileStore):
+    """
+    marimo FileStore with size-based LRU eviction and hit/miss counters.
+    Recency is the file mtime, bumped on every read, so all processes
+    sharing the directory see the same LRU order. Entries are written to a
+    temp file and renamed into place, so another kernel never reads half a
+    pickle. Each process keeps a running size estimate and only walks the
+    directory when that is over budget or older than RESCAN_INTERVAL.
+    """
+
+    def __init__(self, save_path: Union[str, Path] = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        super().__init__(str(save_path))
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+        self._scanned_at = 0.0
+
+    def hit(self, key: str) -> bool:
+        found = super().hit(key)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def get(self, key: str) -> Optional[bytes]:
+        blob = super().get(key)
+        if blob is not None:
+            try:
+                os.utime(self.save_path / key)
+            except OSError:
+                pass
+        return blob
+
+    def put(self, key: str, value: bytes) -> bool:
+        path = self.save_path / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Dot-prefixed, so _entries and eviction ignore it while it's written
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(value)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        with self._lock:
+            stale = self._size is None or time.time() - self._scanned_at > RESCAN_INTERVAL
+            if not stale:
+                self._size += len(value)
+            over = stale or self._size > self.max_bytes
+        if over:
+            self.evict()
+        return True
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.save_path):
+            for name in filenames:
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def usage(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _measured(self, total: int) -> None:
+        with self._lock:
+            self._size, self._scanned_at = total, time.time()
+
+    def evict(self) -> int:
+        """Deletes least recently used entries until the directory fits the budget."""
+        if not self.save_path.exists():
+            return 0
+        lock_path = self.save_path / ".evict.lock"
+        with open(lock_path, "w") as lock:
+            try:
+                # Another kernel is already evicting
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+
+            entries = list(self._entries())
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                self._measured(total)
+                return 0
+
+            removed = 0
+            target = self.max_bytes * EVICT_TARGET
+            for path, size, _ in sorted(entries, key=lambda e: e[2]):
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+
+        self._measured(total)
+        with self._lock:
+            self.evictions += removed
+        logger.info(f"Shared cache evicted {removed} entries ({total / 1024**2:.0f} MiB left)")
+        return removed
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "path": str(self.save_path),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "bytes": self.usage(),
+            "max_bytes": self.max_bytes,
+            "time": time.time(),
+        }
+
+
+_store: Optional[SharedFileStore] = None
+
+
+def get_store() -> SharedFileStore:
+    """One store per process so the counters cover every cached cell."""
+    global _store
+    if _store is None:
+        _store = SharedFileStore()
+    return _store
+
+
+def shared_cache(method: str = "pickle", pin_modules: bool = False) -> Callable:
+    """
+    `mo.persistent_cache` bound to the shared store; use the result exactly
+    like it (a context manager with a name, or a function decorator). It is
+    a partial rather than a wrapper because marimo reads the variables of
+    the frame that calls it, which has to be the cell's.
+    """
+    return functools.partial(mo.persistent_cache, method=method, store=get_store(), pin_modules=pin_modules)
+
+
+def cache_stats() -> dict:
+    """Hit/miss counters of this kernel plus the size of the shared directory."""
+    return get_store().stats()
@@ -0,0 +1,350 @@
+"""
+Dataset catalog: what exists, how big it is, and a local copy on demand.
+
+The manifest (CATALOG_MANIFEST, JSON) lists every dataset:
+
+    {"datasets": [
+        {"name": "admin2", "version": "2024.1", "path": "boundaries/admin2.parquet",
+         "format": "geoparquet", "size": 48213120, "sha256": "…", "prefetch": true}
+    ]}
+
+`path` is relative to the mirror (CATALOG_MIRROR), which is either a local
+directory (fully offline) or an http(s) base URL. Datasets are copied into
+DATASET_CACHE_DIR as `<name>/<version>/<file>`, checked against their sha256,
+and evicted least recently resolved first when the cache is over budget;
+a version being fetched or resolved at that moment is never evicted.
+The host prefetches the `prefetch` entries in the background, so they are on
+disk before anybody opens a notebook.
+
+    from careatlas.data.catalog import resolve
+
+    admin2 = read_geoparquet(resolve("admin2"), columns=["name"])
+"""
+import os
+import json
+import time
+import fcntl
+import shutil
+import asyncio
+import hashlib
+import logging
+import tempfile
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+CATALOG_MANIFEST = os.getenv("CAREATLAS_CATALOG", "/server/data/catalog.json")
+CATALOG_MIRROR = os.getenv("CAREATLAS_CATALOG_MIRROR", "/server/data")
+DATASET_CACHE_DIR = Path(os.getenv("CAREATLAS_DATASET_CACHE_DIR", Path(tempfile.gettempdir()) / "careatlas-datasets"))
+DATASET_CACHE_MAX_BYTES = int(os.getenv("CAREATLAS_DATASET_CACHE_MAX_BYTES", str(20 * 1024**3)))
+PREFETCH_INTERVAL = int(os.getenv("CAREATLAS_PREFETCH_INTERVAL", "600"))
+CHUNK = 1024 * 1024
+# Written next to a copy once its checksum has been verified
+VERIFIED = ".verified"
+
+
+class ChecksumError(RuntimeError):
+    pass
+
+
+@dataclass
+class DatasetEntry:
+    name: str
+    version: str
+    path: str
+    format: str = ""
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+    prefetch: bool = False
+    description: str = ""
+    extra: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DatasetEntry":
+        known = {k: data[k] for k in cls.__dataclass_fields__ if k in data and k != "extra"}
+        return cls(**known, extra={k: v for k, v in data.items() if k not in known})
+
+    @property
+    def filename(self) -> str:
+        return Path(urlparse(self.path).path).name
+
+
+def _is_url(location: str) -> bool:
+    return urlparse(location).scheme in ("http", "https")
+
+
+def _read_location(location: str) -> bytes:
+    if _is_url(location):
+        import httpx
+
+        response = httpx.get(location, timeout=30, follow_redirects=True)
+        response.raise_for_status()
+        return response.content
+    return Path(location.removeprefix("file://")).read_bytes()
+
+
+class Catalog:
+    """The manifest plus a local, size-bounded cache of the datasets it lists."""
+
+    def __init__(
+        self,
+        manifest: str = CATALOG_MANIFEST,
+        mirror: str = CATALOG_MIRROR,
+        cache_dir: Path = DATASET_CACHE_DIR,
+        max_bytes: int = DATASET_CACHE_MAX_BYTES,
+    ):
+        self.manifest = manifest
+        self.mirror = mirror
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.entries: Dict[str, DatasetEntry] = {}
+        self.loaded_at: Optional[float] = None
+        self._manifest_mtime: Optional[int] = None
+        self.last_error: Optional[str] = None
+        self.evictions = 0
+
+    # --- manifest ---
+
+    def _mtime(self) -> Optional[int]:
+        if _is_url(self.manifest):
+            return None
+        try:
+            return os.stat(self.manifest.removeprefix("file://")).st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self) -> Dict[str, DatasetEntry]:
+        """(Re)reads the manifest; a missing or broken one leaves the previous entries in place."""
+        # Taken before reading, so a write in between is picked up next time
+        mtime = self._mtime()
+        try:
+            data = json.loads(_read_location(self.manifest))
+        except Exception as e:
+            self.last_error = f"Catalog manifest {self.manifest}: {e}"
+            logger.warning(self.last_error)
+            return self.entries
+        self.entries = {d["name"]: DatasetEntry.from_dict(d) for d in data.get("datasets", [])}
+        self.loaded_at = time.time()
+        self._manifest_mtime = mtime
+        self.last_error = None
+        return self.entries
+
+    def get(self, name: str) -> DatasetEntry:
+        # A local manifest is re-read as soon as it changes; remote ones by the prefetch loop
+        if self.loaded_at is None or self._mtime() != self._manifest_mtime:
+            self.load()
+        try:
+            return self.entries[name]
+        except KeyError:
+            raise KeyError(f"Dataset {name!r} is not in the catalog ({self.manifest})") from None
+
+    # --- local copies ---
+
+    def local_path(self, entry: DatasetEntry) -> Path:
+        return self.cache_dir / entry.name / entry.version / entry.filename
+
+    def _lock(self, name: str, version: str):
+        """
+        Lock file of one dataset version. Kept outside the version's folder so
+        eviction doesn't delete it from under a process waiting on it.
+        """
+        path = self.cache_dir / ".locks" / name / f"{version}.lock"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return open(path, "w")
+
+    def is_cached(self, entry: DatasetEntry) -> bool:
+        return (self.local_path(entry).parent / VERIFIED).exists()
+
+    def _source(self, entry: DatasetEntry) -> str:
+        if _is_url(entry.path) or os.path.isabs(entry.path):
+            return entry.path
+        if _is_url(self.mirror):
+            return f"{self.mirror.rstrip('/')}/{entry.path}"
+        return str(Path(self.mirror.removeprefix("file://")) / entry.path)
+
+    def _download(self, entry: DatasetEntry, target: Path) -> None:
+        """Copies the dataset to `target` while hashing it; verifies size and checksum."""
+        source = self._source(entry)
+        digest = hashlib.sha256()
+        size = 0
+        with open(target, "wb") as out:
+            if _is_url(source):
+                import httpx
+
+                with httpx.stream("GET", source, timeout=60, follow_redirects=True) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_bytes(CHUNK):
+                        digest.update(chunk)
+                        out.write(chunk)
+                        size += len(chunk)
+            else:
+                with open(source, "rb") as src:
+                    while chunk := src.read(CHUNK):
+                        digest.update(chunk)
+                        out.write(chunk)
+                        size += len(chunk)
+        if entry.size is not None and size != entry.size:
+            raise ChecksumError(f"{entry.name}: expected {entry.size} bytes, got {size}")
+        if entry.sha256 and digest.hexdigest() != entry.sha256.lower():
+            raise ChecksumError(f"{entry.name}: sha256 mismatch")
+
+    def fetch(self, entry: DatasetEntry, download: bool = True) -> Path:
+        """
+        The verified local copy of `entry`, copying it from the mirror first
+        if needed, and marked as just used for the LRU. With `download=False`
+        a version that isn't cached raises FileNotFoundError instead.
+        """
+        target = self.local_path(entry)
+        marker = target.parent / VERIFIED
+        with self._lock(entry.name, entry.version) as lock:
+            # Shared while checking and touching: evict skips locked versions
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            if self.is_cached(entry):
+                os.utime(marker)
+                return target
+            if not download:
+                raise FileNotFoundError(f"Dataset {entry.name} {entry.version} is not cached")
+            # One copy per dataset version across kernels and the host's prefetcher
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self.is_cached(entry):
+                os.utime(marker)
+                return target
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if entry.size:
+                self.evict(reserve=entry.size)
+            tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+            try:
+                self._download(entry, tmp)
+                os.replace(tmp, target)
+            finally:
+                if tmp.exists():
+                    tmp.unlink()
+            marker.write_text(json.dumps({"sha256": entry.sha256, "at": time.time()}))
+        logger.info(f"Cached dataset {entry.name} {entry.version} ({target.stat().st_size / 1024**2:.1f} MiB)")
+        return target
+
+    def resolve(self, name: str, version: Optional[str] = None) -> Path:
+        """
+        Local path of dataset `name`, fetched on first use. `version` pins a
+        version other than the manifest's, which must already be cached.
+        """
+        entry = self.get(name)
+        if version is not None and version != entry.version:
+            pinned = replace(entry, version=version, sha256=None, size=None)
+            try:
+                # Checked under the version's lock, so an eviction in between
+                # can't turn this into a download of the manifest's file
+                return self.fetch(pinned, download=False)
+            except FileNotFoundError:
+                raise KeyError(f"Dataset {name!r} version {version!r} is not cached and the catalog lists {entry.version!r}") from None
+        return self.fetch(entry)
+
+    # --- budget ---
+
+    def _cached_versions(self) -> List[dict]:
+        versions = []
+        for marker in self.cache_dir.glob(f"*/*/{VERIFIED}"):
+            folder = marker.parent
+            try:
+                size = sum(p.stat().st_size for p in folder.iterdir() if p.is_file())
+                last_used = marker.stat().st_mtime
+            except OSError:
+                continue
+            versions.append({"name": folder.parent.name, "version": folder.name, "bytes": size, "last_used": last_used, "dir": folder})
+        return versions
+
+    def evict(self, reserve: int = 0) -> int:
+        """
+        Removes least recently resolved versions until `reserve` more bytes fit
+        in the budget, skipping versions another process is fetching or resolving.
+        """
+        versions = self._cached_versions()
+        total = sum(v["bytes"] for v in versions)
+        removed = 0
+        for v in sorted(versions, key=lambda v: v["last_used"]):
+            if total + reserve <= self.max_bytes:
+                break
+            with self._lock(v["name"], v["version"]) as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                # Unverified first, so nobody takes a half-deleted folder for a copy
+                (v["dir"] / VERIFIED).unlink(missing_ok=True)
+                shutil.rmtree(v["dir"], ignore_errors=True)
+            total -= v["bytes"]
+            removed += 1
+            logger.info(f"Evicted dataset {v['name']} {v['version']} from the local cache")
+        self.evictions += removed
+        return removed
+
+    # --- host side ---
+
+    def prefetch(self) -> List[str]:
+        """Fetches every `prefetch` entry that is missing and fits the budget; returns their names."""
+        self.load()
+        fetched = []
+        for entry in self.entries.values():
+            if not entry.prefetch or self.is_cached(entry):
+                continue
+            if entry.size and entry.size > self.max_bytes:
+                logger.warning(f"Not prefetching {entry.name}: larger than the dataset cache budget")
+                continue
+            try:
+                self.fetch(entry)
+                fetched.append(entry.name)
+            except Exception as e:
+                logger.error(f"Prefetching {entry.name} failed: {e}")
+        return fetched
+
+    async def run(self, interval: int = PREFETCH_INTERVAL) -> None:
+        """Background task: re-read the manifest and prefetch, off the event loop."""
+        while True:
+            try:
+                await asyncio.to_thread(self.prefetch)
+            except Exception as e:
+                logger.error(f"Dataset prefetch failed: {e}")
+            await asyncio.sleep(interval)
+
+    def status(self) -> dict:
+        cached = {(v["name"], v["version"]): v for v in self._cached_versions()}
+        return {
+            "manifest": self.manifest,
+            "mirror": self.mirror,
+            "cache_dir": str(self.cache_dir),
+            "max_bytes": self.max_bytes,
+            "bytes": sum(v["bytes"] for v in cached.values()),
+            "evictions": self.evictions,
+            "last_error": self.last_error,
+            "datasets": [
+                {
+                    "name": e.name,
+                    "version": e.version,
+                    "format": e.format,
+                    "size": e.size,
+                    "prefetch": e.prefetch,
+                    "cached": (e.name, e.version) in cached,
+                    "description": e.description,
+                }
+                for e in self.entries.values()
+            ],
+        }
+
+
+_catalog: Optional[Catalog] = None
+
+
+def catalog() -> Catalog:
+    """The process-wide catalog built from the environment."""
+    global _catalog
+    if _catalog is None:
+        _catalog = Catalog()
+    return _catalog
+
+
+def resolve(name: str, version: Optional[str] = None) -> Path:
+    """Local path of a catalog dataset; use this instead of hard-coded paths in notebooks."""
+    return catalog().resolve(name, version)
@@ -0,0 +1,198 @@
+"""
+Memory-mapped GeoParquet / Arrow IPC reader for notebooks.
+
+Reads only what is asked for: the projected columns, the row groups whose
+statistics can match `filter`/`bbox`, and (for Arrow IPC files) zero-copy
+record batches straight from the page cache. Results are GeoArrow tables
+(geometry tagged `geoarrow.wkb` with its CRS), which lonboard takes as is.
+
+    from careatlas.data.geoparquet import read_geoparquet
+
+    admin1 = read_geoparquet(
+        "admin1.parquet",
+        columns=["name", "poverty_rate"],
+        bbox=(-92.5, 13.0, -83.0, 18.5),
+        filter=("poverty_rate", ">", 0.2),
+    )
+    lonboard.PolygonLayer(table=admin1)
+"""
+import os
+import json
+import hashlib
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+import shapely
+
+logger = logging.getLogger(__name__)
+
+BBox = Tuple[float, float, float, float]
+# (column, op, value) or a list of them (AND), or a ready pyarrow expression
+Filter = Union[ds.Expression, Tuple[str, str, Any], List[Tuple[str, str, Any]]]
+
+IPC_SUFFIXES = {".arrow", ".feather", ".ipc"}
+WKB_EXTENSION = "geoarrow.wkb"
+
+# Local reads go through mmap, so repeated and concurrent reads of the same
+# file share the page cache instead of copying into each kernel's heap
+_LOCAL_FS = fs.LocalFileSystem(use_mmap=True)
+
+_OPS = {
+    "==": lambda f, v: f == v,
+    "=": lambda f, v: f == v,
+    "!=": lambda f, v: f != v,
+    "<": lambda f, v: f < v,
+    "<=": lambda f, v: f <= v,
+    ">": lambda f, v: f > v,
+    ">=": lambda f, v: f >= v,
+    "in": lambda f, v: f.isin(v),
+    "not in": lambda f, v: ~f.isin(v),
+}
+
+
+def dataset_version(path: Union[str, Path]) -> str:
+    """Cheap version key of a file (path, mtime, size), used by the caches built on top of this."""
+    st = os.stat(path)
+    key = f"{os.path.realpath(path)}:{st.st_mtime_ns}:{st.st_size}"
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def to_expression(filter: Optional[Filter]) -> Optional[ds.Expression]:
+    if filter is None or isinstance(filter, ds.Expression):
+        return filter
+    clauses = [filter] if isinstance(filter, tuple) else list(filter)
+    expr = None
+    for column, op, value in clauses:
+        clause = _OPS[op](ds.field(column), value)
+        expr = clause if expr is None else expr & clause
+    return expr
+
+
+def geo_metadata(schema: pa.Schema) -> Dict[str, Any]:
+    """The GeoParquet `geo` file metadata, or {} for plain Parquet/Arrow."""
+    raw = (schema.metadata or {}).get(b"geo")
+    return json.loads(raw) if raw else {}
+
+
+def _geometry_column(schema: pa.Schema, geo: Dict[str, Any]) -> Optional[str]:
+    if geo.get("primary_column"):
+        return geo["primary_column"]
+    for field in schema:
+        if (field.metadata or {}).get(b"ARROW:extension:name", b"").startswith(b"geoarrow"):
+            return field.name
+    return "geometry" if "geometry" in schema.names else None
+
+
+def _bbox_expression(geo: Dict[str, Any], geometry: str, bbox: BBox) -> Optional[ds.Expression]:
+    """
+    Row-group pushdown for bbox queries through the GeoParquet 1.1 `covering`
+    column: its xmin/ymin/xmax/ymax statistics let whole row groups be skipped.
+    """
+    covering = geo.get("columns", {}).get(geometry, {}).get("covering", {}).get("bbox")
+    if not covering:
+        return None
+    minx, miny, maxx, maxy = bbox
+    f = {k: ds.field(*v) for k, v in covering.items()}
+    return (f["xmin"] <= maxx) & (f["xmax"] >= minx) & (f["ymin"] <= maxy) & (f["ymax"] >= miny)
+
+
+def _tag_geoarrow(table: pa.Table, geometry: str, geo: Dict[str, Any]) -> pa.Table:
+    """Marks the WKB geometry column as `geoarrow.wkb` (with CRS) so lonboard recognises it."""
+    if geometry not in table.column_names:
+        return table
+    idx = table.schema.get_field_index(geometry)
+    field = table.schema.field(idx)
+    if (field.metadata or {}).get(b"ARROW:extension:name"):
+        return table
+    column = geo.get("columns", {}).get(geometry, {})
+    # GeoParquet: a missing crs means OGC:CRS84, an explicit null means unknown
+    crs = column.get("crs", "OGC:CRS84") if geo else None
+    ext_meta = {"crs": crs} if crs is not None else {}
+    field = field.with_metadata({
+        b"ARROW:extension:name": WKB_EXTENSION.encode(),
+        b"ARROW:extension:metadata": json.dumps(ext_meta).encode(),
+    })
+    return table.set_column(idx, field, table.column(idx))
+
+
+def _refine_bbox(table: pa.Table, geometry: str, bbox: BBox) -> pa.Table:
+    """Exact bbox test on the geometries themselves (after any row-group pruning)."""
+    if table.num_rows == 0:
+        return table
+    geoms = shapely.from_wkb(table.column(geometry).to_numpy(zero_copy_only=False))
+    mask = shapely.intersects(geoms, shapely.box(*bbox))
+    return table.filter(pa.array(mask))
+
+
+def open_dataset(path: Union[str, Path]) -> ds.Dataset:
+    """pyarrow dataset over a local GeoParquet/Arrow file (or directory), memory-mapped."""
+    path = str(path)
+    fmt = "ipc" if Path(path).suffix in IPC_SUFFIXES else "parquet"
+    return ds.dataset(path, format=fmt, filesystem=_LOCAL_FS)
+
+
+def read_geoparquet(
+    path: Union[str, Path],
+    columns: Optional[Sequence[str]] = None,
+    bbox: Optional[BBox] = None,
+    filter: Optional[Filter] = None,
+    exact: bool = True,
+) -> pa.Table:
+    """
+    Reads a GeoParquet or Arrow IPC file as a GeoArrow table.
+
+    `columns` projects (the geometry column is always included), `filter`
+    and `bbox` prune row groups by their statistics before any page is read.
+    With `exact`, rows are then tested against the bbox geometrically;
+    otherwise the bbox covering test alone decides.
+    """
+    dataset = open_dataset(path)
+    schema = dataset.schema
+    geo = geo_metadata(schema)
+    geometry = _geometry_column(schema, geo)
+
+    expr = to_expression(filter)
+    refine = False
+    if bbox is not None and geometry:
+        bbox_expr = _bbox_expression(geo, geometry, bbox)
+        if bbox_expr is not None:
+            expr = bbox_expr if expr is None else expr & bbox_expr
+        refine = exact or bbox_expr is None
+
+    projected = None
+    if columns is not None:
+        projected = list(dict.fromkeys([*columns, *([geometry] if geometry else [])]))
+
+    table = dataset.to_table(columns=projected, filter=expr)
+    if refine:
+        table = _refine_bbox(table, geometry, bbox)
+    # Keep the file-level geo metadata so the result can be written back as GeoParquet
+    if geo:
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"geo": json.dumps(geo).encode()})
+    return _tag_geoarrow(table, geometry, geo) if geometry else table
+
+
+def row_group_stats(path: Union[str, Path]) -> List[Dict[str, Any]]:
+    """Rows, bytes and the bbox covering (when present) of every row group; handy to check pruning."""
+    pf = pq.ParquetFile(str(path), memory_map=True)
+    geo = geo_metadata(pf.schema_arrow)
+    geometry = _geometry_column(pf.schema_arrow, geo)
+    covering = geo.get("columns", {}).get(geometry, {}).get("covering", {}).get("bbox", {}) if geometry else {}
+    paths = {".".join(v): k for k, v in covering.items()}
+
+    groups = []
+    for i in range(pf.metadata.num_row_groups):
+        rg = pf.metadata.row_group(i)
+        info = {"row_group": i, "rows": rg.num_rows, "bytes": rg.total_byte_size}
+        for c in range(rg.num_columns):
+            col = rg.column(c)
+            key = paths.get(col.path_in_schema)
+            if key and col.statistics is not None and col.statistics.has_min_max:
+                info[key] = col.statistics.min if key in ("xmin", "ymin") else col.statistics.max
+        groups.append(info)
+    return groups
@@ -0,0 +1,246 @@
+"""
+Multi-resolution aggregation pyramid on the web-mercator quadkey grid.
+
+`build_pyramid` aggregates point (or polygon, by representative point)
+indicators once at the finest level, then derives every coarser level from
+the level below it (four children -> one parent), so the raw data is read a
+single time. Each level is a Parquet file sorted by (x, y), so a viewport is
+a row-group-pruned slice instead of a spatial join.
+
+    from careatlas.data.pyramid import build_pyramid
+
+    pyr = build_pyramid("households.parquet", "poverty", {"poor": ["sum", "mean"], "population": ["sum"]})
+    cells = pyr.read(zoom=map_zoom, bbox=map_bounds)   # GeoArrow polygons for lonboard
+"""
+import os
+import json
+import math
+import shutil
+import logging
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import shapely
+
+from careatlas.data.geoparquet import BBox, WKB_EXTENSION, dataset_version, read_geoparquet
+
+logger = logging.getLogger(__name__)
+
+PYRAMID_DIR = Path(os.getenv("CAREATLAS_PYRAMID_DIR", Path(tempfile.gettempdir()) / "careatlas-pyramids"))
+MAX_LAT = 85.05112878
+# A cell of level zoom + LEVEL_OFFSET is ~32px on screen (256px / 2**3)
+LEVEL_OFFSET = 3
+# Aggregations that can be rolled up from children to parents
+AGGREGATIONS = ("sum", "count", "min", "max", "mean")
+
+
+def tile_xy(lon: np.ndarray, lat: np.ndarray, level: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Web-mercator tile column/row of every coordinate at `level` (vectorised)."""
+    n = 1 << level
+    lat = np.clip(lat, -MAX_LAT, MAX_LAT)
+    x = np.floor((np.asarray(lon) + 180.0) / 360.0 * n)
+    rad = np.radians(lat)
+    y = np.floor((1.0 - np.log(np.tan(rad) + 1.0 / np.cos(rad)) / math.pi) / 2.0 * n)
+    return np.clip(x, 0, n - 1).astype(np.int32), np.clip(y, 0, n - 1).astype(np.int32)
+
+
+def tile_bounds(x: np.ndarray, y: np.ndarray, level: int) -> Tuple[np.ndarray, ...]:
+    """(minx, miny, maxx, maxy) in lon/lat of tiles x, y at `level`."""
+    n = float(1 << level)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    minx = x / n * 360.0 - 180.0
+    maxx = (x + 1) / n * 360.0 - 180.0
+    maxy = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * y / n))))
+    miny = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return minx, miny, maxx, maxy
+
+
+def quadkey(x: int, y: int, level: int) -> str:
+    """Bing-style quadkey string of a tile."""
+    digits = []
+    for i in range(level, 0, -1):
+        mask = 1 << (i - 1)
+        digits.append(str((1 if x & mask else 0) + (2 if y & mask else 0)))
+    return "".join(digits)
+
+
+def _agg_columns(metrics: Dict[str, Sequence[str]]) -> List[Tuple[str, str]]:
+    """(column, stored aggregation) pairs; a mean is stored as sum + count."""
+    stored = []
+    for column, aggs in metrics.items():
+        for agg in aggs:
+            if agg not in AGGREGATIONS:
+                raise ValueError(f"Unsupported aggregation {agg!r}; use one of {AGGREGATIONS}")
+            needed = ["sum", "count"] if agg == "mean" else [agg]
+            for a in needed:
+                if (column, a) not in stored:
+                    stored.append((column, a))
+    return stored
+
+
+def _rollup(table: pa.Table, stored: List[Tuple[str, str]]) -> pa.Table:
+    """Parent level from a child level: x, y halve; sums and counts add, min/max combine."""
+    parents = table.set_column(0, "x", pc.shift_right(table["x"], 1)).set_column(1, "y", pc.shift_right(table["y"], 1))
+    aggs = [(f"{col}_{agg}", "sum" if agg in ("sum", "count") else agg) for col, agg in stored]
+    rolled = parents.group_by(["x", "y"]).aggregate(aggs)
+    # group_by names outputs "<col>_<agg>"; put back the stored names
+    rename = {f"{name}_{how}": name for name, how in aggs}
+    return rolled.rename_columns([rename.get(c, c) for c in rolled.column_names]).select(["x", "y", *rename.values()])
+
+
+@dataclass
+class Pyramid:
+    name: str
+    path: Path
+    min_level: int
+    max_level: int
+    metrics: Dict[str, List[str]]
+    bounds: Optional[BBox] = None
+    source_version: str = ""
+    rows: Dict[int, int] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path) -> "Pyramid":
+        manifest = json.loads((Path(path) / "pyramid.json").read_text())
+        manifest["rows"] = {int(k): v for k, v in manifest.get("rows", {}).items()}
+        return cls(path=Path(path), **manifest)
+
+    def level_path(self, level: int) -> Path:
+        return self.path / f"level={level}.parquet"
+
+    def level_for_zoom(self, zoom: float, offset: int = LEVEL_OFFSET) -> int:
+        """The pyramid level whose cells suit map zoom `zoom`."""
+        return int(min(max(round(zoom) + offset, self.min_level), self.max_level))
+
+    def read(
+        self,
+        zoom: Optional[float] = None,
+        bbox: Optional[BBox] = None,
+        level: Optional[int] = None,
+        metrics: Optional[Sequence[str]] = None,
+        geometry: bool = True,
+    ) -> pa.Table:
+        """
+        Cells of one level (picked from `zoom` unless `level` is given),
+        restricted to `bbox` with a row-group-pruned range filter on x/y.
+        Means are finished here from the stored sum and count.
+        """
+        if level is None:
+            level = self.level_for_zoom(zoom if zoom is not None else 0)
+        expr = None
+        if bbox is not None:
+            minx, miny, maxx, maxy = bbox
+            x0, y1 = tile_xy(np.array([minx]), np.array([miny]), level)
+            x1, y0 = tile_xy(np.array([maxx]), np.array([maxy]), level)
+            expr = (ds.field("x") >= int(x0[0])) & (ds.field("x") <= int(x1[0])) \
+                & (ds.field("y") >= int(y0[0])) & (ds.field("y") <= int(y1[0]))
+        table = ds.dataset(str(self.level_path(level)), format="parquet").to_table(filter=expr)
+
+        wanted = set(metrics) if metrics else set(self.metrics)
+        columns = {"x": table["x"], "y": table["y"]}
+        for column, aggs in self.metrics.items():
+            if column not in wanted:
+                continue
+            for agg in aggs:
+                if agg == "mean":
+                    columns[f"{column}_mean"] = pc.divide(
+                        pc.cast(table[f"{column}_sum"], pa.float64()), pc.cast(table[f"{column}_count"], pa.float64())
+                    )
+                else:
+                    columns[f"{column}_{agg}"] = table[f"{column}_{agg}"]
+        out = pa.table(columns)
+        if geometry and out.num_rows:
+            bounds = tile_bounds(out["x"].to_numpy(), out["y"].to_numpy(), level)
+            wkb = shapely.to_wkb(shapely.box(*bounds))
+            field_ = pa.field("geometry", pa.binary(), metadata={
+                b"ARROW:extension:name": WKB_EXTENSION.encode(),
+                b"ARROW:extension:metadata": b'{"crs": "OGC:CRS84"}',
+            })
+            out = out.append_column(field_, pa.array(wkb, pa.binary()))
+        return out
+
+
+def _points(table: pa.Table, geometry: str = "geometry") -> Tuple[np.ndarray, np.ndarray]:
+    geoms = shapely.from_wkb(table[geometry].to_numpy(zero_copy_only=False))
+    # Polygons count once, where they are
+    kinds = shapely.get_type_id(geoms)
+    points = np.where(kinds == 0, geoms, shapely.point_on_surface(geoms))
+    return shapely.get_x(points), shapely.get_y(points)
+
+
+def build_pyramid(
+    source: str,
+    name: str,
+    metrics: Dict[str, Sequence[str]],
+    max_level: int = 12,
+    min_level: int = 0,
+    out_dir: Path = PYRAMID_DIR,
+    row_group_size: int = 64 * 1024,
+) -> Pyramid:
+    """
+    Precomputes every level between `min_level` and `max_level` for the
+    current version of `source`. Returns the existing pyramid when that
+    version was already built.
+    """
+    version = dataset_version(source)
+    path = Path(out_dir) / name / version
+    if (path / "pyramid.json").exists():
+        return Pyramid.load(path)
+
+    table = read_geoparquet(source, columns=list(metrics))
+    lon, lat = _points(table)
+    # Empty or missing geometries can't be placed on the grid
+    valid = np.isfinite(lon) & np.isfinite(lat)
+    if not valid.all():
+        table, lon, lat = table.filter(pa.array(valid)), lon[valid], lat[valid]
+    stored = _agg_columns({k: list(v) for k, v in metrics.items()})
+
+    x, y = tile_xy(lon, lat, max_level)
+    base = pa.table({"x": x, "y": y, **{col: table[col] for col in metrics}})
+    aggs = [(col, "count" if agg == "count" else agg) for col, agg in stored]
+    level_table = base.group_by(["x", "y"]).aggregate(aggs)
+    level_table = level_table.select(["x", "y", *[f"{c}_{a}" for c, a in stored]])
+
+    # Unique per build: two kernels building the same version must not share files
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=path.parent, prefix=f".{version}.", suffix=".tmp"))
+    try:
+        rows = {}
+        for level in range(max_level, min_level - 1, -1):
+            if level != max_level:
+                level_table = _rollup(level_table, stored)
+            # Sorted, so x/y row-group statistics make viewport reads cheap
+            level_table = level_table.sort_by([("x", "ascending"), ("y", "ascending")])
+            pq.write_table(level_table, tmp / f"level={level}.parquet", row_group_size=row_group_size)
+            rows[level] = level_table.num_rows
+
+        bounds = (float(lon.min()), float(lat.min()), float(lon.max()), float(lat.max())) if len(lon) else None
+        manifest = {
+            "name": name,
+            "min_level": min_level,
+            "max_level": max_level,
+            "metrics": {k: list(v) for k, v in metrics.items()},
+            "bounds": bounds,
+            "source_version": version,
+            "rows": rows,
+        }
+        (tmp / "pyramid.json").write_text(json.dumps(manifest, indent=2))
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        # Built concurrently by another kernel; theirs is as good as ours
+        shutil.rmtree(tmp, ignore_errors=True)
+        logger.info(f"Pyramid {name}/{version} already published")
+    logger.info(f"Built pyramid {name} levels {min_level}-{max_level}: {rows}")
+    return Pyramid.load(path)
@@ -0,0 +1,355 @@
+"""
+Cloud-optimised GeoTIFF access: windowed, overview-aware reads and XYZ tiles.
+
+Only the pixels a view needs are read. The overview whose resolution is just
+finer than the request is picked explicitly, and reads go through GDAL's
+block cache with HTTP range merging for remote COGs (`/vsicurl/`, `/vsis3/`),
+so neighbouring tiles reuse the same fetched blocks. Open datasets are kept
+per process, so the cache survives between requests.
+
+rasterio is only imported when a raster is actually read, so the host starts
+without loading GDAL.
+
+    from careatlas.data.raster import read_window, raster_tile_url
+
+    grid = read_window("population/pop_2020.tif", bbox=map_bounds, shape=(512, 512))
+    lonboard.BitmapTileLayer(data=raster_tile_url("population/pop_2020.tif", colormap="viridis"))
+"""
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from careatlas.data.geoparquet import BBox, dataset_version
+from careatlas.data.tiles import DATA_DIR, TILE_CACHE_DIR, TILE_CACHE_MAX_BYTES, TileCache, _check_tile, resolve_layer
+
+logger = logging.getLogger(__name__)
+
+RASTER_BASE_URL = os.getenv("CAREATLAS_RASTER_BASE_URL", "/raster")
+RASTER_TILE_DIR = Path(os.getenv("CAREATLAS_RASTER_TILE_DIR", TILE_CACHE_DIR.with_name("careatlas-raster-tiles")))
+# GDAL block cache (bytes) and the /vsicurl/ byte-range cache
+GDAL_CACHE_BYTES = int(os.getenv("CAREATLAS_GDAL_CACHE_BYTES", str(512 * 1024**2)))
+VSI_CACHE_BYTES = int(os.getenv("CAREATLAS_VSI_CACHE_BYTES", str(128 * 1024**2)))
+MAX_OPEN_DATASETS = int(os.getenv("CAREATLAS_MAX_OPEN_RASTERS", "32"))
+TILE_SIZE = 256
+# Longest side of the sample value_range computes percentiles over
+RANGE_SAMPLE_SIZE = 1024
+WEB_MERCATOR_EXTENT = 20037508.342789244
+
+GDAL_OPTIONS = {
+    "GDAL_CACHEMAX": GDAL_CACHE_BYTES,
+    "VSI_CACHE": True,
+    "VSI_CACHE_SIZE": VSI_CACHE_BYTES,
+    # COGs are self-contained; don't list the bucket looking for sidecars
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "GDAL_HTTP_MULTIRANGE": "YES",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif,.tiff",
+}
+
+# Colour ramps as (stop, r, g, b); stops in 0..1
+COLORMAPS: Dict[str, Sequence[Tuple[float, int, int, int]]] = {
+    "viridis": [(0.0, 68, 1, 84), (0.25, 59, 82, 139), (0.5, 33, 145, 140), (0.75, 94, 201, 98), (1.0, 253, 231, 37)],
+    "magma": [(0.0, 0, 0, 4), (0.25, 81, 18, 124), (0.5, 183, 55, 121), (0.75, 252, 137, 97), (1.0, 252, 253, 191)],
+    "greys": [(0.0, 255, 255, 255), (1.0, 0, 0, 0)],
+}
+
+
+def _rasterio():
+    try:
+        import rasterio
+    except ImportError as e:
+        raise ImportError(
+            "Raster support needs rasterio, which is not installed in this environment (`uv add rasterio`)"
+        ) from e
+    return rasterio
+
+
+def raster_tile_url(
+    layer: str,
+    band: int = 1,
+    colormap: str = "viridis",
+    vmin: Optional[float] = None,
+    vmax: Optional[float] = None,
+    base_url: str = RASTER_BASE_URL,
+) -> str:
+    """URL template of a raster's XYZ PNG tiles, for lonboard's BitmapTileLayer or any slippy map."""
+    params = [f"band={band}", f"colormap={colormap}"]
+    if vmin is not None:
+        params.append(f"vmin={vmin}")
+    if vmax is not None:
+        params.append(f"vmax={vmax}")
+    return f"{base_url.rstrip('/')}/{layer}/{{z}}/{{x}}/{{y}}.png?{'&'.join(params)}"
+
+
+class _Handle:
+    def __init__(self, dataset):
+        self.dataset = dataset
+        # rasterio datasets are not thread-safe; tiles are rendered in worker threads
+        self.lock = threading.Lock()
+
+
+_handles: "OrderedDict[Tuple[str, str, int], _Handle]" = OrderedDict()
+_handles_lock = threading.Lock()
+_configured = False
+
+
+def _configure_gdal() -> None:
+    """
+    Sets GDAL_OPTIONS as process-wide GDAL config, once. A rasterio.Env only
+    applies to the thread that entered it, and tiles are read in worker threads.
+    """
+    global _configured
+    with _handles_lock:
+        if _configured:
+            return
+        from rasterio.env import set_gdal_config
+
+        for key, value in GDAL_OPTIONS.items():
+            set_gdal_config(key, value)
+        _configured = True
+
+
+def _version(path: str) -> str:
+    # Remote COGs (/vsicurl/...) are taken as immutable
+    return dataset_version(path) if os.path.exists(path) else path
+
+
+def _open(path: str, overview: int = -1) -> _Handle:
+    """A kept-open dataset (at an overview level, -1 for full resolution); LRU over MAX_OPEN_DATASETS."""
+    rasterio = _rasterio()
+    _configure_gdal()
+    key = (path, _version(path), overview)
+    with _handles_lock:
+        handle = _handles.get(key)
+        if handle is not None:
+            _handles.move_to_end(key)
+            return handle
+    # Opened outside the lock: a remote COG's header is a network round trip
+    options = {"OVERVIEW_LEVEL": overview} if overview >= 0 else {}
+    opened = _Handle(rasterio.open(path, **options))
+    evicted = []
+    with _handles_lock:
+        handle = _handles.get(key)
+        if handle is None:
+            handle = _handles[key] = opened
+            while len(_handles) > MAX_OPEN_DATASETS:
+                evicted.append(_handles.popitem(last=False)[1])
+        else:
+            # Another thread opened it meanwhile
+            _handles.move_to_end(key)
+            evicted.append(opened)
+    for old in evicted:
+        # Another thread may still be reading through it
+        with old.lock:
+            old.dataset.close()
+    return handle
+
+
+def choose_overview(path: str, resolution: float) -> int:
+    """
+    The coarsest overview whose pixels are still no bigger than
+    `resolution` (in the dataset's CRS units), or -1 for full resolution.
+    """
+    handle = _open(path)
+    with handle.lock:
+        src = handle.dataset
+        native = abs(src.transform.a)
+        factors = src.overviews(1)
+    level = -1
+    for i, factor in enumerate(factors):
+        if native * factor <= resolution:
+            level = i
+    return level
+
+
+def read_window(
+    path: Union[str, Path],
+    bbox: Optional[BBox] = None,
+    shape: Optional[Tuple[int, int]] = None,
+    band: int = 1,
+    resampling: str = "average",
+) -> np.ma.MaskedArray:
+    """
+    Pixels of `band` inside `bbox` (in the raster's CRS; whole raster when
+    None), resampled to `shape` (height, width). Only the blocks of the
+    matching overview that intersect the window are read.
+    """
+    _rasterio()
+    from rasterio.enums import Resampling
+    from rasterio.windows import from_bounds
+
+    path = str(path)
+    handle = _open(path)
+    with handle.lock:
+        src = handle.dataset
+        bounds = bbox or tuple(src.bounds)
+        height, width = shape or (src.height, src.width)
+    overview = choose_overview(path, (bounds[2] - bounds[0]) / width) if shape else -1
+
+    handle = _open(path, overview)
+    with handle.lock:
+        src = handle.dataset
+        window = from_bounds(*bounds, transform=src.transform)
+        return src.read(
+            band,
+            window=window,
+            out_shape=(height, width),
+            boundless=True,
+            masked=True,
+            resampling=getattr(Resampling, resampling),
+        )
+
+
+def _mercator_bounds(z: int, x: int, y: int) -> BBox:
+    size = 2 * WEB_MERCATOR_EXTENT / (1 << z)
+    minx = -WEB_MERCATOR_EXTENT + x * size
+    maxy = WEB_MERCATOR_EXTENT - y * size
+    return (minx, maxy - size, minx + size, maxy)
+
+
+def _mercator_resolutions(path: str) -> Tuple[float, list]:
+    """Pixel size in metres of the full-resolution raster and of each overview, once warped to EPSG:3857."""
+    from rasterio.warp import calculate_default_transform
+
+    handle = _open(path)
+    with handle.lock:
+        src = handle.dataset
+        transform, _, _ = calculate_default_transform(src.crs, "EPSG:3857", src.width, src.height, *src.bounds)
+        return abs(transform.a), [abs(transform.a) * f for f in src.overviews(1)]
+
+
+def read_tile(path: Union[str, Path], z: int, x: int, y: int, band: int = 1, size: int = TILE_SIZE) -> np.ma.MaskedArray:
+    """One web-mercator tile of `band`, warped from the overview that matches the zoom."""
+    _check_tile(z, x, y)
+    from rasterio.enums import Resampling
+    from rasterio.transform import from_bounds as transform_from_bounds
+    from rasterio.vrt import WarpedVRT
+
+    path = str(path)
+    bounds = _mercator_bounds(z, x, y)
+    tile_res = (bounds[2] - bounds[0]) / size
+    _, overview_res = _mercator_resolutions(path)
+    overview = -1
+    for i, res in enumerate(overview_res):
+        if res <= tile_res:
+            overview = i
+
+    handle = _open(path, overview)
+    with handle.lock:
+        src = handle.dataset
+        # The VRT's grid is the tile itself, so GDAL only fetches the source blocks under it
+        with WarpedVRT(
+            src,
+            crs="EPSG:3857",
+            transform=transform_from_bounds(*bounds, size, size),
+            width=size,
+            height=size,
+            resampling=Resampling.bilinear,
+        ) as vrt:
+            return vrt.read(band, masked=True)
+
+
+_ranges: Dict[Tuple[str, str, int], Tuple[float, float]] = {}
+
+
+def value_range(path: Union[str, Path], band: int = 1) -> Tuple[float, float]:
+    """
+    2nd-98th percentile of `band`, from the coarsest overview; the default
+    colour stretch. The read is capped at RANGE_SAMPLE_SIZE pixels a side,
+    so a raster without overviews isn't read in full.
+    """
+    path = str(path)
+    key = (path, _version(path), band)
+    if key not in _ranges:
+        handle = _open(path)
+        with handle.lock:
+            factors = handle.dataset.overviews(band)
+        handle = _open(path, len(factors) - 1) if factors else handle
+        with handle.lock:
+            src = handle.dataset
+            scale = max(1.0, max(src.height, src.width) / RANGE_SAMPLE_SIZE)
+            out_shape = (max(1, round(src.height / scale)), max(1, round(src.width / scale)))
+            data = src.read(band, masked=True, out_shape=out_shape)
+        values = data.compressed()
+        if not values.size:
+            _ranges[key] = (0.0, 1.0)
+        else:
+            low, high = np.percentile(values, [2, 98])
+            _ranges[key] = (float(low), float(high) if high > low else float(low) + 1.0)
+    return _ranges[key]
+
+
+def colorize(data: np.ma.MaskedArray, vmin: float, vmax: float, colormap: str = "viridis") -> np.ndarray:
+    """RGBA uint8 (4, h, w) of `data` stretched over vmin..vmax; masked pixels are transparent."""
+    stops = COLORMAPS.get(colormap)
+    if stops is None:
+        raise ValueError(f"Unknown colormap {colormap!r}; use one of {sorted(COLORMAPS)}")
+    scaled = np.clip((np.ma.filled(data, vmin).astype(np.float64) - vmin) / (vmax - vmin), 0, 1)
+    positions = [s[0] for s in stops]
+    rgba = np.empty((4, *scaled.shape), dtype=np.uint8)
+    for channel in range(3):
+        rgba[channel] = np.interp(scaled, positions, [s[channel + 1] for s in stops]).astype(np.uint8)
+    rgba[3] = np.where(np.ma.getmaskarray(data), 0, 255)
+    return rgba
+
+
+def encode_png(rgba: np.ndarray) -> bytes:
+    _rasterio()
+    from rasterio.io import MemoryFile
+
+    _, height, width = rgba.shape
+    with MemoryFile() as mem:
+        with mem.open(driver="PNG", width=width, height=height, count=4, dtype="uint8") as dst:
+            dst.write(rgba)
+        return mem.read()
+
+
+def _style_key(band: int, colormap: str, vmin: Optional[float], vmax: Optional[float]) -> str:
+    return hashlib.sha1(f"{band}:{colormap}:{vmin}:{vmax}".encode()).hexdigest()[:10]
+
+
+class RasterTileCache(TileCache):
+    """Rendered PNG tiles of rasters under DATA_DIR, with the same layout and LRU as the vector tiles."""
+
+    def __init__(self, root: Path = RASTER_TILE_DIR, data_dir: Path = DATA_DIR, max_bytes: int = TILE_CACHE_MAX_BYTES):
+        super().__init__(root, data_dir, max_bytes)
+
+    def etag(self, layer: str, z: int, x: int, y: int, band: int = 1, colormap: str = "viridis",
+             vmin: Optional[float] = None, vmax: Optional[float] = None) -> str:
+        version = dataset_version(resolve_layer(layer, self.data_dir))
+        return f'"{version}-{_style_key(band, colormap, vmin, vmax)}-{z}-{x}-{y}"'
+
+    def tile_path(self, layer: str, z: int, x: int, y: int, band: int = 1, colormap: str = "viridis",
+                  vmin: Optional[float] = None, vmax: Optional[float] = None) -> Path:
+        """The cached PNG, rendering it first on a miss."""
+        _check_tile(z, x, y)
+        source = resolve_layer(layer, self.data_dir)
+        style = _style_key(band, colormap, vmin, vmax)
+        target = self.root / layer / dataset_version(source) / style / str(z) / str(x) / f"{y}.png"
+        if target.exists():
+            self.hits += 1
+            os.utime(target)
+            return target
+        self.misses += 1
+        if vmin is None or vmax is None:
+            low, high = value_range(source, band)
+            vmin = low if vmin is None else vmin
+            vmax = high if vmax is None else vmax
+        png = encode_png(colorize(read_tile(source, z, x, y, band), vmin, vmax, colormap))
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(png)
+            os.replace(tmp, target)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return target
@@ -0,0 +1,277 @@
+"""
+Cross-kernel shared-memory cache of Arrow tables.
+
+The first kernel that asks for a dataset writes it once as an uncompressed
+Arrow IPC file under SHARED_DIR (tmpfs at /dev/shm when available); every
+kernel then memory-maps that file read-only, so N sessions on the same
+layer share one copy of the pages instead of N heaps.
+
+Each attach holds a lease file (`<entry>.lease.<pid>-<n>`) that is removed
+once the mapping itself is garbage collected, i.e. when the last table,
+slice or array viewing those pages is gone, or when the kernel exits. The host
+(`SharedDatasetCache.maintain`) drops leases of dead processes and evicts
+the least recently attached entries without leases when over budget.
+
+    from careatlas.data.shared import shared_table
+
+    admin1 = shared_table("admin1.parquet", columns=["name", "poverty_rate"])
+"""
+import os
+import json
+import mmap
+import time
+import fcntl
+import asyncio
+import hashlib
+import itertools
+import logging
+import tempfile
+import weakref
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+
+def _default_dir() -> Path:
+    # tmpfs: pages live in RAM once, shared by every process that maps them
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return Path("/dev/shm/careatlas")
+    return Path(tempfile.gettempdir()) / "careatlas-shm"
+
+
+SHARED_DIR = Path(os.getenv("CAREATLAS_SHM_DIR", _default_dir()))
+SHARED_MAX_BYTES = int(os.getenv("CAREATLAS_SHM_MAX_BYTES", str(2 * 1024**3)))
+DATA_SUFFIX = ".arrow"
+LEASE_INFIX = ".lease."
+
+_lease_ids = itertools.count()
+
+
+def entry_key(path: Union[str, Path], columns: Optional[Sequence[str]] = None) -> str:
+    """Name of the shared entry for a source file version and projection."""
+    from careatlas.data.geoparquet import dataset_version
+
+    spec = json.dumps([os.path.realpath(path), dataset_version(path), sorted(columns) if columns else None])
+    return hashlib.sha1(spec.encode()).hexdigest()[:20]
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# --- kernel side ---
+
+
+def _release(lease: str) -> None:
+    try:
+        os.unlink(lease)
+    except OSError:
+        pass
+
+
+def attach(key: str, root: Path = SHARED_DIR):
+    """
+    Maps an existing entry read-only and returns it as a pyarrow Table (no
+    copy: the buffers point into the shared pages), or None if it isn't there.
+    """
+    import pyarrow as pa
+
+    data = root / f"{key}{DATA_SUFFIX}"
+    # One lease per mapping, so tables of the same kernel release independently
+    lease = f"{data}{LEASE_INFIX}{os.getpid()}-{next(_lease_ids)}"
+    try:
+        # The lease goes first so the host can't evict between open and map
+        Path(lease).touch()
+        with open(data, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        _release(lease)
+        return None
+    # Every buffer sliced out of py_buffer keeps the Python mmap alive, so the
+    # lease outlives the table as long as any select/filter/slice of it does
+    table = pa.ipc.open_file(pa.BufferReader(pa.py_buffer(mapping))).read_all()
+    weakref.finalize(mapping, _release, lease)
+    # Attach time is the LRU clock
+    os.utime(data)
+    return table
+
+
+def free_bytes(root: Path = SHARED_DIR) -> int:
+    """Space left on the filesystem under `root` (a 64MiB /dev/shm fills up fast)."""
+    st = os.statvfs(root if root.exists() else root.parent)
+    return st.f_bavail * st.f_frsize
+
+
+def publish(key: str, table, root: Path = SHARED_DIR) -> Path:
+    """
+    Writes `table` as the entry `key` (uncompressed, so attaching stays
+    zero-copy). Raises OSError (ENOSPC) up front when it can't fit.
+    """
+    import errno
+    import pyarrow as pa
+
+    root.mkdir(parents=True, exist_ok=True)
+    if table.nbytes > free_bytes(root):
+        raise OSError(errno.ENOSPC, f"{table.nbytes} bytes don't fit in {root}")
+    data = root / f"{key}{DATA_SUFFIX}"
+    fd, tmp = tempfile.mkstemp(dir=root, prefix=f".{key}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        with pa.OSFile(tmp, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        # Readers only ever see complete files
+        os.replace(tmp, data)
+    except BaseException:
+        _release(tmp)
+        raise
+    return data
+
+
+def shared_table(
+    path: Union[str, Path],
+    columns: Optional[Sequence[str]] = None,
+    loader: Optional[Callable[[], object]] = None,
+    root: Path = SHARED_DIR,
+):
+    """
+    The dataset at `path` (projected to `columns`) from shared memory. The
+    first caller builds the entry with `loader` (default: `read_geoparquet`)
+    while holding a build lock, so concurrent kernels don't load it twice.
+    """
+    key = entry_key(path, columns)
+    table = attach(key, root)
+    if table is not None:
+        return table
+
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / f".{key}.build.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        table = attach(key, root)
+        if table is None:
+            if loader is None:
+                from careatlas.data.geoparquet import read_geoparquet
+
+                loaded = read_geoparquet(path, columns=columns)
+            else:
+                loaded = loader()
+            try:
+                publish(key, loaded, root)
+            except OSError as e:
+                # Out of shared memory: this kernel keeps its own copy
+                logger.warning(f"Could not share {path} ({e}); using a private copy")
+                return loaded
+            table = attach(key, root)
+    return table
+
+
+# --- host side ---
+
+
+class SharedDatasetCache:
+    """
+    Bookkeeping for SHARED_DIR in the FastAPI host: reference counts from the
+    lease files, and LRU eviction of unreferenced entries over the budget.
+    """
+
+    def __init__(self, root: Path = SHARED_DIR, max_bytes: int = SHARED_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.evictions = 0
+
+    def _scan(self) -> Dict[str, dict]:
+        entries: Dict[str, dict] = {}
+        leases: Dict[str, List[str]] = {}
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return {}
+        for name in names:
+            if LEASE_INFIX in name:
+                data, _, lease_id = name.rpartition(LEASE_INFIX)
+                leases.setdefault(data, []).append(lease_id)
+            elif name.endswith(DATA_SUFFIX):
+                try:
+                    st = os.stat(self.root / name)
+                except OSError:
+                    continue
+                entries[name] = {"key": name[: -len(DATA_SUFFIX)], "bytes": st.st_size, "last_used": st.st_mtime, "pids": []}
+
+        for data, lease_ids in leases.items():
+            for lease_id in lease_ids:
+                pid = int(lease_id.split("-")[0])
+                if not _pid_alive(pid):
+                    # Kernel died without releasing
+                    _release(str(self.root / f"{data}{LEASE_INFIX}{lease_id}"))
+                elif data in entries:
+                    entries[data]["pids"].append(pid)
+        return entries
+
+    def budget(self, used: int) -> int:
+        """The configured budget, capped by what the filesystem can actually hold."""
+        try:
+            available = used + free_bytes(self.root)
+        except OSError:
+            return self.max_bytes
+        # Keep some headroom so a publish in flight doesn't hit ENOSPC
+        return min(self.max_bytes, int(available * 0.9))
+
+    def evict(self) -> int:
+        """Unlinks unreferenced entries, least recently attached first, until under budget."""
+        entries = self._scan()
+        total = sum(e["bytes"] for e in entries.values())
+        budget = self.budget(total)
+        removed = 0
+        for name, e in sorted(entries.items(), key=lambda kv: kv[1]["last_used"]):
+            if total <= budget:
+                break
+            if e["pids"]:
+                continue
+            try:
+                os.unlink(self.root / name)
+            except OSError:
+                continue
+            total -= e["bytes"]
+            removed += 1
+        self.evictions += removed
+        if removed:
+            logger.info(f"Shared dataset cache evicted {removed} entries ({total / 1024**2:.0f} MiB left)")
+        return removed
+
+    def clear(self, key: str) -> bool:
+        try:
+            os.unlink(self.root / f"{key}{DATA_SUFFIX}")
+            return True
+        except OSError:
+            return False
+
+    def status(self) -> dict:
+        entries = self._scan()
+        used = sum(e["bytes"] for e in entries.values())
+        return {
+            "path": str(self.root),
+            "bytes": used,
+            "max_bytes": self.max_bytes,
+            "budget": self.budget(used),
+            "evictions": self.evictions,
+            "entries": [
+                {"key": e["key"], "bytes": e["bytes"], "refs": len(e["pids"]), "idle_s": round(time.time() - e["last_used"])}
+                for e in sorted(entries.values(), key=lambda e: -e["last_used"])
+            ],
+        }
+
+    async def maintain(self, interval: int = 30) -> None:
+        """Background task: sweep dead leases and enforce the budget."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.evict)
+            except Exception as e:
+                logger.error(f"Shared dataset cache sweep failed: {e}")
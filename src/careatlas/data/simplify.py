@@ -0,0 +1,163 @@
+"""
+Zoom-dependent simplified versions of boundary layers.
+
+`build_simplified` writes one GeoParquet per zoom level, simplified to that
+zoom's pixel size, next to the source (`<dir>/.simplified/<stem>/<version>/`),
+or under SIMPLIFY_DIR when the data directory is read-only. Polygon layers are
+simplified as a coverage (`shapely.coverage_simplify`), so neighbouring
+districts keep sharing their edges instead of opening gaps or overlaps.
+
+    from careatlas.data.simplify import simplified
+
+    admin2 = simplified("admin2.parquet", zoom=map_zoom, columns=["name"])
+
+Files are plain GeoParquet read through mmap, so every kernel (and the tile
+endpoint) reuses the same levels and the same page cache.
+"""
+import os
+import json
+import math
+import shutil
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+
+from careatlas.data.geoparquet import BBox, _geometry_column, dataset_version, geo_metadata, read_geoparquet
+
+logger = logging.getLogger(__name__)
+
+SIMPLIFY_DIR = Path(os.getenv("CAREATLAS_SIMPLIFY_DIR", Path(tempfile.gettempdir()) / "careatlas-simplified"))
+# One level every two zooms; coarser zooms than 0 or finer than 12 use the ends
+DEFAULT_ZOOMS = (0, 2, 4, 6, 8, 10, 12)
+TILE_SIZE = 256
+SIDECAR = ".simplified"
+
+
+def pixel_tolerance(zoom: float, pixels: float = 0.5) -> float:
+    """Degrees covered by `pixels` screen pixels at `zoom` (at the equator)."""
+    return pixels * 360.0 / (TILE_SIZE * 2 ** zoom)
+
+
+def _levels_dir(path: Path, version: str) -> Path:
+    sidecar = path.parent / SIDECAR / path.stem / version
+    if os.access(path.parent, os.W_OK):
+        return sidecar
+    return SIMPLIFY_DIR / path.stem / version
+
+
+def _is_coverage(geoms: np.ndarray) -> bool:
+    """Polygons that only meet along exactly matching edges (coverage_simplify leaves anything else as is)."""
+    if not np.isin(shapely.get_type_id(geoms), (3, 6)).all():
+        return False
+    if shapely.coverage_is_valid(geoms):
+        return True
+    logger.warning("Polygons are not a clean coverage (overlaps or unmatched edges); simplifying per feature")
+    return False
+
+
+def build_simplified(
+    source: Union[str, Path],
+    zooms: Sequence[int] = DEFAULT_ZOOMS,
+    pixels: float = 0.5,
+) -> Dict[str, dict]:
+    """
+    Writes a simplified copy of `source` for every zoom in `zooms` (tolerance
+    `pixels` screen pixels at that zoom) unless this version was already done.
+    Returns the manifest.
+    """
+    source = Path(source).resolve()
+    version = dataset_version(source)
+    target = _levels_dir(source, version)
+    if (target / "levels.json").exists():
+        return json.loads((target / "levels.json").read_text())
+
+    table = read_geoparquet(source)
+    geometry = _geometry_column(table.schema, geo_metadata(table.schema))
+    idx = table.schema.get_field_index(geometry)
+    field = table.schema.field(idx)
+    geoms = shapely.from_wkb(table.column(idx).to_numpy(zero_copy_only=False))
+    coverage = _is_coverage(geoms)
+    vertices = int(shapely.get_num_coordinates(geoms).sum())
+
+    # Unique per build: threads of one kernel may build the same version
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=target.parent, prefix=f".{version}.", suffix=".tmp"))
+    try:
+        levels = {}
+        for zoom in sorted(zooms):
+            tolerance = pixel_tolerance(zoom, pixels)
+            if coverage:
+                # Shared edges are simplified once, identically for both sides
+                simple = shapely.coverage_simplify(geoms, tolerance)
+            else:
+                simple = shapely.simplify(geoms, tolerance, preserve_topology=True)
+            out = table.set_column(idx, field, pa.array(shapely.to_wkb(simple), pa.binary()))
+            name = f"zoom={zoom}.parquet"
+            pq.write_table(out, tmp / name)
+            levels[str(zoom)] = {
+                "file": name,
+                "tolerance": tolerance,
+                "vertices": int(shapely.get_num_coordinates(simple).sum()),
+            }
+            logger.info(f"{source.name} zoom {zoom}: {levels[str(zoom)]['vertices']}/{vertices} vertices")
+
+        manifest = {"source": str(source), "version": version, "coverage": coverage, "vertices": vertices, "levels": levels}
+        (tmp / "levels.json").write_text(json.dumps(manifest, indent=2))
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    try:
+        os.replace(tmp, target)
+    except OSError:
+        # Another kernel finished the same version first
+        shutil.rmtree(tmp, ignore_errors=True)
+    return manifest
+
+
+def level_path(
+    source: Union[str, Path],
+    zoom: Optional[float] = None,
+    tolerance: Optional[float] = None,
+) -> Optional[Path]:
+    """
+    The coarsest existing level that is still at least as detailed as
+    asked (by zoom, or by tolerance in degrees); None when none is built.
+    Never builds anything, so callers on a request path can use it.
+    """
+    source = Path(source).resolve()
+    target = _levels_dir(source, dataset_version(source))
+    try:
+        manifest = json.loads((target / "levels.json").read_text())
+    except FileNotFoundError:
+        return None
+    if tolerance is None:
+        tolerance = pixel_tolerance(zoom if zoom is not None else math.inf)
+    fits = [lvl for lvl in manifest["levels"].values() if lvl["tolerance"] <= tolerance]
+    if not fits:
+        return None
+    return target / max(fits, key=lambda lvl: lvl["tolerance"])["file"]
+
+
+def simplified(
+    source: Union[str, Path],
+    zoom: Optional[float] = None,
+    tolerance: Optional[float] = None,
+    columns: Optional[Sequence[str]] = None,
+    bbox: Optional[BBox] = None,
+    build: bool = True,
+) -> pa.Table:
+    """
+    `source` at the detail a map at `zoom` (or a pixel `tolerance` in
+    degrees) needs, building the levels on first use. Finer than the
+    finest level, the source itself is returned.
+    """
+    if build:
+        build_simplified(source)
+    path = level_path(source, zoom=zoom, tolerance=tolerance) or source
+    return read_geoparquet(path, columns=columns, bbox=bbox)
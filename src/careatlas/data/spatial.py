@@ -0,0 +1,206 @@
+"""
+Cached STRtree spatial indexes for point-in-polygon and nearest joins.
+
+The index of a dataset is built once per dataset version: its geometries are
+persisted as shapely ragged coordinate arrays (plain .npy files, memory-mapped
+on reload, no WKB parsing), so a kernel restart only re-packs the tree. Bulk
+`query`/`nearest` results are cached too, keyed by the index version and the
+version (or content hash) of the other side.
+
+    from careatlas.data.spatial import spatial_index
+
+    admin2 = spatial_index("admin2.parquet")
+    district = admin2.join("facilities.parquet")   # row of admin2 containing each facility, -1 if none
+    near = admin2.nearest(points, max_distance=0.5)
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import shapely
+
+from careatlas.data.geoparquet import _geometry_column, dataset_version, geo_metadata, read_geoparquet
+
+logger = logging.getLogger(__name__)
+
+SPATIAL_CACHE_DIR = Path(os.getenv("CAREATLAS_SPATIAL_CACHE_DIR", Path(tempfile.gettempdir()) / "careatlas-spatial"))
+
+# A dataset path, a shapely geometry array, or a GeoArrow table
+Geometries = Union[str, Path, np.ndarray, pa.Table]
+
+_indexes: Dict[str, "SpatialIndex"] = {}
+_indexes_lock = threading.Lock()
+
+
+def _table_geometries(table: pa.Table) -> np.ndarray:
+    geometry = _geometry_column(table.schema, geo_metadata(table.schema))
+    return shapely.from_wkb(table.column(geometry).to_numpy(zero_copy_only=False))
+
+
+def _save_geometries(geoms: np.ndarray, target: Path) -> None:
+    """Ragged coordinate arrays when the types allow it (fast reload), WKB otherwise."""
+    target.mkdir(parents=True, exist_ok=True)
+    try:
+        kind, coords, offsets = shapely.to_ragged_array(geoms)
+    except ValueError:
+        # Mixed types (e.g. points and polygons) or collections
+        np.save(target / "wkb.npy", shapely.to_wkb(geoms))
+        return
+    np.save(target / "coords.npy", coords)
+    for i, off in enumerate(offsets):
+        np.save(target / f"offsets{i}.npy", off)
+    (target / "ragged.json").write_text(json.dumps({"type": int(kind), "levels": len(offsets)}))
+
+
+def _load_geometries(source: Path) -> np.ndarray:
+    if (source / "wkb.npy").exists():
+        return shapely.from_wkb(np.load(source / "wkb.npy", allow_pickle=True))
+    meta = json.loads((source / "ragged.json").read_text())
+    coords = np.load(source / "coords.npy", mmap_mode="r")
+    offsets = tuple(np.load(source / f"offsets{i}.npy", mmap_mode="r") for i in range(meta["levels"]))
+    return shapely.from_ragged_array(shapely.GeometryType(meta["type"]), np.asarray(coords), offsets)
+
+
+def _content_key(geoms: np.ndarray) -> str:
+    digest = hashlib.sha1()
+    for wkb in shapely.to_wkb(geoms):
+        digest.update(wkb if wkb is not None else b"\0")
+    return digest.hexdigest()[:16]
+
+
+class SpatialIndex:
+    """
+    STRtree over one dataset version. Row positions in results refer to
+    the dataset's row order, so they can be used with `table.take`.
+    """
+
+    def __init__(self, geometries: np.ndarray, version: str, cache_dir: Path = SPATIAL_CACHE_DIR):
+        self.geometries = geometries
+        self.version = version
+        self.cache_dir = Path(cache_dir) / version
+        self.tree = shapely.STRtree(geometries)
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def build(cls, path: Union[str, Path], cache_dir: Path = SPATIAL_CACHE_DIR) -> "SpatialIndex":
+        """Index of the current version of `path`, reloading its persisted geometries when present."""
+        version = dataset_version(path)
+        stored = Path(cache_dir) / version / "geometries"
+        if stored.exists():
+            geoms = _load_geometries(stored)
+        else:
+            geoms = _table_geometries(read_geoparquet(path, columns=[]))
+            stored.parent.mkdir(parents=True, exist_ok=True)
+            # Unique per build: sessions are threads of one process
+            tmp = Path(tempfile.mkdtemp(dir=stored.parent, prefix=".geometries.", suffix=".tmp"))
+            try:
+                _save_geometries(geoms, tmp)
+                os.replace(tmp, stored)
+            except OSError:
+                # Another session persisted the same version first (or the disk is full)
+                shutil.rmtree(tmp, ignore_errors=True)
+            except BaseException:
+                shutil.rmtree(tmp, ignore_errors=True)
+                raise
+        return cls(geoms, version, cache_dir)
+
+    def _as_geometries(self, other: Geometries) -> Tuple[np.ndarray, str]:
+        """Geometry array and a cache key for it (dataset version or content hash)."""
+        if isinstance(other, (str, Path)):
+            return _table_geometries(read_geoparquet(other, columns=[])), f"v{dataset_version(other)}"
+        if isinstance(other, pa.Table):
+            other = _table_geometries(other)
+        geoms = np.asarray(other)
+        return geoms, f"h{_content_key(geoms)}"
+
+    def _cached(self, name: str, compute):
+        target = self.cache_dir / f"{name}.npz"
+        if target.exists():
+            self.hits += 1
+            with np.load(target) as stored:
+                return tuple(stored[k] for k in sorted(stored.files))
+        self.misses += 1
+        result = compute()
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{name}.", suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **{f"a{i}": a for i, a in enumerate(result)})
+            os.replace(tmp, target)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return result
+
+    def query(self, other: Geometries, predicate: Optional[str] = "intersects", cache: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        All (other row, indexed row) pairs with `predicate(other, indexed)`
+        (shapely STRtree predicates, e.g. "intersects", "within"), in one
+        vectorised tree query.
+        """
+        geoms, key = self._as_geometries(other)
+        compute = lambda: tuple(self.tree.query(geoms, predicate=predicate))
+        if not cache:
+            return compute()
+        return self._cached(f"query-{predicate}-{key}", compute)
+
+    def join(self, other: Geometries, predicate: str = "within", cache: bool = True) -> np.ndarray:
+        """
+        For each row of `other`, the first indexed row with `predicate(other, indexed)`
+        (point-in-polygon by default), or -1.
+        """
+        geoms, key = self._as_geometries(other)
+
+        def compute():
+            other_idx, tree_idx = self.tree.query(geoms, predicate=predicate)
+            out = np.full(len(geoms), -1, dtype=np.int64)
+            # Reverse so the first match of each row is the one left standing
+            out[other_idx[::-1]] = tree_idx[::-1]
+            return (out,)
+
+        if not cache:
+            return compute()[0]
+        return self._cached(f"join-{predicate}-{key}", compute)[0]
+
+    def nearest(
+        self,
+        other: Geometries,
+        max_distance: Optional[float] = None,
+        cache: bool = True,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(other row, nearest indexed row, distance) for every row of `other` within `max_distance`."""
+        geoms, key = self._as_geometries(other)
+
+        def compute():
+            (other_idx, tree_idx), dist = self.tree.query_nearest(
+                geoms, max_distance=max_distance, return_distance=True, all_matches=False
+            )
+            return other_idx, tree_idx, dist
+
+        if not cache:
+            return compute()
+        return self._cached(f"nearest-{max_distance}-{key}", compute)
+
+    def status(self) -> dict:
+        return {"version": self.version, "size": len(self.geometries), "hits": self.hits, "misses": self.misses}
+
+
+def spatial_index(path: Union[str, Path], cache_dir: Path = SPATIAL_CACHE_DIR) -> SpatialIndex:
+    """The index of `path`, kept per kernel and rebuilt only when the file changes."""
+    key = os.path.realpath(path)
+    version = dataset_version(path)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None or index.version != version:
+            index = SpatialIndex.build(path, cache_dir)
+            _indexes[key] = index
+    return index
@@ -0,0 +1,239 @@
+"""
+z/x/y tiles of vector layers as GeoArrow IPC.
+
+A layer is any GeoParquet/Arrow file under DATA_DIR. A tile is the layer's
+features intersecting the web-mercator tile (plus a small buffer), clipped to
+it and simplified to the tile's pixel size, written as an Arrow IPC stream
+with `geoarrow.wkb` geometry. Rendered tiles are kept on disk under
+TILE_CACHE_DIR keyed by the layer version, so the host and every kernel
+render each tile once and the ETag is known without opening the layer.
+
+    from careatlas.data.tiles import viewport_table, tile_url
+
+    # only the tiles under the map, not the whole layer
+    table = viewport_table("admin/admin1.parquet", bbox=map_bounds, zoom=map_zoom, columns=["name", "poverty_rate"])
+    lonboard.PolygonLayer(table=table)
+
+    tile_url("admin/admin1.parquet")   # "/tiles/admin/admin1.parquet/{z}/{x}/{y}.arrow" for deck.gl
+"""
+import os
+import asyncio
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import shapely
+
+from careatlas.data.geoparquet import BBox, _geometry_column, dataset_version, geo_metadata, read_geoparquet
+from careatlas.data.pyramid import MAX_LAT, tile_bounds, tile_xy
+from careatlas.data.simplify import level_path
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(os.getenv("CAREATLAS_DATA_DIR", "/server/data"))
+TILE_CACHE_DIR = Path(os.getenv("CAREATLAS_TILE_CACHE_DIR", Path(tempfile.gettempdir()) / "careatlas-tiles"))
+TILE_CACHE_MAX_BYTES = int(os.getenv("CAREATLAS_TILE_CACHE_MAX_BYTES", str(2 * 1024**3)))
+TILE_BASE_URL = os.getenv("CAREATLAS_TILE_BASE_URL", "/tiles")
+MAX_ZOOM = 22
+TILE_SIZE = 256
+# Features are clipped a few pixels outside the tile so strokes don't show seams
+BUFFER_PX = 4
+TILE_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def resolve_layer(layer: str, root: Path = DATA_DIR) -> Path:
+    """Maps a layer name to a file inside `root`; FileNotFoundError otherwise (including escapes)."""
+    base = Path(root).resolve()
+    path = (base / layer).resolve()
+    if base not in path.parents or not path.is_file():
+        raise FileNotFoundError(layer)
+    return path
+
+
+def tile_url(layer: str, columns: Optional[Sequence[str]] = None, base_url: str = TILE_BASE_URL) -> str:
+    """URL template of a layer's tiles, for deck.gl/MapLibre style tiled sources."""
+    url = f"{base_url.rstrip('/')}/{layer}/{{z}}/{{x}}/{{y}}.arrow"
+    return f"{url}?columns={','.join(columns)}" if columns else url
+
+
+def tiles_for_bbox(bbox: BBox, zoom: int) -> List[Tuple[int, int]]:
+    """
+    x, y of every tile at `zoom` that covers `bbox`. A bbox crossing the
+    antimeridian (minx > maxx, as maps report it) covers both edges of the world.
+    """
+    minx, miny, maxx, maxy = bbox
+    if minx > maxx:
+        east = tiles_for_bbox((minx, miny, 180.0, maxy), zoom)
+        return east + [t for t in tiles_for_bbox((-180.0, miny, maxx, maxy), zoom) if t not in east]
+    x0, y1 = tile_xy(np.array([minx]), np.array([max(miny, -MAX_LAT)]), zoom)
+    x1, y0 = tile_xy(np.array([maxx]), np.array([min(maxy, MAX_LAT)]), zoom)
+    return [(x, y) for x in range(int(x0[0]), int(x1[0]) + 1) for y in range(int(y0[0]), int(y1[0]) + 1)]
+
+
+def _check_tile(z: int, x: int, y: int) -> None:
+    if not 0 <= z <= MAX_ZOOM or not (0 <= x < 1 << z and 0 <= y < 1 << z):
+        raise ValueError(f"No tile {z}/{x}/{y}")
+
+
+def _columns_key(columns: Optional[Sequence[str]]) -> str:
+    if not columns:
+        return "all"
+    return hashlib.sha1(",".join(sorted(columns)).encode()).hexdigest()[:10]
+
+
+def render_tile(path: Path, z: int, x: int, y: int, columns: Optional[Sequence[str]] = None) -> pa.Table:
+    """Features of one tile, clipped to it (plus buffer) and simplified to its pixel size."""
+    _check_tile(z, x, y)
+    minx, miny, maxx, maxy = (float(b[0]) for b in tile_bounds(np.array([x]), np.array([y]), z))
+    # Degrees per pixel, in x; good enough as a tolerance at tile scale
+    pixel = (maxx - minx) / TILE_SIZE
+    pad = BUFFER_PX * pixel
+    clip_box = (minx - pad, miny - pad, maxx + pad, maxy + pad)
+
+    # A prebuilt simplified level (see careatlas.data.simplify) saves most of the vertices
+    source = level_path(path, tolerance=pixel) or path
+    table = read_geoparquet(source, columns=columns, bbox=clip_box)
+    if table.num_rows == 0:
+        return table
+    geometry = _geometry_column(table.schema, geo_metadata(table.schema))
+    idx = table.schema.get_field_index(geometry)
+    geoms = shapely.from_wkb(table.column(idx).to_numpy(zero_copy_only=False))
+    geoms = shapely.clip_by_rect(geoms, *clip_box)
+    geoms = shapely.simplify(geoms, pixel, preserve_topology=True)
+    keep = ~shapely.is_empty(geoms)
+    field = table.schema.field(idx)
+    table = table.set_column(idx, field, pa.array(shapely.to_wkb(geoms), pa.binary()))
+    return table.filter(pa.array(keep))
+
+
+def _write_ipc(table: pa.Table, target: Path) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # Unique per writer: threads of one process render the same tile concurrently
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        with pa.OSFile(tmp, "wb") as sink:
+            # Uncompressed: apache-arrow JS can't decode compressed IPC buffers
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class TileCache:
+    """
+    Rendered tiles on disk, `<root>/<layer>/<version>/<columns>/<z>/<x>/<y>.arrow`.
+    A new layer version simply gets new paths; old ones age out through
+    the size-based LRU in `evict`.
+    """
+
+    def __init__(self, root: Path = TILE_CACHE_DIR, data_dir: Path = DATA_DIR, max_bytes: int = TILE_CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.data_dir = Path(data_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def etag(self, layer: str, z: int, x: int, y: int, columns: Optional[Sequence[str]] = None) -> str:
+        version = dataset_version(resolve_layer(layer, self.data_dir))
+        return f'"{version}-{_columns_key(columns)}-{z}-{x}-{y}"'
+
+    def tile_path(self, layer: str, z: int, x: int, y: int, columns: Optional[Sequence[str]] = None) -> Path:
+        """The cached tile file, rendering it first on a miss."""
+        _check_tile(z, x, y)
+        source = resolve_layer(layer, self.data_dir)
+        target = self.root / layer / dataset_version(source) / _columns_key(columns) / str(z) / str(x) / f"{y}.arrow"
+        if target.exists():
+            self.hits += 1
+            # mtime is the LRU clock
+            os.utime(target)
+            return target
+        self.misses += 1
+        _write_ipc(render_tile(source, z, x, y, columns), target)
+        return target
+
+    def get(self, layer: str, z: int, x: int, y: int, columns: Optional[Sequence[str]] = None) -> pa.Table:
+        # The table's buffers keep the mapping alive
+        source = pa.memory_map(str(self.tile_path(layer, z, x, y, columns)), "r")
+        return pa.ipc.open_stream(source).read_all()
+
+    def evict(self) -> int:
+        """Removes least recently used tiles until the cache is under budget."""
+        files = []
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                p = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, p))
+        total = sum(f[1] for f in files)
+        removed = 0
+        for _, size, p in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(p)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self.evictions += removed
+        if removed:
+            logger.info(f"Tile cache evicted {removed} tiles ({total / 1024**2:.0f} MiB left)")
+        return removed
+
+    def status(self) -> dict:
+        return {
+            "path": str(self.root),
+            "data_dir": str(self.data_dir),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "max_bytes": self.max_bytes,
+        }
+
+    async def maintain(self, interval: int = 300) -> None:
+        """Background task for the host: keep the cache within its budget."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.evict)
+            except Exception as e:
+                logger.error(f"Tile cache sweep failed: {e}")
+
+
+_default_cache: Optional[TileCache] = None
+
+
+def viewport_table(
+    layer: str,
+    bbox: BBox,
+    zoom: float,
+    columns: Optional[Sequence[str]] = None,
+    cache: Optional[TileCache] = None,
+) -> pa.Table:
+    """
+    The layer for one map view, assembled from its (cached) tiles, so what
+    goes to the browser scales with the viewport rather than the dataset.
+    Features crossing tile edges come back once per tile, clipped.
+    """
+    global _default_cache
+    if cache is None:
+        _default_cache = _default_cache or TileCache()
+        cache = _default_cache
+    z = int(min(max(round(zoom), 0), MAX_ZOOM))
+    tables = [cache.get(layer, z, x, y, columns) for x, y in tiles_for_bbox(bbox, z)]
+    if not tables:
+        # Degenerate bbox: no rows, but the columns the caller asked for
+        return read_geoparquet(resolve_layer(layer, cache.data_dir), columns=columns, filter=ds.scalar(False))
+    return pa.concat_tables([t for t in tables if t.num_rows] or tables[:1])
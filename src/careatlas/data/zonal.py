@@ -0,0 +1,392 @@
+"""
+Zonal statistics of a raster over a set of polygons, for every zone at once.
+
+The zones are rasterised once onto the raster's grid (a zone index per pixel,
+kept as a memory-mapped .npy per zone version and grid). Statistics are then
+a single pass over raster strips: per strip, `np.bincount` on the zone index
+gives every zone's count/sum/sum of squares and `ufunc.at` its min/max, and
+the strips are merged. Percentiles take a second pass building per-zone
+histograms (PERCENTILE_BINS bins between each zone's min and max, so they are
+within 1/PERCENTILE_BINS of the zone's range). Strips are sized to a byte
+budget (STRIP_BYTES per float64 strip, aligned to the file's blocks), and
+strips of raster files run in a process pool that is kept for the session.
+
+Each statistic is cached on disk by (raster version, zone version, statistic).
+
+    from careatlas.data.zonal import zonal_stats
+
+    by_district = zonal_stats("poverty/rate_2022.tif", "admin2.parquet", stats=["mean", "p50", "p90"])
+
+Zones must be in the raster's CRS. Raster files need rasterio (see
+careatlas.data.raster); in-memory grids are given as `(array, transform)`
+with a GDAL/rasterio affine `(a, b, c, d, e, f)` and need nothing else.
+"""
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import shapely
+
+from careatlas.data.geoparquet import _geometry_column, dataset_version, geo_metadata, read_geoparquet
+
+logger = logging.getLogger(__name__)
+
+ZONAL_CACHE_DIR = Path(os.getenv("CAREATLAS_ZONAL_CACHE_DIR", Path(tempfile.gettempdir()) / "careatlas-zonal"))
+
+def _available_cpus() -> int:
+    # The CPUs this process may run on, not the node's (cpu_count ignores affinity)
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# Kept small: the pod is limited to 2 CPUs and kernels share them
+ZONAL_WORKERS = int(os.getenv("CAREATLAS_ZONAL_WORKERS", str(min(_available_cpus(), 2))))
+# Size of one float64 strip; the other per-pixel arrays of a strip are a small multiple of it
+STRIP_BYTES = int(os.getenv("CAREATLAS_ZONAL_STRIP_BYTES", str(32 * 1024**2)))
+PERCENTILE_BINS = 1024
+BASIC_STATS = ("count", "sum", "mean", "min", "max", "std")
+
+Affine = Tuple[float, float, float, float, float, float]
+# A raster file (COG/GeoTIFF) or an in-memory (array, transform)
+Raster = Union[str, Path, Tuple[np.ndarray, Affine]]
+# A GeoParquet file, a GeoArrow table or a shapely geometry array
+Zones = Union[str, Path, pa.Table, np.ndarray]
+
+
+def _hash(*parts) -> str:
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+    return digest.hexdigest()[:16]
+
+
+def _parse_stats(stats: Sequence[str]) -> Tuple[List[str], List[float]]:
+    basic, percentiles = [], []
+    for stat in stats:
+        if stat in BASIC_STATS:
+            basic.append(stat)
+        elif stat.startswith("p") and stat[1:].replace(".", "", 1).isdigit() and 0 <= float(stat[1:]) <= 100:
+            percentiles.append(float(stat[1:]))
+        else:
+            raise ValueError(f"Unknown statistic {stat!r}; use {BASIC_STATS} or p0..p100")
+    return basic, percentiles
+
+
+# --- raster side ---
+
+
+class _Grid:
+    """Raster geometry plus a strip reader; pickled to workers, which reopen the file themselves."""
+
+    def __init__(self, raster: Raster, band: int = 1):
+        self.band = band
+        if isinstance(raster, tuple):
+            self.array, self.transform = raster[0], tuple(raster[1][:6])
+            self.path = None
+            self.height, self.width = self.array.shape[-2:]
+            self.block_rows = 1
+            self.version = _hash(self.array.dtype, self.array.shape, np.ascontiguousarray(self.array).tobytes(), self.transform)
+        else:
+            from careatlas.data.raster import _open
+
+            self.path = str(raster)
+            self.array = None
+            handle = _open(self.path)
+            with handle.lock:
+                src = handle.dataset
+                self.transform = tuple(src.transform)[:6]
+                self.height, self.width = src.height, src.width
+                self.block_rows = src.block_shapes[src.indexes.index(band)][0]
+            self.version = dataset_version(self.path)
+        self.key = _hash(self.transform, self.width, self.height)
+
+    def strips(self) -> List[Tuple[int, int]]:
+        """Row ranges of about STRIP_BYTES each, in whole blocks so no block is decoded twice."""
+        rows = max(1, STRIP_BYTES // (8 * max(self.width, 1)))
+        if rows >= self.block_rows:
+            rows -= rows % self.block_rows
+        return [(r, min(r + rows, self.height)) for r in range(0, self.height, rows)]
+
+    def read(self, row0: int, row1: int) -> np.ndarray:
+        """Rows row0..row1 as float64 with NaN for nodata."""
+        if self.array is not None:
+            data = self.array[row0:row1] if self.array.ndim == 2 else self.array[self.band - 1, row0:row1]
+            return np.ma.filled(np.ma.masked_invalid(np.asarray(data, dtype=np.float64)), np.nan)
+        from rasterio.windows import Window
+        from careatlas.data.raster import _open
+
+        handle = _open(self.path)
+        with handle.lock:
+            data = handle.dataset.read(self.band, window=Window(0, row0, self.width, row1 - row0), masked=True)
+        return np.ma.filled(data.astype(np.float64), np.nan)
+
+
+# --- zone side ---
+
+
+def _zone_geometries(zones: Zones) -> Tuple[np.ndarray, str, Optional[pa.Table]]:
+    """Geometries, version key and (for tables/files) the attribute columns."""
+    if isinstance(zones, (str, Path)):
+        table = read_geoparquet(zones)
+        version = dataset_version(zones)
+    elif isinstance(zones, pa.Table):
+        table, version = zones, None
+    else:
+        geoms = np.asarray(zones)
+        return geoms, _hash(*shapely.to_wkb(geoms)), None
+    geometry = _geometry_column(table.schema, geo_metadata(table.schema))
+    geoms = shapely.from_wkb(table.column(geometry).to_numpy(zero_copy_only=False))
+    return geoms, version or _hash(*shapely.to_wkb(geoms)), table.drop_columns([geometry])
+
+
+def _rasterize_strip(geoms: np.ndarray, tree: shapely.STRtree, transform: Affine, row0: int, row1: int, width: int) -> np.ndarray:
+    """Zone index (or -1) of every pixel centre in rows row0..row1."""
+    a, b, c, d, e, f = transform
+    out = np.full((row1 - row0, width), -1, dtype=np.int32)
+    try:
+        from rasterio.features import rasterize
+        from affine import Affine as RioAffine
+    except ImportError:
+        rasterize = None
+
+    # Only zones touching the strip take part
+    corners = [(c + a * col + b * row, f + d * col + e * row) for col in (0, width) for row in (row0, row1)]
+    xs, ys = zip(*corners)
+    candidates = tree.query(shapely.box(min(xs), min(ys), max(xs), max(ys)))
+    if not len(candidates):
+        return out
+    if rasterize is not None:
+        strip_transform = RioAffine(a, b, c + b * row0, d, e, f + e * row0)
+        return rasterize(
+            ((geoms[i], int(i)) for i in np.sort(candidates)[::-1]),
+            out_shape=out.shape,
+            transform=strip_transform,
+            fill=-1,
+            dtype="int32",
+        )
+    # Pure shapely: pixel centres tested against each zone within its own
+    # pixel window, so no Point objects and at most one strip of coordinates
+    det = a * e - b * d
+    bounds = shapely.bounds(geoms[candidates])
+    # Lowest zone index wins on overlaps, like the rasterio path
+    for i, (x0, y0, x1, y1) in sorted(zip(candidates.tolist(), bounds)):
+        # Pixel-space extent of the zone's bbox (inverse affine of its corners)
+        dx, dy = np.array([x0, x1, x0, x1]) - c, np.array([y0, y0, y1, y1]) - f
+        cols = (e * dx - b * dy) / det
+        rows = (a * dy - d * dx) / det
+        c0, c1 = max(int(np.floor(cols.min())), 0), min(int(np.ceil(cols.max())), width)
+        r0, r1 = max(int(np.floor(rows.min())), row0), min(int(np.ceil(rows.max())), row1)
+        if c0 >= c1 or r0 >= r1:
+            continue
+        col, row = np.meshgrid(np.arange(c0, c1) + 0.5, np.arange(r0, r1) + 0.5)
+        geom = geoms[i]
+        shapely.prepare(geom)
+        inside = shapely.contains_xy(geom, c + a * col + b * row, f + d * col + e * row)
+        window = out[r0 - row0:r1 - row0, c0:c1]
+        window[inside & (window < 0)] = i
+    return out
+
+
+def zone_raster(zones: Zones, grid: "_Grid", cache_dir: Path = ZONAL_CACHE_DIR) -> Tuple[Path, int, str, Optional[pa.Table]]:
+    """
+    The zones rasterised onto the raster grid, as an int32 .npy (memory-mapped
+    by readers); built once per (zone version, grid).
+    """
+    geoms, zone_version, attributes = _zone_geometries(zones)
+    target = Path(cache_dir) / "zones" / f"{zone_version}-{grid.key}.npy"
+    if not target.exists():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.stem}.", suffix=".npy")
+        os.close(fd)
+        try:
+            out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.int32, shape=(grid.height, grid.width))
+            tree = shapely.STRtree(geoms)
+            for row0, row1 in grid.strips():
+                out[row0:row1] = _rasterize_strip(geoms, tree, grid.transform, row0, row1, grid.width)
+            out.flush()
+            del out
+            os.replace(tmp, target)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        logger.info(f"Rasterised {len(geoms)} zones onto a {grid.width}x{grid.height} grid")
+    return target, len(geoms), zone_version, attributes
+
+
+# --- statistics ---
+
+
+def _strip_basic(grid: "_Grid", zones_path: str, n: int, row0: int, row1: int) -> np.ndarray:
+    """count, sum, sum of squares, min, max of every zone within one strip; shape (5, n)."""
+    zone = np.load(zones_path, mmap_mode="r")[row0:row1]
+    values = grid.read(row0, row1)
+    valid = (zone >= 0) & ~np.isnan(values)
+    z, v = zone[valid], values[valid]
+    out = np.empty((5, n))
+    out[0] = np.bincount(z, minlength=n)
+    out[1] = np.bincount(z, weights=v, minlength=n)
+    out[2] = np.bincount(z, weights=v * v, minlength=n)
+    out[3] = np.inf
+    out[4] = -np.inf
+    np.minimum.at(out[3], z, v)
+    np.maximum.at(out[4], z, v)
+    return out
+
+
+def _strip_histogram(grid: "_Grid", zones_path: str, n: int, row0: int, row1: int, low: np.ndarray, high: np.ndarray) -> np.ndarray:
+    """Per-zone histograms (n, PERCENTILE_BINS) between each zone's min and max."""
+    zone = np.load(zones_path, mmap_mode="r")[row0:row1]
+    values = grid.read(row0, row1)
+    valid = (zone >= 0) & ~np.isnan(values)
+    z, v = zone[valid], values[valid]
+    span = np.where(high > low, high - low, 1.0)[z]
+    bins = np.clip(((v - low[z]) / span * PERCENTILE_BINS).astype(np.int64), 0, PERCENTILE_BINS - 1)
+    return np.bincount(z.astype(np.int64) * PERCENTILE_BINS + bins, minlength=n * PERCENTILE_BINS).reshape(n, PERCENTILE_BINS)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ProcessPoolExecutor:
+    """
+    One pool per process, started on first use: spawning workers costs
+    seconds, and kept workers also keep their open rasters and GDAL cache.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or getattr(_pool, "_broken", False):
+            # spawn: kernels are threaded, forking them is unsafe
+            _pool = ProcessPoolExecutor(max_workers=ZONAL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _merge_basic(acc: np.ndarray, part: np.ndarray) -> np.ndarray:
+    acc[:3] += part[:3]
+    np.minimum(acc[3], part[3], out=acc[3])
+    np.maximum(acc[4], part[4], out=acc[4])
+    return acc
+
+
+def _merge_histogram(acc: np.ndarray, part: np.ndarray) -> np.ndarray:
+    return np.add(acc, part, out=acc)
+
+
+def _fold(grid: "_Grid", fn, merge, zones_path: str, n: int, *extra, workers: int = ZONAL_WORKERS) -> np.ndarray:
+    """
+    `fn` over every strip, merged into one result as strips finish. Raster
+    files go to worker processes with at most two strips per worker in
+    flight, so memory is bounded by that many per-strip results, not by
+    the number of strips (in-memory grids stay in process).
+    """
+    strips = grid.strips()
+    acc = None
+    if grid.path is None or workers <= 1 or len(strips) == 1:
+        for row0, row1 in strips:
+            part = fn(grid, zones_path, n, row0, row1, *extra)
+            acc = part if acc is None else merge(acc, part)
+        return acc
+
+    pool = _executor()
+    pending = set()
+    try:
+        for row0, row1 in strips:
+            while len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    acc = f.result() if acc is None else merge(acc, f.result())
+            pending.add(pool.submit(fn, grid, zones_path, n, row0, row1, *extra))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                acc = f.result() if acc is None else merge(acc, f.result())
+    finally:
+        for f in pending:
+            f.cancel()
+    return acc
+
+
+def _percentiles(hist: np.ndarray, low: np.ndarray, high: np.ndarray, q: float) -> np.ndarray:
+    count = hist.sum(axis=1)
+    cum = np.cumsum(hist, axis=1)
+    target = q / 100.0 * count
+    idx = np.minimum((cum < target[:, None]).sum(axis=1), PERCENTILE_BINS - 1)
+    rows = np.arange(len(hist))
+    before = np.where(idx > 0, cum[rows, np.maximum(idx - 1, 0)], 0)
+    in_bin = hist[rows, idx]
+    frac = np.where(in_bin > 0, (target - before) / np.where(in_bin > 0, in_bin, 1), 0.0)
+    width = (high - low) / PERCENTILE_BINS
+    out = low + (idx + np.clip(frac, 0, 1)) * width
+    return np.where(count > 0, out, np.nan)
+
+
+def _compute(grid: "_Grid", zones_path: Path, n: int, basic: List[str], percentiles: List[float]) -> Dict[str, np.ndarray]:
+    count, total, squares, low, high = _fold(grid, _strip_basic, _merge_basic, str(zones_path), n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        results = {
+            "count": count.astype(np.int64),
+            "sum": total,
+            "mean": mean,
+            "min": np.where(count > 0, low, np.nan),
+            "max": np.where(count > 0, high, np.nan),
+            "std": np.sqrt(np.maximum(squares / count - mean * mean, 0)),
+        }
+    results = {k: results[k] for k in basic}
+    if percentiles:
+        finite_low, finite_high = np.where(count > 0, low, 0.0), np.where(count > 0, high, 0.0)
+        hist = _fold(grid, _strip_histogram, _merge_histogram, str(zones_path), n, finite_low, finite_high)
+        for q in percentiles:
+            results[f"p{q:g}"] = _percentiles(hist, finite_low, finite_high, q)
+    return results
+
+
+def zonal_stats(
+    raster: Raster,
+    zones: Zones,
+    stats: Sequence[str] = ("count", "mean"),
+    band: int = 1,
+    cache_dir: Path = ZONAL_CACHE_DIR,
+) -> pa.Table:
+    """
+    One row per zone (in zone order, with the zones' attribute columns when
+    they come as a table or file) and one column per statistic: count, sum,
+    mean, min, max, std or pNN (e.g. p50, p90).
+    """
+    basic, percentiles = _parse_stats(stats)
+    grid = _Grid(raster, band)
+    zones_path, n, zone_version, attributes = zone_raster(zones, grid, cache_dir)
+
+    results_dir = Path(cache_dir) / "stats" / f"{grid.version}-b{band}" / zone_version
+    names = basic + [f"p{q:g}" for q in percentiles]
+    cached = {name: results_dir / f"{name}.npy" for name in names}
+    missing = [name for name, path in cached.items() if not path.exists()]
+    if missing:
+        computed = _compute(
+            grid, zones_path, n,
+            [s for s in basic if s in missing],
+            [q for q in percentiles if f"p{q:g}" in missing],
+        )
+        results_dir.mkdir(parents=True, exist_ok=True)
+        for name, values in computed.items():
+            fd, tmp = tempfile.mkstemp(dir=results_dir, prefix=f".{name}.", suffix=".npy")
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, values)
+            os.replace(tmp, cached[name])
+        (results_dir / "source.json").write_text(json.dumps({"raster": grid.path, "band": band, "zones": n}))
+
+    columns = {name: np.load(cached[name]) for name in names}
+    table = attributes if attributes is not None else pa.table({"zone": np.arange(n)})
+    for name, values in columns.items():
+        table = table.append_column(name, pa.array(values))
+    return table
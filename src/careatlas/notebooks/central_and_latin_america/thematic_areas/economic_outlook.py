@@ -1,3 +1,7 @@
+# /// script
+# [tool.careatlas]
+# wasm = true
+# ///
 import marimo
 
 __generated_with = "0.19.9"